@@ -0,0 +1,69 @@
+"""
+Compare the per target overhead of starting bash for every command against running all of a target's commands in a
+single bash, on a generated config with lots of small ln(...) targets.
+
+    python -m benchmarks.execute_benchmark --targets 300
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import List
+
+from booty.ast_util import index_config
+from booty.execute import BootyData, CommandExecutor
+from booty.graph import DependencyGraph
+from booty.parser import parse
+from booty.stdlib import get_stdlib_recipe_index
+
+
+def generate_config(n_targets: int, root: str) -> str:
+    """
+    Generate a config where each target mixes recipe invocations and shell lines, so each one has several commands
+    after compacting: [ln, shell, ln].
+    """
+    lines: List[str] = []
+    for i in range(n_targets):
+        lines.append(f"target_{i}:")
+        lines.append("    setup:")
+        lines.append(f"        ln({root}/src/{i}, {root}/dst/{i}/a)")
+        lines.append(f"        echo linked {i}")
+        lines.append(f"        ln({root}/src/{i}, {root}/dst/{i}/b)")
+        lines.append(f"    is_setup: test -L {root}/dst/{i}/a")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def run(data: BootyData, single_shell: bool) -> float:
+    start = time.perf_counter()
+    for target in data.execution_index.keys():
+        cmd = CommandExecutor(data, target, "setup", single_shell=single_shell)
+        for _ in cmd.execute():
+            pass
+        if cmd.code != 0:
+            raise RuntimeError(f"{target} failed: {cmd.all_stderr()}")
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, "src"))
+        index = index_config(parse(generate_config(args.targets, root)))
+        recipes = {**get_stdlib_recipe_index(), **index.recipes}
+        G = DependencyGraph.from_index(index.dependencies)
+        data = BootyData(execution_index=index.executables, dependency_index=index.dependencies, recipe_index=recipes, G=G)
+
+        print(f"{args.targets} targets, 3 commands each")
+        for name, single_shell in [("bash per command", False), ("single shell", True)]:
+            elapsed = run(data, single_shell)
+            print(f"{name:<20} {elapsed:>8.3f}s  {elapsed / args.targets * 1000:>7.2f}ms per target")
+
+
+if __name__ == "__main__":
+    main()
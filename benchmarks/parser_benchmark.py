@@ -0,0 +1,73 @@
+"""
+Compare the Earley parser that booty used to use against the LALR parser on a generated config.
+
+    python -m benchmarks.parser_benchmark --targets 10000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, List, TypeVar
+
+from lark import Lark
+
+from booty.lang import get_grammar
+from booty.parser import create_parser
+
+T = TypeVar("T")
+
+
+def generate_config(n_targets: int) -> str:
+    """
+    Generate a config with a mix of the target styles that show up in real configs: recipe invocations, single line
+    defs, multi line defs, and dependencies in both directions.
+    """
+    lines: List[str] = []
+    for i in range(n_targets):
+        if i % 3 == 0:
+            lines.append(f"target_{i}: ln(~/files/conf/{i}, ~/.config/{i})")
+        elif i % 3 == 1:
+            lines.append(f"target_{i} -> target_{i - 1}")
+            lines.append(f"target_{i}:")
+            lines.append(f"    setup: echo {i} > /tmp/booty_{i}")
+            lines.append(f"    is_setup: test -f /tmp/booty_{i}")
+        else:
+            lines.append(f"target_{i - 2} <- target_{i}")
+            lines.append(f"target_{i}:")
+            lines.append("    setup:")
+            lines.append(f"        curl -L https://example.com/{i}.tar.gz -o /tmp/{i}.tar.gz")
+            lines.append(f"        tar -xzf /tmp/{i}.tar.gz -C ~")
+            lines.append(f"    is_setup: test -d ~/{i}")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def timed(name: str, fn: Callable[[], T]) -> T:
+    start = time.perf_counter()
+    result = fn()
+    print(f"{name:<40} {time.perf_counter() - start:>8.3f}s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=int, default=10_000)
+    args = parser.parse_args()
+
+    config = generate_config(args.targets)
+    print(f"Config with {args.targets} targets, {len(config.splitlines())} lines")
+
+    earley = timed("earley: construct", lambda: Lark(get_grammar(), debug=True))
+    timed("earley: parse", lambda: earley.parse(config))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, "grammar.lark.cache")
+        timed("lalr: construct (compile)", lambda: create_parser(cache=cache))
+        lalr = timed("lalr: construct (cached)", lambda: create_parser(cache=cache))
+        timed("lalr: parse", lambda: lalr.parse(config))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,154 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
+import sys
 import time
 import subprocess
-from pprint import pprint
-from typing import Dict, List, Literal
-
-from rich.box import SIMPLE
-from rich.text import Text
-from rich.padding import Padding
-from rich.table import Table
-from rich.console import Group
-from rich.live import Live
-from rich.progress import Progress
-
-from booty.ast_util import get_dependencies, get_executable_index, get_recipe_definition_index
-from booty.execute import BootyData, CommandExecutor, get_commands
+from collections import deque
+from typing import TYPE_CHECKING, Collection, Deque, Dict, Iterable, List, Literal, Mapping, Optional, Set, Tuple
+
+from booty.cache import ConfigCache, get_config_key
+from booty.config import ConfigFile, load_config_files, merge_config_indexes
 from booty.graph import DependencyGraph
-from booty.lang import get_stdlib
-from booty.parser import parse
+from booty.options import DEFAULT_STATUS_JOBS, get_duration_option, get_resources, get_timeout
+from booty.plan import get_target_commands, make_plan
+from booty.resources import ResourcePool
+from booty.status_cache import StatusCache, get_status_key
+from booty.stdlib import get_stdlib_recipe_index
 from booty.target_logger import TargetLogger
-from booty.types import Executable, RecipeInvocation
-from booty.ui import Padder, StdTree, UpdateTracker
+from booty.trace import Tracer
+from booty.types import BootyData
 from booty.validation import validate
 
+if TYPE_CHECKING:
+    from rich.console import Group
+    from rich.live import Live
+
+    from booty.execute import CommandExecutor
+    from booty.history import RunHistory
+    from booty.ui import TargetRow
+
+# rich and lark are imported where they're used instead of up here. They make up most of booty's import time and a lot
+# of runs don't need them, like loading the config from the cache or printing the status when stdout isn't a tty. The
+# same goes for booty.execute, which brings asyncio with it, until there are commands to run, and booty.history, which
+# brings sqlite3.
+
 
 @dataclass
 class StatusResult:
     missing: List[str] = field(default_factory=list)
     errors: List[str] = field(default_factory=list)
     installed: List[str] = field(default_factory=list)
+    cached: List[str] = field(default_factory=list)  # Installed targets whose result came from the StatusCache
+    timeouts: List[str] = field(default_factory=list)
     total_time: float = 0.0
 
 
 class App:
-    def __init__(self, config_path: str, logger: TargetLogger, debug: bool = False) -> None:
+    def __init__(
+        self,
+        config_path: str,
+        logger: TargetLogger,
+        debug: bool = False,
+        use_cache: bool = True,
+        single_shell: bool = False,
+        deadline: Optional[float] = None,
+        tracer: Optional[Tracer] = None,
+        history: Optional["RunHistory"] = None,
+    ) -> None:
+        """
+        The deadline is how many seconds the whole run can take, anything that's still running by then is stopped.
+        The tracer records a timeline of the run, from loading the config to each command that runs. The history
+        records how long each target took, and estimates how long they'll take from the runs before.
+        """
         self.config_path = config_path
+        self.single_shell = single_shell
+        self.tracer = tracer or Tracer(enabled=False)
+        self.history = history
+        self.deadline = time.monotonic() + deadline if deadline is not None else None
+        self.cache = ConfigCache() if use_cache else None
         self.data = self.setup(debug)
         self.logger = logger
 
     def setup(self, debug: bool) -> BootyData:
         """
-        Parse the config file and create all of the indexes that we'll need to execute the booty.
+        Load the compiled config from the cache if none of its files have changed since the last run, otherwise compile
+        it and cache the result.
+        """
+        # Debug mode prints the intermediate results of compiling, so it always compiles.
+        cache = None if debug else self.cache
+        with self.tracer.span("load config files", "setup"):
+            files = load_config_files(self.config_path, cache, tracer=self.tracer)
+
+        if cache is None:
+            return self.compile(files, debug)
+
+        key = get_config_key(*[it.key for it in files])
+        with self.tracer.span("load cached config", "setup"):
+            data = cache.load(key)
+        if data is None:
+            data = self.compile(files, debug)
+            with self.tracer.span("save cached config", "setup"):
+                cache.save(key, data)
+
+        return data
+
+    def compile(self, files: List[ConfigFile], debug: bool) -> BootyData:
+        """
+        Merge the indexes of all of the config files and create everything else that we'll need to execute the booty.
         Also runs validation.
         """
-        with open(self.config_path) as f:
-            config = f.read()
+        from pprint import pprint
 
-        ast = parse(config)
         if debug:
-            print("AST:")
-            print(ast.pretty())
-        stdlib_ast = parse(get_stdlib())
-        executables = get_executable_index(ast)
+            for file in files:
+                print(f"AST ({file.path}):")
+                print(file.ast.pretty() if file.ast is not None else "")
+        with self.tracer.span("merge", "setup"):
+            index = merge_config_indexes([it.index for it in files])
+        executables = index.executables
         if debug:
             print("Executables:")
             pprint(executables)
-        dependencies = get_dependencies(ast, executables)
+        dependencies = index.dependencies
         if debug:
             print("Dependencies:")
             pprint(dependencies)
-        G = DependencyGraph.from_index(dependencies)
-        recipes = get_recipe_definition_index(ast)
+        with self.tracer.span("dependency graph", "setup"):
+            G = DependencyGraph.from_index(dependencies)
+        recipes = index.recipes
         if debug:
             print("Recipes:")
             pprint(recipes)
-        std_recipes = get_recipe_definition_index(stdlib_ast)
+        with self.tracer.span("load stdlib", "setup"):
+            std_recipes = get_stdlib_recipe_index()
         all_recipes = {**std_recipes, **recipes}  # Make the user recipes overwrite the stdlib ones
-        conf = BootyData(execution_index=executables, recipe_index=all_recipes, G=G, ast=ast, dependency_index=dependencies)
-        validate(conf)
+        root_ast = files[-1].ast  # The root config is always merged last
+        conf = BootyData(execution_index=executables, recipe_index=all_recipes, G=G, ast=root_ast, dependency_index=dependencies)
+        with self.tracer.span("validate", "setup"):
+            validate(conf)
+        # Expanding every target's commands up front means that nothing after this has to look at recipes again, and
+        # the expanded commands are cached along with everything else.
+        with self.tracer.span("plan", "setup"):
+            conf.plan = make_plan(executables, all_recipes)
         return conf
 
+    def select(self, targets: Collection[str], with_deps: bool = False, downstream: bool = False) -> None:
+        """
+        Only check and install the given targets, optionally along with everything that they depend on and/or
+        everything that depends on them.
+        """
+        G = self.data.G
+        self.data = replace(self.data, G=G.subgraph(G.select(targets, with_deps=with_deps, downstream=downstream)))
+
     def check_sudo_usage(self) -> None:
         sudo_targets: List[str] = []
 
-        for target, commands in get_commands(self.data, "is_setup").items():
-            for cmd in commands:
-                if "sudo" in cmd:
-                    sudo_targets.append(target)
+        for target in self.data.execution_index:
+            if target not in self.data.G.dependencies:
+                continue
 
-        for target, commands in get_commands(self.data, "setup").items():
-            for cmd in commands:
-                if "sudo" in cmd:
-                    sudo_targets.append(target)
+            commands = [*get_target_commands(self.data, target, "is_setup"), *get_target_commands(self.data, target, "setup")]
+            if any("sudo" in cmd for cmd in commands):
+                sudo_targets.append(target)
 
         if sudo_targets:
             # run sudo -v to make sure the user has sudo access
@@ -92,12 +160,54 @@ Running `sudo -v` to cache sudo credentials. You can disable this behavior with
 """,
                 flush=True,
             )
-            subprocess.run(["sudo", "-v"], check=True)
+            with self.tracer.span("sudo -v", "setup"):
+                subprocess.run(["sudo", "-v"], check=True)
 
-    def status(self) -> StatusResult:
+    def _record_status(self, status_result: StatusResult, target: str, cmd: "CommandExecutor", source: str = "") -> str:
         """
-        List the install status of each target
+        Classify the result of a target's is_setup and return the label to display for it.
+        """
+        if not source:
+            self._record_history(cmd)
+
+        if cmd.code == 0:
+            status_result.installed.append(target)
+            if source == "cached":
+                status_result.cached.append(target)
+            return "🟢 Installed"
+
+        if cmd.timed_out:
+            status_result.timeouts.append(target)
+            return "⏰ Timed out"
+        elif cmd.code == 1:
+            status_result.missing.append(target)
+            return "🟡 Not installed"
+        else:
+            status_result.errors.append(target)
+            return "🔴 Error"
+
+    def status(self, jobs: int = DEFAULT_STATUS_JOBS, refresh: bool = False) -> StatusResult:
+        """
+        List the install status of each target.
+
+        Status checks are read only and don't depend on each other, so up to `jobs` of them run at the same time and
+        each result shows up as soon as its check completes. Targets with a status_ttl that passed their check
+        recently enough aren't checked again unless `refresh` is set.
         """
+        if not sys.stdout.isatty():
+            return self._plain_status(jobs, refresh)
+
+        from rich.box import SIMPLE
+        from rich.console import Group
+        from rich.live import Live
+        from rich.padding import Padding
+        from rich.progress import Progress
+        from rich.table import Table
+        from rich.text import Text
+
+        from booty.execute import CommandPool
+        from booty.ui import Padder, TargetRow, UpdateTracker
+
         dependency_strings: Dict[str, str] = {
             target: ", ".join(deps) if deps else "-" for target, deps in self.data.dependency_index.items()
         }
@@ -106,83 +216,252 @@ Running `sudo -v` to cache sudo credentials. You can disable this behavior with
         table.add_column("Target", no_wrap=True, width=20)
         table.add_column("Dependencies", width=20, no_wrap=True)
         table.add_column("Status", width=20, no_wrap=True)
-        table.add_column("Details", width=70, no_wrap=True)
-        table.add_column("Time", justify="right", width=10)
+        table.add_column("Details", width=62, no_wrap=True)
+        table.add_column("Time", justify="right", width=18)
 
         overall_progress = Progress()
         overall_id = overall_progress.add_task("Status", total=len(self.data.G.dependencies.keys()))
 
         status_result = StatusResult()
-        total_time = 0.0
+        start_time = time.perf_counter()
 
         padder = Padder()
         padding = Padding(table, (0, 0, 0, 0))
         group = Group(padding, overall_progress)
 
-        with Live(auto_refresh=False) as live:
+        status_cache = StatusCache()
+        known = self._known_status(status_cache, refresh)
+        targets = self.data.G.iterator()
+        running: Dict[str, TargetRow] = {}
+        waiting = set(self.data.G.iterator())
+        expected = self._expected("is_setup")
+        tracker = UpdateTracker()
+        with Live(auto_refresh=False) as live, CommandPool(max_workers=jobs, tracer=self.tracer) as pool:
+            while True:
+                while pool.running < jobs:
+                    target = next(targets, None)
+                    if target is None:
+                        break
+
+                    waiting.discard(target)
+                    row = TargetRow(target, "🟡 Checking...", self._display_is_setup(target), expected.get(target))
+                    table.add_row(row.target_text, Text(dependency_strings[target]), row.status_text, row.tree.tree, row.time_text)
+                    if target in known:
+                        cmd, source = known[target]
+                        row.status_text.plain = self._record_status(status_result, target, cmd, source)
+                        row.time_text.plain = source
+                        overall_progress.advance(overall_id)
+                        continue
+
+                    running[target] = row
+                    pool.submit(self._executor(target, "is_setup"))
+
+                if pool.running == 0:
+                    break
+
+                event = pool.next_event(timeout=0.1)
+                for row in running.values():
+                    row.update_time()
+                overall_progress.update(overall_id, description=f"Status{self._eta(expected, running, waiting, jobs)}")
+
+                if event is None:
+                    tracker.update(lambda: self._refresh(live, group), [])
+                    continue
+
+                cmd = event.cmd
+                row = running[cmd.target]
+                if not event.done:
+                    stdout = cmd.latest_stdout()
+                    stderr = cmd.latest_stderr()
+                    row.tree.set_stdout(stdout)
+                    row.tree.set_stderr(stderr)
+                    padding.bottom = padder.get_padding(*[it.tree for it in running.values()])
+                    tracker.update(lambda: self._refresh(live, group), [cmd.target, stdout, stderr])
+                    continue
+
+                del running[cmd.target]
+                row.status_text.plain = self._record_status(status_result, cmd.target, cmd)
+                if cmd.code == 0:
+                    row.tree.reset()
+                else:
+                    row.tree.set_stdout(cmd.latest_stdout())
+                    row.tree.set_stderr(cmd.latest_stderr())
+
+                padding.bottom = padder.get_padding(*[it.tree for it in running.values()])
+                overall_progress.advance(overall_id)
+                self._refresh(live, group)
+
+            overall_progress.update(overall_id, completed=True)
+            overall_progress.update(overall_id, visible=False)
+        self._save_status_cache(status_cache, status_result)
+        status_result.total_time = time.perf_counter() - start_time
+        self.tracer.add("status", "app", start_time, time.perf_counter())
+        return status_result
+
+    def _remaining(self) -> Optional[float]:
+        """
+        How long is left until the deadline, if there is one.
+        """
+        return max(self.deadline - time.monotonic(), 0.0) if self.deadline is not None else None
+
+    def _timeout(self, targets: Iterable[str], method: Literal["setup", "is_setup"]) -> Optional[float]:
+        """
+        How long the method can run for when it's run for all of the targets at once, which is the smallest of their
+        timeouts and what's left until the deadline.
+        """
+        timeouts = [it for it in [*(get_timeout(self.data, target, method) for target in targets), self._remaining()] if it is not None]
+        return min(timeouts) if timeouts else None
+
+    def _executor(self, target: str, method: Literal["setup", "is_setup"]) -> "CommandExecutor":
+        from booty.execute import CommandExecutor
+
+        return CommandExecutor(
+            self.data, target, method, single_shell=self.single_shell, timeout=self._timeout([target], method), logger=self.logger
+        )
+
+    def _status_key(self, target: str) -> str:
+        return get_status_key(get_target_commands(self.data, target, "is_setup"))
+
+    def _known_status(self, status_cache: StatusCache, refresh: bool) -> Dict[str, Tuple["CommandExecutor", str]]:
+        """
+        The results that are known without running each target's is_setup, along with where they came from: either
+        "cached" for targets that passed recently enough according to their status_ttl, or "batch".
+        """
+        from booty.execute import CommandExecutor
+
+        known: Dict[str, Tuple[CommandExecutor, str]] = {}
+        if not refresh:
             for target in self.data.G.iterator():
-                deps_string = dependency_strings[target]
+                ttl = get_duration_option(self.data, target, "status_ttl")
+                if ttl is not None and status_cache.is_fresh(self._status_key(target), ttl):
+                    known[target] = (CommandExecutor(self.data, target, "is_setup", code=0), "cached")
 
-                target_text = Text(target)
-                dependency_text = Text(deps_string)
-                status_text = Text("🟡 Checking...")
+        for target, cmd in self._batch_status(exclude=known.keys()).items():
+            known[target] = (cmd, "batch")
+
+        return known
 
-                tree = StdTree(self._display_is_setup(self.data.execution_index[target]))
+    def _save_status_cache(self, status_cache: StatusCache, status_result: StatusResult) -> None:
+        """
+        Remember the targets with a status_ttl that just passed their check, and forget the ones that aren't in the
+        config anymore. That's every target in it, not only the selected ones.
+        """
+        cached = set(status_result.cached)
+        for target in status_result.installed:
+            if target not in cached and get_duration_option(self.data, target, "status_ttl") is not None:
+                status_cache.record(self._status_key(target))
 
-                time_text = Text("")  # Make update in real time
+        status_cache.retain(
+            {self._status_key(it) for it in self.data.execution_index if get_duration_option(self.data, it, "status_ttl") is not None}
+        )
+        status_cache.save()
 
-                table.add_row(target_text, dependency_text, status_text, tree.tree, time_text)
+    def _batch_status(self, exclude: Collection[str] = ()) -> Dict[str, "CommandExecutor"]:
+        """
+        Check the status of every target that invokes a recipe with an is_setup_batch method, one batch per recipe,
+        instead of running the recipe's is_setup once per target. The result has a finished CommandExecutor for each
+        target that a batch answered. Targets in batches that failed aren't included, they're checked on their own.
+        """
+        from booty.execute import CommandExecutor, execute_batches, get_batch_invocations
 
-                start_time = time.perf_counter()
-                cmd = CommandExecutor(self.data, target, "is_setup")
-                for _ in cmd.execute():
-                    time_text.plain = f"{time.perf_counter() - start_time:.2f}s"
-                    tree.set_stdout(cmd.latest_stdout())
-                    tree.set_stderr(cmd.latest_stderr())
-                    padding.bottom = padder.get_padding(tree)
-                    live.update(group, refresh=True)
+        targets = [it for it in self.data.G.iterator() if it not in exclude]
+        batches = get_batch_invocations(self.data, targets, "is_setup_batch")
+        if not batches:
+            return {}
 
-                target_time = time.perf_counter() - start_time
-                total_time += target_time
-                time_text.plain = f"{target_time:.2f}s"
+        results: Dict[str, CommandExecutor] = {}
+        with self.tracer.span("batch status", "is_setup", recipes=sorted(batches.keys())):
+            timeouts = {recipe: self._timeout(invocations.keys(), "is_setup") for recipe, invocations in batches.items()}
+            batch_results = execute_batches(self.data, batches, "is_setup_batch", timeouts)
+        for batch in batch_results:
+            # Logged like a batched setup, under the name of the batch instead of any one target.
+            self.logger.log(f"{batch.recipe}_batch", "is_setup", batch.stdout, batch.stderr, batch.code)
+            if batch.codes is None:
+                continue
 
-                if cmd.code == 0:
-                    status_result.installed.append(target)
-                    status_text.plain = "🟢 Installed"
-                    tree.reset()
-                else:
-                    tree.set_stdout(cmd.latest_stdout())
-                    tree.set_stderr(cmd.latest_stderr())
+            for target, code in zip(batch.targets, batch.codes):
+                results[target] = CommandExecutor(self.data, target, "is_setup", code=code)
 
-                    if cmd.code == 1:
-                        status_result.missing.append(target)
-                        status_text.plain = "🟡 Not installed"
-                        self.logger.log_is_setup(target, cmd.all_stdout(), cmd.all_stderr())
-                    else:
-                        status_result.errors.append(target)
-                        status_text.plain = "🔴 Error"
-                        self.logger.log_is_setup(target, cmd.all_stdout(), cmd.all_stderr())
+        return results
 
-                overall_progress.advance(overall_id)
-                live.update(group, refresh=True)
+    def _plain_status(self, jobs: int, refresh: bool) -> StatusResult:
+        """
+        Print the status of each target as a line of plain text as soon as its check completes. This is used when
+        stdout isn't a terminal, like when booty --status runs from cron, where the live table can't be displayed anyway.
+        """
+        from booty.execute import CommandPool
 
-            overall_progress.update(overall_id, completed=True)
-            overall_progress.update(overall_id, visible=False)
-        status_result.total_time = total_time
+        status_result = StatusResult()
+        start_time = time.perf_counter()
+        start_times: Dict[str, float] = {}
+        status_cache = StatusCache()
+        known = self._known_status(status_cache, refresh)
+        targets = self.data.G.iterator()
+        with CommandPool(max_workers=jobs, tracer=self.tracer) as pool:
+            while True:
+                while pool.running < jobs:
+                    target = next(targets, None)
+                    if target is None:
+                        break
+
+                    if target in known:
+                        cmd, source = known[target]
+                        print(f"{target}: {self._record_status(status_result, target, cmd, source)} ({source})", flush=True)
+                        continue
+
+                    start_times[target] = time.perf_counter()
+                    pool.submit(self._executor(target, "is_setup"))
+
+                if pool.running == 0:
+                    break
+
+                event = pool.next_event()
+                if event is None or not event.done:
+                    continue
+
+                target = event.cmd.target
+                target_time = time.perf_counter() - start_times[target]
+                print(f"{target}: {self._record_status(status_result, target, event.cmd)} ({target_time:.2f}s)", flush=True)
+
+        self._save_status_cache(status_cache, status_result)
+        status_result.total_time = time.perf_counter() - start_time
+        self.tracer.add("status", "app", start_time, time.perf_counter())
         return status_result
 
-    def install_missing(self, status_result: StatusResult) -> StatusResult:
+    def install_missing(
+        self, status_result: StatusResult, jobs: int = 1, coalesce: bool = False, capacities: Optional[Mapping[str, int]] = None
+    ) -> StatusResult:
         """
         Install all missing targets and attempt to install the ones that failed status check.
+
+        Up to `jobs` targets are installed at the same time. A target starts as soon as all of its dependencies have
+        been set up, and targets that depend on a target that failed are skipped. The run history's median
+        setup times are used to start the targets on the critical path first.
+
+        With `coalesce`, ready targets that invoke the same recipe are set up together with the recipe's setup_batch
+        method, if it has one. If the batch fails then each of its targets is set up on its own instead.
+
+        Targets also wait for the resources that they need, like the dpkg lock, to be free. `capacities` overrides how
+        many targets can hold each resource at the same time.
         """
+        from rich.box import SIMPLE
+        from rich.console import Group
+        from rich.live import Live
+        from rich.padding import Padding
+        from rich.progress import Progress
+        from rich.table import Table
+        from rich.text import Text
+
+        from booty.execute import BatchCommandExecutor, CommandExecutor, CommandPool, get_batch_invocations
+        from booty.ui import Padder, TargetRow, UpdateTracker
 
         table = Table(title="Setup Status", show_header=True, show_edge=False, title_style="bold", box=SIMPLE)
         table.add_column("Target", no_wrap=True, width=20)
         table.add_column("Status", width=20, no_wrap=True)
-        table.add_column("Details", width=93, no_wrap=True)
-        table.add_column("Time", justify="right", width=10, no_wrap=True)
+        table.add_column("Details", width=85, no_wrap=True)
+        table.add_column("Time", justify="right", width=18, no_wrap=True)
 
-        missing_packages = set([*status_result.missing, *status_result.errors])
+        missing_packages = set([*status_result.missing, *status_result.errors, *status_result.timeouts])
         overall_progress = Progress()
         overall_id = overall_progress.add_task("Status", total=len(missing_packages))
 
@@ -190,63 +469,160 @@ Running `sudo -v` to cache sudo credentials. You can disable this behavior with
         padding = Padding(table, (0, 0, 0, 0))
         group = Group(padding, overall_progress)
 
-        total_time = 0.0
+        start_time = time.perf_counter()
         status_result = StatusResult()
-        gen = self.data.G.bfs()
+        expected = self._expected("setup")
+        scheduler = self.data.G.scheduler(expected)
+        running: Dict[int, TargetRow] = {}  # By the id of the CommandExecutor
+        started: Dict[str, TargetRow] = {}  # By target, the targets of a batch share a row
         tracker = UpdateTracker()
-        with Live(auto_refresh=False) as live:
-            try:
-                next(gen)  # Skip the first fake target
-                target = gen.send(True)
-
-                while True:
-                    if target not in missing_packages:
-                        target = gen.send(True)
-                        continue
-
-                    target_text = Text(target)
-                    status_text = Text("🟡 Installing...")
-
-                    tree = StdTree(self._display_setup(self.data.execution_index[target]))
-                    time_text = Text("")  # Make update in real time
-                    table.add_row(target_text, status_text, tree.tree, time_text)
-                    target_text.plain = target
-                    start_time = time.perf_counter()
-
-                    cmd = CommandExecutor(self.data, target, "setup")
-                    for _ in cmd.execute():
-                        time_fmt = f"{time.perf_counter() - start_time:.2f}s"
-                        stdout = cmd.latest_stdout()
-                        stderr = cmd.latest_stderr()
-                        time_text.plain = time_fmt
-
-                        tree.set_stdout(stdout)
-                        tree.set_stderr(stderr)
-                        padding.bottom = padder.get_padding(tree)
-
-                        tracker.update(lambda: live.update(group, refresh=True), [target, stdout, stderr])
-
-                    cmd_time = time.perf_counter() - start_time
-                    time_text.plain = f"{cmd_time:.2f}s"
-                    total_time += cmd_time
 
+        pending: Deque[str] = deque()  # Ready targets that haven't started yet
+        batch_invocations = get_batch_invocations(self.data, sorted(missing_packages), "setup_batch") if coalesce else {}
+        batch_recipes = {target: recipe for recipe, invocations in batch_invocations.items() for target in invocations.keys()}
+        separately: Set[str] = set()  # Targets whose batch failed
+
+        resources = ResourcePool(capacities)
+        target_resources = {target: get_resources(self.data, target) for target in missing_packages}
+        holding: Dict[int, List[str]] = {}  # The resources that each running CommandExecutor holds
+
+        def take_ready() -> bool:
+            # Everything that's ready has to be pending for it to be coalesced, otherwise one at a time keeps the
+            # scheduler's order.
+            took = False
+            target = scheduler.next_ready()
+            while target is not None:
+                if target not in missing_packages:
+                    scheduler.complete(target, True)
+                else:
+                    pending.append(target)
+                    took = True
+                    if not coalesce:
+                        return took
+                target = scheduler.next_ready()
+            return took
+
+        def next_target() -> Optional[str]:
+            # The first pending target whose resources are free, which it holds from now on. Blocked targets stay
+            # pending while others that are ready get a chance to start.
+            if coalesce:
+                take_ready()
+            while True:
+                for target in pending:
+                    if resources.acquire(target_resources[target]):
+                        pending.remove(target)
+                        return target
+                if not take_ready():
+                    return None
+
+        with Live(auto_refresh=False) as live, CommandPool(max_workers=jobs, tracer=self.tracer) as pool:
+            while True:
+                while pool.running < jobs:
+                    target = next_target()
+                    if target is None:
+                        break
+
+                    recipe = batch_recipes.get(target) if target not in separately else None
+                    batch = [target]
+                    if recipe is not None:
+                        # Only targets that need the same resources can join, since those are already held.
+                        batch += [
+                            it
+                            for it in pending
+                            if it not in separately and batch_recipes.get(it) == recipe and target_resources[it] == target_resources[target]
+                        ]
+
+                    if recipe is not None and len(batch) > 1:
+                        for it in batch[1:]:
+                            pending.remove(it)
+                        invocations = {it: batch_invocations[recipe][it] for it in batch}
+                        cmd: CommandExecutor = BatchCommandExecutor(
+                            self.data,
+                            f"{recipe}_batch",
+                            "setup",
+                            timeout=self._timeout(batch, "setup"),
+                            logger=self.logger,
+                            recipe=recipe,
+                            invocations=invocations,
+                        )
+                        row = TargetRow(", ".join(batch), "🟡 Installing...", f"{recipe}_batch({len(batch)} targets)")
+                    else:
+                        cmd = self._executor(target, "setup")
+                        row = TargetRow(target, "🟡 Installing...", self._display_setup(target), expected.get(target))
+
+                    table.add_row(row.target_text, row.status_text, row.tree.tree, row.time_text)
+                    running[id(cmd)] = row
+                    started.update({it: row for it in batch})
+                    holding[id(cmd)] = target_resources[target]
+                    pool.submit(cmd)
+
+                if pool.running == 0:
+                    # Nothing is running and nothing else is ready, so the rest was skipped.
+                    break
+
+                event = pool.next_event(timeout=0.1)
+                for row in running.values():
+                    row.update_time()
+                done = {*status_result.installed, *status_result.errors, *status_result.timeouts}
+                waiting = [it for it in missing_packages if it not in started and it not in done]
+                overall_progress.update(overall_id, description=f"Status{self._eta(expected, started, waiting, jobs)}")
+
+                if event is None:
+                    tracker.update(lambda: self._refresh(live, group), [])
+                    continue
+
+                cmd = event.cmd
+                target = cmd.target
+                row = running[id(cmd)]
+                if not event.done:
+                    stdout = cmd.latest_stdout()
+                    stderr = cmd.latest_stderr()
+                    row.tree.set_stdout(stdout)
+                    row.tree.set_stderr(stderr)
+                    padding.bottom = padder.get_padding(*[it.tree for it in running.values()])
+                    tracker.update(lambda: self._refresh(live, group), [target, stdout, stderr])
+                    continue
+
+                del running[id(cmd)]
+                resources.release(holding.pop(id(cmd)))
+                self._record_history(cmd)
+                for it in cmd.invocations.keys() if isinstance(cmd, BatchCommandExecutor) else [target]:
+                    del started[it]
+
+                if isinstance(cmd, BatchCommandExecutor):
+                    targets = list(cmd.invocations.keys())
                     if cmd.code == 0:
-                        status_result.installed.append(target)
-                        status_text.plain = "🟢 Installed"
-                        tree.reset()
-                        padding.bottom = padder.get_padding(tree)
+                        status_result.installed.extend(targets)
+                        row.status_text.plain = "🟢 Installed"
+                        row.tree.reset()
+                        for it in targets:
+                            scheduler.complete(it, True)
+                            overall_progress.advance(overall_id)
                     else:
-                        status_text.plain = "🔴 Error"
-                        self.logger.log_setup(target, cmd.all_stdout(), cmd.all_stderr())
-                        status_result.errors.append(target)
-
-                    target = gen.send(cmd.code == 0)
+                        # Try again one at a time, so that only the targets that actually fail count as failures.
+                        row.status_text.plain = "🟡 Batch failed"
+                        row.tree.set_stdout(cmd.latest_stdout())
+                        row.tree.set_stderr(cmd.latest_stderr())
+                        separately.update(targets)
+                        pending.extendleft(reversed(targets))
+                elif cmd.code == 0:
+                    status_result.installed.append(target)
+                    row.status_text.plain = "🟢 Installed"
+                    row.tree.reset()
+                    scheduler.complete(target, True)
+                    overall_progress.advance(overall_id)
+                else:
+                    row.status_text.plain = "⏰ Timed out" if cmd.timed_out else "🔴 Error"
+                    row.tree.set_stdout(cmd.latest_stdout())
+                    row.tree.set_stderr(cmd.latest_stderr())
+                    (status_result.timeouts if cmd.timed_out else status_result.errors).append(target)
+                    scheduler.complete(target, False)
                     overall_progress.advance(overall_id)
-                    live.update(group, refresh=True)
 
-            except StopIteration as e:
-                skipped: List[str] = e.value
+                padding.bottom = padder.get_padding(*[it.tree for it in running.values()])
+                self._refresh(live, group)
 
+            skipped = scheduler.skipped()
             for target in skipped:
                 target_text = Text(target)
                 status_text = Text("🟡 Skipped")
@@ -256,6 +632,11 @@ Running `sudo -v` to cache sudo credentials. You can disable this behavior with
 
             overall_progress.update(overall_id, completed=True)
             overall_progress.update(overall_id, visible=False)
+            self._refresh(live, group)
+
+        total_time = time.perf_counter() - start_time
+        status_result.total_time = total_time
+        self.tracer.add("install", "app", start_time, time.perf_counter())
 
         print()
         print()
@@ -264,6 +645,7 @@ Running `sudo -v` to cache sudo credentials. You can disable this behavior with
         print(f"🟢 ({len(status_result.installed)}) targets installed")
         print(f"🟡 ({len(skipped)}) targets skipped because of dependency failures")
         print(f"🔴 ({len(status_result.errors)}) targets failed because of errors")
+        print(f"⏰ ({len(status_result.timeouts)}) targets timed out")
 
         print()
         print(f"🕒 Total time: {total_time:.2f}s")
@@ -271,26 +653,35 @@ Running `sudo -v` to cache sudo credentials. You can disable this behavior with
         print()
         return status_result
 
-    def _display(self, it: Dict[str, List[Executable]], method: Literal["setup", "is_setup"]) -> str:
-        exec = it[method] if method in it else it["recipe"]
+    def _record_history(self, cmd: "CommandExecutor") -> None:
+        from booty.execute import BatchCommandExecutor
 
-        commands: List[str] = []
-        for executable in exec:
-            if isinstance(executable, RecipeInvocation):
-                recipe = self.data.recipe_index[executable.name]
-                if method == "setup":
-                    cmds = [it.replace("\n", "\\n ") for it in recipe.get_setup_commands(executable.args, self.data.recipe_index)]
-                    commands.append("\\n".join(cmds))
-                else:
-                    cmds = [it.replace("\n", "\\n ") for it in recipe.get_is_setup_commands(executable.args, self.data.recipe_index)]
-                    commands.append("\\n ".join(cmds))
-            else:
-                commands.append(executable.command.replace("\n", "\\n"))
+        # A batch's time is for all of its targets together, it doesn't say how long any one of them takes.
+        if self.history is not None and not isinstance(cmd, BatchCommandExecutor):
+            self.history.record(cmd.target, cmd.method, cmd.duration, cmd.code, cmd.stdout.size, cmd.stderr.size)
+
+    def _expected(self, method: Literal["setup", "is_setup"]) -> Dict[str, float]:
+        """
+        How long each target's method usually takes, for the targets that have a history.
+        """
+        return self.history.medians(method) if self.history is not None else {}
+
+    def _eta(self, expected: Mapping[str, float], running: Mapping[str, "TargetRow"], waiting: Collection[str], jobs: int) -> str:
+        from booty.history import estimate_remaining
+
+        remaining = estimate_remaining(expected, {target: row.elapsed() for target, row in running.items()}, waiting, jobs)
+        return f" (about {remaining:.0f}s left)" if remaining is not None else ""
+
+    def _refresh(self, live: "Live", group: "Group") -> None:
+        with self.tracer.span("refresh", "ui"):
+            live.update(group, refresh=True)
 
+    def _display(self, target: str, method: Literal["setup", "is_setup"]) -> str:
+        commands = [it.replace("\n", "\\n ") for it in get_target_commands(self.data, target, method)]
         return "\\n ".join(commands[:3])
 
-    def _display_is_setup(self, it: Dict[str, List[Executable]]) -> str:
-        return self._display(it, method="is_setup")
+    def _display_is_setup(self, target: str) -> str:
+        return self._display(target, method="is_setup")
 
-    def _display_setup(self, it: Dict[str, List[Executable]]) -> str:
-        return self._display(it, method="setup")
+    def _display_setup(self, target: str) -> str:
+        return self._display(target, method="setup")
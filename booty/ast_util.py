@@ -1,11 +1,21 @@
 # pyright: reportUnknownMemberType=false
 # pyright: reportUnknownArgumentType=false
 # pyright: reportUnknownVariableType=false
-from typing import Dict, Iterator, List, Sequence, Union, overload
-from lark import ParseTree, Token, Tree
+from typing import List, Optional, Sequence, Tuple
+from lark import ParseTree, Token, Transformer
 
 
-from booty.types import Executable, RecipeDefinition, RecipeInvocation, ShellCommand, TargetNames, compact_shell_executables
+from booty.types import (
+    ConfigIndex,
+    DependencyIndex,
+    Executable,
+    ExecutableIndex,
+    RecipeDefinition,
+    RecipeDefinitionIndex,
+    RecipeInvocation,
+    ShellCommand,
+    compact_shell_executables,
+)
 
 
 def get_target_names(ast: ParseTree) -> List[str]:
@@ -14,229 +24,146 @@ def get_target_names(ast: ParseTree) -> List[str]:
     return targets
 
 
-DependencyIndex = Dict[TargetNames, List[TargetNames]]
-
-ExecutableIndex = Dict[TargetNames, Dict[str, List[Executable]]]
-
-
-def find_tokens(ast: ParseTree, token_name: str) -> Sequence[Token]:
-    return list(ast.scan_values(lambda it: isinstance(it, Token) and it.type == token_name))
-
-
-def find_token(ast: ParseTree, token_name: str) -> Token:
-    result = find_tokens(ast, token_name)
-    if len(result) == 0:
-        raise Exception(f"Couldn't find token {token_name}")
-
-    if len(result) > 1:
-        raise Exception(f"Exepcted a single {token_name} token, but found {len(result)}: {result}")
-
-    return result[0]
-
-
-def find_token_value(ast: ParseTree, token_name: str) -> str:
-    return find_token(ast, token_name).value
-
+def get_zero_dependency_targets(dependencies: DependencyIndex) -> List[str]:
+    return [k for k, v in dependencies.items() if len(v) == 0]
 
-def find_token_values(ast: ParseTree, token_name: str) -> Sequence[str]:
-    return [it.value for it in find_tokens(ast, token_name)]
 
+# (method name, executables) pairs, like ("setup", [ShellCommand("...")]).
+_Definition = Tuple[str, List[Executable]]
 
-def get_dependencies(ast: ParseTree, executable_index: ExecutableIndex) -> DependencyIndex:
-    depends_on = list(ast.find_pred(lambda x: x.data == "depends_on"))
-    deppended_upon = list(ast.find_pred(lambda x: x.data == "depended_upon"))
-    dependencies: Dict[str, List[str]] = {target: [] for target in executable_index.keys()}
-    for it in depends_on:
-        target_name = str(it.children[0])
-        dependencies[target_name] = dependencies.get(target_name, None) or []
-        for dep in it.children[1:]:
-            dependencies[target_name].append(str(dep))
 
-    for it in deppended_upon:
-        target_name = str(it.children[0])
+class _ConfigIndexer(Transformer[Token, ConfigIndex]):
+    """
+    Builds all of the indexes in a single bottom up pass over the parse tree. Each rule turns its children into the
+    value that the rule above it needs, and the top level statements (targets, recipes, dependencies) are added to the
+    indexes as they're reached, so each node is only visited once.
+    """
 
-        dependencies[target_name] = dependencies.get(target_name, None) or []
-        for dep in it.children[1:]:
-            dependencies[str(dep)] = dependencies.get(str(dep), None) or []
-            dependencies[str(dep)].append(target_name)
+    __visit_tokens__ = False
 
-    return dependencies
+    def __init__(self) -> None:
+        super().__init__()
+        self.executables: ExecutableIndex = {}
+        self.recipes: RecipeDefinitionIndex = {}
+        self.depends_on_statements: List[Tuple[str, List[str]]] = []
+        self.depended_upon_statements: List[Tuple[str, List[str]]] = []
+        self.includes: List[str] = []
 
+    def include(self, children: List[Token]) -> None:
+        self.includes.append(str(children[-1]).strip())
 
-def get_zero_dependency_targets(dependencies: DependencyIndex) -> List[str]:
-    return [k for k, v in dependencies.items() if len(v) == 0]
+    def shell_line(self, children: List[Token]) -> ShellCommand:
+        return ShellCommand(str(children[0]))
 
+    def recipe_parameter(self, children: List[Token]) -> List[str]:
+        return [str(it) for it in children]
 
-@overload
-def str_value(_tree: Tree[Token]) -> str:
-    ...
+    def recipe_parameter_list(self, children: List[List[str]]) -> List[List[str]]:
+        return children
 
+    def recipe_invocation(self, children: List[object]) -> RecipeInvocation:
+        name = str(children[0]).strip()
+        args: Sequence[Sequence[str]] = children[1] if len(children) > 1 else []  # type: ignore
+        return RecipeInvocation(name, args)
 
-@overload
-def str_value(_tree: Iterator[Tree[Token]]) -> str:
-    ...
+    def implements(self, children: List[Token]) -> str:
+        return str(children[0]).strip()
 
+    def def_body(self, children: List[Executable]) -> List[Executable]:
+        return children
 
-def str_value(tree: Union[Tree[Token], Iterator[Tree[Token]]]) -> str:
-    if isinstance(tree, Tree):
-        return tree.children[0].value  # type: ignore[reportUnknownMemberType]
-    else:
-        return next(tree).children[0].value  # type: ignore[reportUnknownMemberType]
+    def single_line_def(self, children: List[object]) -> _Definition:
+        implements, executable = children
+        return (implements, [executable])  # type: ignore
 
+    def multi_line_def(self, children: List[object]) -> _Definition:
+        implements, executables = children
+        return (implements, executables)  # type: ignore
 
-def get_executable_index(ast: ParseTree) -> ExecutableIndex:
-    """
-    Get a dictionary of target names to a dictionary of recipe methods to executables.
-    For example:
-
-    {
-        "pyenv": {
-            "setup": [ShellCommand("apt install ..."), RecipeInvocation("curl", ["https://pyenv.run", "|", "bash"])],
-            "is_setup": [ShellCommand("which pyenv")]
-        },
-        "pipx": {
-            "recipe": [RecipeInvocation("apt", ["install", "pipx"])]
-        }
-    }
-
-    The pipx target is just a recipe invocation. The parser enforces that it will only have a single RecipeInvocation in that case.
-    """
+    def defs(self, children: List[_Definition]) -> List[_Definition]:
+        return children
 
-    executables: Dict[str, Dict[str, List[Executable]]] = {}
-    targets = list(ast.find_pred(lambda x: x.data == "target"))
-    for target in targets:
-        target_name = str_value(target.find_data("target_name"))
-        executables[target_name] = executables.get(target_name, None) or {}
+    def target_name(self, children: List[Token]) -> str:
+        return str(children[0])
 
-        # targets can have either def or recipe invocation as direct children
-        for definition in target.find_data("def"):
-            for single_or_multi_def in definition.find_pred(lambda node: node.data == "single_line_def" or node.data == "multi_line_def"):
-                implements = find_token_value(single_or_multi_def, "IMPLEMENTS_NAME").strip()
+    def target(self, children: List[object]) -> None:
+        target_name: str = children[0]  # type: ignore
+        definitions = self.executables.setdefault(target_name, {})
 
-                executables[target_name][implements] = executables[target_name].get(implements, None) or []
+        body = children[1]
+        if isinstance(body, RecipeInvocation):
+            # Targets that just call a recipe, they don't define their logic inline. If the target was already defined
+            # then the first definition wins.
+            if len(definitions) == 0:
+                definitions["recipe"] = [body]
+        else:
+            for implements, executables in body:  # type: ignore
+                definitions.setdefault(implements, []).extend(executables)
 
-                if single_or_multi_def.data == "multi_line_def":
-                    for multiline_shell_or_recipe in single_or_multi_def.find_pred(
-                        lambda node: node.data == "recipe_invocation" or node.data == "shell_line"
-                    ):
-                        if multiline_shell_or_recipe.data == "shell_line":
-                            cmd = "\n".join([it for it in find_token_values(multiline_shell_or_recipe, "SHELL_LINE")])
-                            shell_command = ShellCommand(cmd)
-                            executables[target_name][implements].append(shell_command)
-                        else:
-                            recipe_name = find_token_value(multiline_shell_or_recipe, "NAME")
+    def arguments(self, children: List[Token]) -> List[str]:
+        return [str(it) for it in children]
 
-                            args: Sequence[Sequence[str]] = []
-                            for parameter in list(multiline_shell_or_recipe.find_data("recipe_parameter_list")):
-                                args.append(find_token_values(parameter, "INVOCATION_ARGS"))
+    def recipe(self, children: List[object]) -> None:
+        recipe_name = str(children[0])
+        arguments: Optional[List[str]] = children[1]  # type: ignore
+        definitions: List[_Definition] = children[2]  # type: ignore
 
-                            recipe_invocation = RecipeInvocation(recipe_name, args)
-                            executables[target_name][implements].append(recipe_invocation)
+        recipe_definition = self.recipes.setdefault(recipe_name, RecipeDefinition(recipe_name))
+        recipe_definition.parameters = arguments or []
+        for implements, executables in definitions:
+            recipe_definition.defs.setdefault(implements, []).extend(executables)
 
-                else:  # single line def
-                    for shell_or_recipe in single_or_multi_def.find_pred(
-                        lambda node: node.data == "recipe_invocation" or node.data == "shell_line"
-                    ):
-                        if isinstance(shell_or_recipe, Token):
-                            raise Exception("This should be impossible")
+    def depends_on(self, children: List[Token]) -> None:
+        self.depends_on_statements.append((str(children[0]), [str(it) for it in children[1:]]))
 
-                        recipe_parameters = list(shell_or_recipe.find_data("recipe_parameter_list"))
-                        shell_lines = find_token_values(shell_or_recipe, "SHELL_LINE")
+    def depended_upon(self, children: List[Token]) -> None:
+        self.depended_upon_statements.append((str(children[0]), [str(it) for it in children[1:]]))
 
-                        if len(recipe_parameters) > 0 and len(shell_lines) > 0:
-                            raise Exception(
-                                f"This should be impossible, they're mutually exclusive in the grammar: {recipe_parameters}\n{shell_lines}"
-                            )
+    def start(self, _children: List[object]) -> ConfigIndex:
+        return ConfigIndex(
+            executables=self._compact_executables(),
+            dependencies=self._dependencies(),
+            recipes=self._compact_recipes(),
+            includes=self.includes,
+        )
 
-                        if len(shell_lines) > 0:
-                            cmd = "\n".join([it for it in shell_lines])
-                            shell_command = ShellCommand(cmd)
-                            executables[target_name][implements].append(shell_command)
-                        else:
-                            recipe_name = find_token_value(single_or_multi_def, "NAME")
+    def _dependencies(self) -> DependencyIndex:
+        dependencies: DependencyIndex = {target: [] for target in self.executables.keys()}
+        for target_name, deps in self.depends_on_statements:
+            dependencies.setdefault(target_name, []).extend(deps)
 
-                            args: Sequence[Sequence[str]] = []
-                            for parameter in recipe_parameters:
-                                args.append(find_token_values(parameter, "INVOCATION_ARGS"))
+        for target_name, dependents in self.depended_upon_statements:
+            dependencies.setdefault(target_name, [])
+            for dependent in dependents:
+                dependencies.setdefault(dependent, []).append(target_name)
 
-                            recipe_invocation = RecipeInvocation(recipe_name, args)
-                            executables[target_name][implements].append(recipe_invocation)
+        return dependencies
 
-        # targets that just call a recipe, they don't define their logic inline
-        for recipe_invocation in target.find_data("recipe_invocation"):
-            if target_name in executables and len(executables[target_name]) != 0:
-                # What's a nice way of making sure I'm looking only at recipe_invocations that are not part of a def?
-                continue
+    def _compact_executables(self) -> ExecutableIndex:
+        for target_definition in self.executables.values():
+            for def_name, execs in target_definition.items():
+                target_definition[def_name] = compact_shell_executables(execs)
 
-            recipe_name = str(recipe_invocation.children[0])
+        return self.executables
 
-            recipe_parameter = recipe_invocation.find_data("recipe_parameter")
-            args: Sequence[Sequence[str]] = []
-            for parameter in recipe_parameter:
-                args.append(find_token_values(parameter, "INVOCATION_ARGS"))
+    def _compact_recipes(self) -> RecipeDefinitionIndex:
+        for recipe_definition in self.recipes.values():
+            for def_name, executables in recipe_definition.defs.items():
+                recipe_definition.defs[def_name] = compact_shell_executables(executables)
 
-            recipe_invocation = RecipeInvocation(recipe_name, args)
-            executables[target_name]["recipe"] = executables[target_name].get("recipe", None) or []
-            executables[target_name]["recipe"].append(recipe_invocation)
+        return self.recipes
 
-    # compact the shell commands
-    for target_name, target_definition in executables.items():
-        for def_name, execs in target_definition.items():
-            target_definition[def_name] = compact_shell_executables(execs)
 
-    return executables
+def index_config(ast: ParseTree) -> ConfigIndex:
+    """
+    Build the executable, dependency, and recipe indexes for a parsed config in a single pass over the tree.
+    """
+    return _ConfigIndexer().transform(ast)
 
 
-RecipeDefinitionIndex = Dict[str, RecipeDefinition]
+def get_executable_index(ast: ParseTree) -> ExecutableIndex:
+    return index_config(ast).executables
 
 
 def get_recipe_definition_index(ast: ParseTree) -> RecipeDefinitionIndex:
-    recipe_definitions: Dict[str, RecipeDefinition] = {}
-    recipes = list(ast.find_pred(lambda x: x.data == "recipe"))
-    for recipe in recipes:
-        recipe_name = find_token_value(recipe, "RECIPE_NAME")
-        recipe_definitions[recipe_name] = recipe_definitions.get(recipe_name, None) or RecipeDefinition(recipe_name)
-
-        recipe_arguments = find_token_values(recipe, "ARGUMENT_NAME")
-        recipe_definitions[recipe_name].parameters = recipe_arguments
-        # recipe_definitions[recipe_name].parameters = [str(arg.children[0].value) for arg in list(recipe.find_data("arguments"))]
-
-        for single_or_multi_def in list(recipe.find_pred(lambda it: it.data == "single_line_def" or it.data == "multi_line_def")):
-            implements = find_token_value(single_or_multi_def, "IMPLEMENTS_NAME").strip()
-
-            recipe_definitions[recipe_name].defs[implements] = recipe_definitions[recipe_name].defs.get(implements, None) or []
-            for shell_or_recipe in single_or_multi_def.find_pred(
-                lambda node: node.data == "recipe_invocation" or node.data == "shell_line"
-            ):
-                if isinstance(shell_or_recipe, Token):
-                    raise Exception("This should be impossible")
-
-                recipe_parameters = list(shell_or_recipe.find_data("recipe_parameter_list"))
-                shell_lines = find_token_values(shell_or_recipe, "SHELL_LINE")
-
-                if len(recipe_parameters) > 0 and len(shell_lines) > 0:
-                    raise Exception(
-                        f"This should be impossible, they're mutually exclusive in the grammar: {recipe_parameters}\n{shell_lines}"
-                    )
-
-                if len(shell_lines) > 0:
-                    cmd = "\n".join([it for it in shell_lines])
-                    shell_command = ShellCommand(cmd)
-                    recipe_definitions[recipe_name].defs[implements].append(shell_command)
-                else:
-                    # Not the name of the current recipe, but the name of the recipe being called.
-                    recipe_call_name = find_token_value(single_or_multi_def, "NAME")
-
-                    args: Sequence[Sequence[str]] = []
-                    for parameter in recipe_parameters:
-                        args.append(find_token_values(parameter, "INVOCATION_ARGS"))
-
-                    recipe_invocation = RecipeInvocation(recipe_call_name, args)
-                    recipe_definitions[recipe_name].defs[implements].append(recipe_invocation)
-
-    # compact the shell commands
-    for recipe_name, recipe_definition in recipe_definitions.items():
-        for def_name, executables in recipe_definition.defs.items():
-            recipe_definition.defs[def_name] = compact_shell_executables(executables)
-
-    return recipe_definitions
+    return index_config(ast).recipes
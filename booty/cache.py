@@ -0,0 +1,136 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from dataclasses import replace
+from typing import Any, BinaryIO, Callable, Optional, Type, TypeVar
+
+from booty import __version__
+from booty.lang import get_stdlib
+from booty.types import BootyData, ConfigIndex
+
+T = TypeVar("T")
+
+# Bumped whenever the shape of the cached BootyData changes, so that data cached by an older checkout of the same version
+# isn't loaded with fields missing.
+CACHE_FORMAT = "2"
+
+
+def get_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "booty")
+
+
+def load_cached(path: str, load: Callable[[BinaryIO], Any]) -> Any:
+    """
+    Load a cache file with the given function, like pickle.load or json.load. Missing, corrupt, and incompatible files
+    are all treated as a miss and give None.
+    """
+    try:
+        with open(path, "rb") as f:
+            return load(f)
+    except Exception:
+        return None
+
+
+def save_atomically(path: str, content: bytes) -> None:
+    """
+    Write a cache file through a temp file so that a concurrent booty never sees a partially written one. Caches are
+    only an optimization, so failing to write one doesn't fail the run.
+    """
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+
+
+def get_file_key(content: str) -> str:
+    """
+    The key that a single compiled config file is stored under. The compiled file only depends on its own content and
+    the booty version that compiled it. Includes are stored as they were written and resolved after loading, so the
+    path of the file doesn't matter.
+    """
+    return hashlib.sha256(f"{__version__}\0{content}".encode()).hexdigest()
+
+
+def get_config_key(*configs: str) -> str:
+    """
+    The key that a compiled config is stored under. Everything that goes into the compiled BootyData is part of the key:
+    the config files (or their keys), the stdlib that they get merged with, and the booty version that did the
+    compiling. Changing any of them is enough to invalidate the cached data.
+    """
+    digest = hashlib.sha256()
+    for part in [__version__, CACHE_FORMAT, get_stdlib(), *configs]:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ConfigCache:
+    """
+    Stores compiled config on disk so that unchanged configs don't have to be parsed, indexed, and validated again on
+    every run. There are two levels:
+
+    - The index of each individual config file, so that changing one included file only recompiles that file.
+    - The validated BootyData for the whole config. The raw AST isn't stored since nothing after setup needs it.
+
+    Every edit of a config makes new entries, so only the `keep` most recently used entries of each level are kept.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, keep: int = 20) -> None:
+        self.cache_dir = cache_dir or get_cache_dir()
+        self.keep = keep
+
+    def _path(self, namespace: str, key: str) -> str:
+        return os.path.join(self.cache_dir, namespace, f"{key}.pickle")
+
+    def _load(self, namespace: str, key: str, cls: Type[T]) -> Optional[T]:
+        path = self._path(namespace, key)
+        value = load_cached(path, pickle.load)
+        if not isinstance(value, cls):
+            return None
+
+        try:
+            # The modification time is when the entry was last used, which is what pruning goes by.
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _save(self, namespace: str, key: str, value: object) -> None:
+        save_atomically(self._path(namespace, key), pickle.dumps(value))
+        self._prune(namespace)
+
+    def _prune(self, namespace: str) -> None:
+        """
+        Delete all but the most recently used entries.
+        """
+        directory = os.path.join(self.cache_dir, namespace)
+        try:
+            entries = [it for it in os.scandir(directory) if it.name.endswith(".pickle")]
+            entries.sort(key=lambda it: it.stat().st_mtime, reverse=True)
+            for entry in entries[self.keep :]:
+                os.unlink(entry.path)
+        except OSError:
+            # Another booty may have pruned the same entries already.
+            pass
+
+    def load(self, key: str) -> Optional[BootyData]:
+        return self._load("config", key, BootyData)
+
+    def save(self, key: str, data: BootyData) -> None:
+        self._save("config", key, replace(data, ast=None))
+
+    def load_file_index(self, key: str) -> Optional[ConfigIndex]:
+        return self._load("files", key, ConfigIndex)
+
+    def save_file_index(self, key: str, index: ConfigIndex) -> None:
+        self._save("files", key, index)
@@ -1,12 +1,35 @@
 import click
 import pathlib
 import sys
+from typing import Dict, Optional, Tuple
 
-from booty.app import App
+from booty.options import DEFAULT_STATUS_JOBS
 from booty.target_logger import TargetLogger
 
 
-@click.command()
+def _parse_deadline(value: Optional[str]) -> Optional[float]:
+    from booty.options import parse_duration
+
+    if value is None:
+        return None
+    try:
+        return parse_duration(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _parse_resources(values: Tuple[str, ...]) -> Dict[str, int]:
+    capacities: Dict[str, int] = {}
+    for value in values:
+        name, _, capacity = value.partition("=")
+        if not name or not capacity.isdigit() or int(capacity) < 1:
+            raise click.BadParameter(f"Expected a resource and how many targets can hold it, like network=4, not '{value}'.")
+        capacities[name] = int(capacity)
+    return capacities
+
+
+@click.group(invoke_without_command=True)
+@click.pass_context
 @click.option(
     "-c",
     "--config",
@@ -19,6 +42,15 @@ from booty.target_logger import TargetLogger
 @click.option("-i", "--install", type=bool, is_flag=True, required=False, help="Install all uninstalled targets")
 @click.option("-d", "--debug", type=bool, is_flag=True, required=False, help="See the AST of the config file")
 @click.option("-l", "--log-dir", type=str, required=False, help="Where to store logs. Defaults to ./logs", default="./logs")
+@click.option(
+    "--no-log-compression", type=bool, is_flag=True, required=False, help="Write the logs as plain text instead of gzip", default=False
+)
+@click.option(
+    "--trace",
+    type=str,
+    required=False,
+    help="Write a timeline of the run to this file, which chrome://tracing and ui.perfetto.dev can open",
+)
 @click.option(
     "--no-sudo",
     type=bool,
@@ -32,13 +64,143 @@ default, booty runs sudo -v upfront if you use sudo in any targets.
     default=False,
 )
 @click.option("-y", "--yes", type=bool, is_flag=True, required=False, help="Don't prompt for confirmation")
-def cli(config: str, yes: bool, log_dir: str, no_sudo: bool, status: bool = True, install: bool = False, debug: bool = False):
+@click.option(
+    "--no-cache",
+    type=bool,
+    is_flag=True,
+    required=False,
+    help="Don't use the compiled config cache. Booty normally caches the compiled config and reuses it until the config changes.",
+    default=False,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    required=False,
+    help="How many targets to install at the same time. Targets still wait for their dependencies. Defaults to 1",
+    default=1,
+)
+@click.option(
+    "--status-jobs",
+    type=click.IntRange(min=1),
+    required=False,
+    help=f"How many target statuses to check at the same time. Defaults to {DEFAULT_STATUS_JOBS}",
+    default=DEFAULT_STATUS_JOBS,
+)
+@click.option(
+    "--refresh",
+    type=bool,
+    is_flag=True,
+    required=False,
+    help="Check the status of every target again, even the ones whose status_ttl hasn't run out since they last passed.",
+    default=False,
+)
+@click.option(
+    "--single-shell",
+    type=bool,
+    is_flag=True,
+    required=False,
+    help="Run all of a target's commands in one bash process instead of starting bash for each of them.",
+    default=False,
+)
+@click.option(
+    "--coalesce",
+    type=bool,
+    is_flag=True,
+    required=False,
+    help="Set up ready targets that invoke the same recipe together when the recipe defines setup_batch, like one apt-get install.",
+    default=False,
+)
+@click.option(
+    "--resource",
+    type=str,
+    multiple=True,
+    required=False,
+    callback=lambda ctx, param, value: _parse_resources(value),
+    help="How many targets can hold a resource at the same time, like network=8. Can be used more than once.",
+)
+@click.option(
+    "--deadline",
+    type=str,
+    required=False,
+    callback=lambda ctx, param, value: _parse_deadline(value),
+    help="Stop anything that's still running after this long, like 30m or 2h. Targets can also set their own timeouts.",
+)
+@click.option(
+    "-o",
+    "--only",
+    type=str,
+    multiple=True,
+    required=False,
+    help="Only check and install this target. Can be used more than once.",
+)
+@click.option("--with-deps", type=bool, is_flag=True, required=False, help="With --only, also include everything the targets depend on")
+@click.option(
+    "--downstream", type=bool, is_flag=True, required=False, help="With --only, also include everything that depends on the targets"
+)
+def cli(
+    ctx: click.Context,
+    config: str,
+    only: Tuple[str, ...],
+    with_deps: bool,
+    downstream: bool,
+    jobs: int,
+    status_jobs: int,
+    refresh: bool,
+    single_shell: bool,
+    coalesce: bool,
+    deadline: Optional[float],
+    resource: Dict[str, int],
+    yes: bool,
+    log_dir: str,
+    no_log_compression: bool,
+    trace: Optional[str],
+    no_sudo: bool,
+    no_cache: bool,
+    status: bool = True,
+    install: bool = False,
+    debug: bool = False,
+):
+    if ctx.invoked_subcommand is not None:
+        # Like `booty compile`, the options here are for checking and installing targets.
+        return
+
     # Make sure config exists
     if not pathlib.Path(config).exists():
         click.echo(f"Config file {config} does not exist. Use -c to specify the location of an install.booty file.")
         sys.exit(1)
 
-    app = App(config, TargetLogger(log_dir), debug=debug)
+    if (with_deps or downstream) and not only:
+        raise click.UsageError("--with-deps and --downstream only apply to targets selected with --only")
+
+    from booty.app import App  # Deferred so that --help and bad arguments don't pay for importing it
+    from booty.history import RunHistory
+    from booty.trace import Tracer
+
+    tracer = Tracer(enabled=trace is not None)
+    if trace is not None:
+        # Written on the way out, also when the run fails or is interrupted.
+        ctx.call_on_close(lambda: tracer.save(trace))
+
+    history = RunHistory()
+    ctx.call_on_close(history.close)
+
+    app = App(
+        config,
+        TargetLogger(log_dir, compress=not no_log_compression),
+        debug=debug,
+        use_cache=not no_cache,
+        single_shell=single_shell,
+        deadline=deadline,
+        tracer=tracer,
+        history=history,
+    )
+    if only:
+        G = app.data.G
+        unknown = [it for it in only if it not in G.dependencies or it == G.start.value]
+        if unknown:
+            raise click.BadParameter(f"Unknown target '{unknown[0]}'.", param_hint="'--only'")
+        app.select(only, with_deps=with_deps, downstream=downstream)
 
     if no_sudo is False:
         app.check_sudo_usage()
@@ -47,28 +209,95 @@ def cli(config: str, yes: bool, log_dir: str, no_sudo: bool, status: bool = True
         install = True
 
     if install:
-        status_result = app.status()
+        status_result = app.status(jobs=status_jobs, refresh=refresh)
         if status_result.errors:
             # Don't consider status error sufficient to stop the install attempt, sometimes is_status
             # depends on having previous things installed to work correctly
             pass
 
-        if status_result.missing or status_result.errors:
+        if status_result.missing or status_result.errors or status_result.timeouts:
             if not yes:
                 click.confirm("Install all missing targets?", abort=True)
             print()
             print()
-            install_result = app.install_missing(status_result)
-            if install_result.errors:
+            install_result = app.install_missing(status_result, jobs=jobs, coalesce=coalesce, capacities=resource)
+            if install_result.errors or install_result.timeouts:
                 # Don't consider `missing` to be an error. Some status checks may require logging in/out.
-                click.echo(f"There were errors. See logs in {log_dir} for more information")
+                click.echo(f"There were errors. See logs in {app.logger.run_dir} for more information")
                 sys.exit(1)
 
     elif status:
-        if app.status().errors:
-            click.echo(f"There were errors. See logs in {log_dir} for more information")
+        status_result = app.status(jobs=status_jobs, refresh=refresh)
+        if status_result.errors or status_result.timeouts:
+            click.echo(f"There were errors. See logs in {app.logger.run_dir} for more information")
             sys.exit(1)
 
 
+@cli.command("compile")
+@click.pass_context
+@click.option("-c", "--config", type=str, required=False, help="Path to the booty file. Defaults to ./install.booty")
+@click.option("-o", "--output", type=str, required=False, help="Where to write the script. Defaults to stdout")
+@click.option("--no-cache", type=bool, is_flag=True, required=False, help="Don't use the compiled config cache.", default=False)
+def compile_command(ctx: click.Context, config: Optional[str], output: Optional[str], no_cache: bool):
+    """
+    Write a standalone bash script that sets up all of the targets without booty.
+    """
+    # `booty -c path compile` works too
+    config = config or (ctx.parent.params["config"] if ctx.parent is not None else "./install.booty")
+    if not pathlib.Path(config).exists():
+        click.echo(f"Config file {config} does not exist. Use -c to specify the location of an install.booty file.")
+        sys.exit(1)
+
+    from booty.app import App
+    from booty.script import compile_script
+
+    app = App(config, TargetLogger(""), use_cache=not no_cache)
+    script = compile_script(app.data, source=pathlib.Path(config).name)
+    if output is None:
+        click.echo(script, nl=False)
+    else:
+        path = pathlib.Path(output)
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | 0o111)
+
+
+@cli.command("history")
+@click.option(
+    "--threshold",
+    type=float,
+    default=1.5,
+    show_default=True,
+    help="Flag targets whose latest setup took this many times longer than their median",
+)
+@click.option("--window", type=int, default=10, show_default=True, help="How many of the runs before the latest one the median is over")
+def history_command(threshold: float, window: int):
+    """
+    Compare how long each target's latest setup took with its recent runs.
+    """
+    from booty.history import RunHistory
+
+    history = RunHistory()
+    targets = history.targets("setup", window)
+    regressions = history.regressions(threshold, window)
+    history.close()
+
+    if not targets:
+        click.echo(f"No setup history yet in {history.path}. It's recorded every time that booty installs targets.")
+        return
+
+    flagged = {it.target for it in regressions}
+    width = max(len(it.target) for it in targets)
+    for it in sorted(targets, key=lambda it: (it.target not in flagged, it.target)):
+        if it.median is None:
+            click.echo(f"⚪ {it.target:<{width}}  {it.latest:.2f}s, no runs before it to compare with")
+            continue
+
+        icon = "🔴" if it.target in flagged else "🟢"
+        click.echo(f"{icon} {it.target:<{width}}  {it.latest:.2f}s, median {it.median:.2f}s over {it.runs} runs ({it.ratio or 0:.1f}x)")
+
+    click.echo()
+    click.echo(f"{len(regressions)} of {len(targets)} targets took more than {threshold:g}x their median setup time")
+
+
 if __name__ == "__main__":
     cli()
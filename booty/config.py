@@ -0,0 +1,148 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Set
+
+from booty.cache import ConfigCache, get_file_key
+from booty.trace import Tracer
+from booty.types import ConfigIndex, DependencyIndex, ExecutableIndex, RecipeDefinition, RecipeDefinitionIndex, compact_shell_executables
+
+if TYPE_CHECKING:
+    from lark import ParseTree
+
+
+@dataclass
+class ConfigFile:
+    """
+    A single config file, compiled on its own.
+    """
+
+    path: str
+    key: str
+    index: ConfigIndex
+    includes: List[str] = field(default_factory=list)  # Resolved paths of the files that this one includes
+    ast: Optional["ParseTree"] = None  # Only available if the file was parsed in this run
+
+
+def resolve_include(including_path: str, include: str) -> str:
+    """
+    Includes are relative to the directory of the file that includes them.
+    """
+    path = os.path.expanduser(include)
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(including_path), path)
+
+    path = os.path.realpath(path)
+    if not os.path.exists(path):
+        raise Exception(f"File '{include}' included from '{including_path}' does not exist.")
+
+    return path
+
+
+def compile_config_file(path: str, cache: Optional[ConfigCache] = None, tracer: Optional[Tracer] = None) -> ConfigFile:
+    """
+    Compile a single config file, using the cached index if this exact content was compiled before.
+    """
+    tracer = tracer or Tracer(enabled=False)
+    with open(path) as f:
+        content = f.read()
+
+    key = get_file_key(content)
+    with tracer.span("load cached index", "config", path=path):
+        index = cache.load_file_index(key) if cache is not None else None
+    ast: Optional["ParseTree"] = None
+    if index is None:
+        from booty.ast_util import index_config
+        from booty.parser import parse
+
+        with tracer.span("parse", "config", path=path):
+            ast = parse(content)
+        with tracer.span("index", "config", path=path):
+            index = index_config(ast)
+        if cache is not None:
+            cache.save_file_index(key, index)
+
+    includes = [resolve_include(path, include) for include in index.includes]
+    return ConfigFile(path=path, key=key, index=index, includes=includes, ast=ast)
+
+
+def load_config_files(
+    root_path: str, cache: Optional[ConfigCache] = None, max_workers: int = 8, tracer: Optional[Tracer] = None
+) -> List[ConfigFile]:
+    """
+    Compile the config file at root_path and every file that it includes, directly or indirectly.
+
+    Files are discovered one level of includes at a time and each level is compiled in parallel. Each file is only
+    compiled once, no matter how many times it's included, which also makes include cycles harmless.
+
+    The files are returned in the order that they should be merged in: each file comes after everything that it
+    includes, as if the include was replaced by the content of the file.
+    """
+    root_path = os.path.realpath(root_path)
+    files: Dict[str, ConfigFile] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="booty-config") as pool:
+        level = [root_path]
+        while level:
+            for config_file in pool.map(lambda path: compile_config_file(path, cache, tracer), level):
+                files[config_file.path] = config_file
+
+            next_level: List[str] = []
+            for path in level:
+                for include in files[path].includes:
+                    if include not in files and include not in next_level:
+                        next_level.append(include)
+            level = next_level
+
+    ordered: List[ConfigFile] = []
+    visited: Set[str] = set()
+
+    def visit(path: str) -> None:
+        visited.add(path)
+        for include in files[path].includes:
+            if include not in visited:
+                visit(include)
+        ordered.append(files[path])
+
+    visit(root_path)
+    return ordered
+
+
+def merge_config_indexes(indexes: Sequence[ConfigIndex]) -> ConfigIndex:
+    """
+    Merge the indexes of several config files into one. Definitions are merged the same way that they would be if
+    they all appeared in a single file, in order.
+    """
+    executables: ExecutableIndex = {}
+    dependencies: DependencyIndex = {}
+    recipes: RecipeDefinitionIndex = {}
+
+    for index in indexes:
+        for target, definitions in index.executables.items():
+            merged_definitions = executables.setdefault(target, {})
+            if "recipe" in definitions and len(merged_definitions) != 0:
+                # Same as a target defined twice in a file, the first definition of a recipe target wins.
+                continue
+
+            for method, execs in definitions.items():
+                merged_definitions.setdefault(method, []).extend(execs)
+
+        for target, deps in index.dependencies.items():
+            dependencies.setdefault(target, []).extend(deps)
+
+        for name, recipe in index.recipes.items():
+            merged_recipe = recipes.setdefault(name, RecipeDefinition(name))
+            merged_recipe.parameters = recipe.parameters
+            for method, execs in recipe.defs.items():
+                merged_recipe.defs.setdefault(method, []).extend(execs)
+
+    # Definitions that were split across files can have shell commands next to each other now.
+    for definitions in executables.values():
+        for method, execs in definitions.items():
+            definitions[method] = compact_shell_executables(execs)
+
+    for recipe in recipes.values():
+        for method, execs in recipe.defs.items():
+            recipe.defs[method] = compact_shell_executables(execs)
+
+    return ConfigIndex(executables=executables, dependencies=dependencies, recipes=recipes)
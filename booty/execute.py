@@ -1,21 +1,22 @@
-from subprocess import Popen, PIPE
-from select import select
+import asyncio
+import bisect
+import os
+import signal
+import sys
+import threading
+import time
+from queue import Empty, Queue
+from subprocess import PIPE
 import shutil
-from typing import Dict, Generator, List, Literal, Optional, Sequence, Tuple
-from lark import ParseTree
+from typing import Any, AsyncGenerator, Dict, Generator, Iterable, List, Literal, Mapping, Optional, Sequence, Tuple, TypeVar
 from dataclasses import dataclass, field
-from booty.ast_util import ExecutableIndex, RecipeDefinitionIndex, DependencyIndex
-from booty.graph import DependencyGraph
-from booty.types import Executable, ShellCommand
+from booty.output import OutputBuffer
+from booty.plan import get_target_commands
+from booty.target_logger import TargetLogger
+from booty.trace import Tracer
+from booty.types import BootyData, RecipeInvocation, ShellCommand
 
-
-@dataclass
-class BootyData:
-    execution_index: ExecutableIndex
-    dependency_index: DependencyIndex
-    recipe_index: RecipeDefinitionIndex
-    G: DependencyGraph
-    ast: ParseTree
+T = TypeVar("T")
 
 
 @dataclass
@@ -23,91 +24,427 @@ class ExecuteError(Exception):
     code: int
 
 
-def get_commands(data: BootyData, method: Literal["setup", "is_setup"]) -> Dict[str, Sequence[str]]:
-    commands: Dict[str, Sequence[str]] = {}
+@dataclass
+class ExecuteTimeout(Exception):
+    timeout: float
 
-    for target in data.execution_index:
-        exec = data.execution_index[target]
-        cmds = _get_setup_commands(data, exec) if method == "setup" else _get_is_setup_commands(data, exec)
-        current_cmds = commands.get(target, [])
-        new_cmds = [*current_cmds, *cmds]
-        commands[target] = new_cmds
 
-    return commands
+# The exit code that a command that timed out reports, the same one that coreutils' timeout uses.
+TIMEOUT_CODE = 124
 
 
-def execute(
-    data: BootyData, target: str, method: Literal["setup", "is_setup"]
-) -> Generator[Tuple[Optional[str], Optional[str]], None, None]:
+_READ_SIZE = 2**16
+# Output without a newline for this long is split into more than one line.
+_LINE_LIMIT = 2**20
+
+
+async def execute_async(
+    data: BootyData,
+    target: str,
+    method: Literal["setup", "is_setup"],
+    single_shell: bool = False,
+    timeout: Optional[float] = None,
+) -> AsyncGenerator[Tuple[Optional[str], Optional[str]], None]:
+    """
+    Run the commands for a target's method one after another, yielding each line of output as soon as it arrives as
+    either (stdout_line, None) or (None, stderr_line). Raises ExecuteError for the first command that fails.
+
+    Each command normally gets a bash process of its own. With single_shell, all of them run in one bash process
+    instead, see _execute_single_shell.
+
+    With a timeout, raises ExecuteTimeout if all of the commands together take longer than that. Each command runs in
+    a process group of its own then, so that everything that it started is killed along with it.
+
+    Any number of these can run on the same event loop.
+    """
     bash = shutil.which("bash")
-    exec = data.execution_index[target]
-    if method == "setup":
-        commands = _get_setup_commands(data, exec)
-    elif method == "is_setup":
-        commands = _get_is_setup_commands(data, exec)
+    commands = get_target_commands(data, target, method)
 
     if bash is None:
         raise RuntimeError("bash not found in PATH")
 
+    new_group = timeout is not None
+    gen = _execute_single_shell(bash, commands, new_group) if single_shell else _execute_each(bash, commands, new_group=new_group)
+    async for line in _with_timeout(gen, timeout):
+        yield line
+
+
+async def _with_timeout(
+    gen: AsyncGenerator[Tuple[Optional[str], Optional[str]], None], timeout: Optional[float]
+) -> AsyncGenerator[Tuple[Optional[str], Optional[str]], None]:
+    if timeout is None:
+        async for line in gen:
+            yield line
+        return
+
+    deadline = asyncio.get_running_loop().time() + timeout
+    try:
+        while True:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                raise ExecuteTimeout(timeout)
+
+            try:
+                # Cancelling the generator when the time runs out kills its process on the way out.
+                line = await asyncio.wait_for(gen.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise ExecuteTimeout(timeout)
+
+            yield line
+    finally:
+        await gen.aclose()
+
+
+def _process_group_args(new_group: bool) -> Dict[str, Any]:
+    """
+    The subprocess arguments that put a command in a process group of its own. It stays in booty's session so that
+    it keeps the terminal, which sudo needs for its cached credentials.
+    """
+    if not new_group:
+        return {}
+    if sys.version_info >= (3, 11):
+        return {"process_group": 0}
+    return {"preexec_fn": os.setpgrp}
+
+
+async def _kill(proc: "asyncio.subprocess.Process", new_group: bool) -> None:
+    try:
+        if new_group:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass  # Already gone
+    await proc.wait()
+
+
+async def _execute_each(
+    bash: str, commands: List[str], stdin: Optional[bytes] = None, new_group: bool = False
+) -> AsyncGenerator[Tuple[Optional[str], Optional[str]], None]:
+    """
+    Run each command in a bash of its own. If stdin is given then it's written to each command's stdin, otherwise the
+    commands get booty's stdin.
+    """
     for command in commands:
-        with Popen([bash, "-c", command], stdout=PIPE, stderr=PIPE, text=True, bufsize=1) as proc:
-            while True:
-                if proc.stdout is None or proc.stderr is None:
-                    # This shouldn't be possible since I'm calling Popen with PIPE
-                    raise RuntimeError("stdout or stderr is None")
+        proc = await asyncio.create_subprocess_exec(
+            bash,
+            "-c",
+            command,
+            stdin=PIPE if stdin is not None else None,
+            stdout=PIPE,
+            stderr=PIPE,
+            **_process_group_args(new_group),
+        )
+        readers: "List[asyncio.Future[None]]" = []
+        try:
+            if proc.stdout is None or proc.stderr is None:
+                # This shouldn't be possible since I'm calling it with PIPE
+                raise RuntimeError("stdout or stderr is None")
+
+            # Each stream is read by its own task so that neither one can block the other.
+            lines: "asyncio.Queue[Tuple[int, Optional[str]]]" = asyncio.Queue()
+            readers = [asyncio.ensure_future(_read_lines(stream, fd, lines)) for fd, stream in enumerate([proc.stdout, proc.stderr])]
+            if stdin is not None and proc.stdin is not None:
+                readers.append(asyncio.ensure_future(_write_and_close(proc.stdin, stdin)))
+            async for line in _drain(lines, 2):  # stdout and stderr
+                yield line
+
+            await asyncio.gather(*readers)
+            await proc.wait()
+        finally:
+            if proc.returncode is None:
+                # Stopped early, like when booty is interrupted, so don't leave the command running.
+                for reader in readers:
+                    reader.cancel()
+                await _kill(proc, new_group)
 
-                rdy_out, _, _ = select([proc.stdout], [], [], 0.1)
-                out = proc.stdout.readline().strip() if rdy_out else None
+        if proc.returncode != 0:
+            raise ExecuteError(proc.returncode)
 
-                rdy_err, _, _ = select([proc.stderr], [], [], 0.1)
-                err = proc.stderr.readline().strip() if rdy_err else None
 
-                yield (out, err)
+# Reads NUL terminated commands from one fd and runs each of them in a subshell, writing the exit code of each one to
+# another fd. The commands are passed on their own fd instead of stdin so that they still get booty's stdin, just
+# like they do when each one has its own bash. The subshell keeps one command's exit, cd, or variables from affecting
+# the next, also like separate processes, but it's just a fork of this bash instead of a new one starting up.
+_SINGLE_SHELL_DRIVER = """
+while IFS= read -r -d '' __booty_command <&{commands_fd}; do
+    ( eval "$__booty_command" ) {commands_fd}<&- {status_fd}>&-
+    echo "$?" >&{status_fd}
+done
+"""
+
+
+async def _execute_single_shell(
+    bash: str, commands: List[str], new_group: bool = False
+) -> AsyncGenerator[Tuple[Optional[str], Optional[str]], None]:
+    """
+    Run all of the commands in one bash process, one after another. The next command is only sent once the previous
+    one succeeded, so failures behave the same as they do with a bash per command.
+    """
+    loop = asyncio.get_running_loop()
+    commands_read, commands_write = os.pipe()
+    status_read, status_write = os.pipe()
+    try:
+        driver = _SINGLE_SHELL_DRIVER.format(commands_fd=commands_read, status_fd=status_write)
+        proc = await asyncio.create_subprocess_exec(
+            bash, "-c", driver, stdout=PIPE, stderr=PIPE, pass_fds=(commands_read, status_write), **_process_group_args(new_group)
+        )
+    finally:
+        # The child has its own copies of these now, or failed to start.
+        os.close(commands_read)
+        os.close(status_write)
+
+    status = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(status), os.fdopen(status_read, "rb", 0))
+    commands_pipe, _ = await loop.connect_write_pipe(asyncio.Protocol, os.fdopen(commands_write, "wb", 0))
+
+    readers: "List[asyncio.Future[None]]" = []
+    waiting: "List[asyncio.Future[Any]]" = []
+    code = 0
+    try:
+        if proc.stdout is None or proc.stderr is None:
+            # This shouldn't be possible since I'm calling it with PIPE
+            raise RuntimeError("stdout or stderr is None")
+
+        lines: "asyncio.Queue[Tuple[int, Optional[str]]]" = asyncio.Queue()
+        readers = [asyncio.ensure_future(_read_lines(stream, fd, lines)) for fd, stream in enumerate([proc.stdout, proc.stderr])]
+        open_streams = len(readers)
+
+        for command in commands:
+            commands_pipe.write(command.encode() + b"\0")
+            next_status = asyncio.ensure_future(status.readline())
+            waiting = [next_status]
+
+            # Pass output along while the command runs. Output can still trickle in after the status, it's picked up
+            # while the next command runs or at the end.
+            while not next_status.done():
+                next_line = asyncio.ensure_future(lines.get())
+                waiting = [next_status, next_line]
+                await asyncio.wait([next_status, next_line], return_when=asyncio.FIRST_COMPLETED)
+                if not next_line.done():
+                    next_line.cancel()
+                    continue
+
+                fd, line = next_line.result()
+                if line is None:
+                    open_streams -= 1
+                elif fd == 0:
+                    yield (line, None)
+                else:
+                    yield (None, line)
+
+            status_line = next_status.result()
+            code = int(status_line) if status_line else -1  # No status means that bash itself died
+            if code != 0:
+                break
+
+        # Closing the commands pipe ends the driver's loop.
+        commands_pipe.close()
+        async for line in _drain(lines, open_streams):
+            yield line
+
+        await asyncio.gather(*readers)
+        await proc.wait()
+    finally:
+        commands_pipe.close()
+        for it in waiting:
+            it.cancel()
+        if proc.returncode is None:
+            # Stopped early, like when booty is interrupted, so don't leave the command running.
+            for reader in readers:
+                reader.cancel()
+            await _kill(proc, new_group)
+
+    if code != 0:
+        raise ExecuteError(code)
+
+
+async def _write_and_close(stream: asyncio.StreamWriter, data: bytes) -> None:
+    try:
+        stream.write(data)
+        await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # The command doesn't have to read all of it
+    finally:
+        stream.close()
+
+
+async def _drain(
+    lines: "asyncio.Queue[Tuple[int, Optional[str]]]", open_streams: int
+) -> AsyncGenerator[Tuple[Optional[str], Optional[str]], None]:
+    """
+    Pass along the lines from the readers until all of them reach the end of their stream.
+    """
+    while open_streams > 0:
+        fd, line = await lines.get()
+        if line is None:
+            open_streams -= 1
+        elif fd == 0:
+            yield (line, None)
+        else:
+            yield (None, line)
 
-                if proc.poll() is not None:
-                    out = proc.stdout.readline().strip()
-                    err = proc.stderr.readline().strip()
-                    yield (out, err)
-                    break
 
-        if proc.returncode != 0:
-            raise ExecuteError(proc.returncode)
+async def _read_lines(stream: asyncio.StreamReader, fd: int, lines: "asyncio.Queue[Tuple[int, Optional[str]]]") -> None:
+    buffer = b""
+    while True:
+        chunk = await stream.read(_READ_SIZE)
+        if not chunk:
+            break
 
+        *complete, buffer = (buffer + chunk).split(b"\n")
+        if len(buffer) > _LINE_LIMIT:
+            # Don't buffer output without newlines forever, treat it as a line of its own.
+            complete.append(buffer)
+            buffer = b""
 
-def _get_setup_commands(data: BootyData, it: Dict[str, List[Executable]]) -> List[str]:
-    exec = it["setup"] if "setup" in it else it["recipe"]
+        for line in complete:
+            lines.put_nowait((fd, line.decode(errors="replace").strip()))
 
-    execs: List[str] = []
-    for e in exec:
-        if isinstance(e, ShellCommand):
-            execs.append(e.command)
-        else:
-            recipe_name = e.name
-            args = e.args
-            recipe = data.recipe_index[recipe_name]
+    if buffer:
+        lines.put_nowait((fd, buffer.decode(errors="replace").strip()))
+    lines.put_nowait((fd, None))
 
-            for command in recipe.iter_commands(args, recipe.defs["setup"], data.recipe_index, "setup"):
-                execs.append(command)
 
-    return execs
+def execute(
+    data: BootyData, target: str, method: Literal["setup", "is_setup"], single_shell: bool = False
+) -> Generator[Tuple[Optional[str], Optional[str]], None, None]:
+    """
+    Blocking version of execute_async.
+    """
+    return _iterate_sync(execute_async(data, target, method, single_shell))
 
 
-def _get_is_setup_commands(data: BootyData, it: Dict[str, List[Executable]]) -> List[str]:
-    exec = it["is_setup"] if "is_setup" in it else it["recipe"]
+def _iterate_sync(gen: AsyncGenerator[T, None]) -> Generator[T, None, None]:
+    """
+    Drive an async generator from synchronous code on an event loop of its own.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(gen.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        loop.run_until_complete(gen.aclose())
+        loop.close()
 
-    execs: List[str] = []
-    for e in exec:
-        if isinstance(e, ShellCommand):
-            execs.append(e.command)
-        else:
-            recipe_name = e.name
-            args = e.args
-            recipe = data.recipe_index[recipe_name]
 
-            for command in recipe.iter_commands(args, recipe.defs["is_setup"], data.recipe_index, "is_setup"):
-                execs.append(command)
+# The recipe methods that handle many invocations of a recipe at once.
+BatchMethod = Literal["is_setup_batch", "setup_batch"]
+
 
-    return execs
+def get_batch_invocations(data: BootyData, targets: Iterable[str], method: BatchMethod) -> Dict[str, Dict[str, Sequence[Sequence[str]]]]:
+    """
+    Group the targets that can be handled by a batch method by the recipe that they invoke. Only targets that are
+    nothing but an invocation of a recipe that defines the method qualify.
+
+    Returns a dictionary of recipe names to a dictionary of targets to the arguments that they invoke the recipe with.
+    """
+    batches: Dict[str, Dict[str, Sequence[Sequence[str]]]] = {}
+    for target in targets:
+        exec = data.execution_index[target].get("recipe", [])
+        if len(exec) != 1 or not isinstance(exec[0], RecipeInvocation):
+            continue
+
+        recipe = data.recipe_index.get(exec[0].name)
+        if recipe is not None and method in recipe.defs:
+            batches.setdefault(recipe.name, {})[target] = exec[0].args
+
+    return batches
+
+
+@dataclass
+class BatchResult:
+    recipe: str
+    targets: List[str]
+    codes: Optional[List[int]]  # The exit code for each target, or None if the batch itself didn't work out
+    code: int = 0  # The exit code of the batch itself, -1 if it timed out
+    stdout: List[str] = field(default_factory=list)
+    stderr: List[str] = field(default_factory=list)
+
+
+def execute_batches(
+    data: BootyData,
+    batches: Dict[str, Dict[str, Sequence[Sequence[str]]]],
+    method: BatchMethod,
+    timeouts: Optional[Mapping[str, Optional[float]]] = None,
+) -> List[BatchResult]:
+    """
+    Run a recipe's batch method once for all of the invocations of that recipe, all of the recipes at the same time.
+
+    The batch method gets one invocation per line on stdin, with the arguments separated by tabs, and prints one exit
+    code per line in the same order. If it fails, times out, or doesn't print exactly one code per invocation, then the
+    batch doesn't count and its codes are None so that the targets can be run one by one instead.
+
+    timeouts has how long each recipe's batch can take, if it's limited.
+    """
+    timeouts = timeouts or {}
+
+    async def run_all() -> List[BatchResult]:
+        return list(
+            await asyncio.gather(
+                *[_execute_batch(data, recipe, invocations, method, timeouts.get(recipe)) for recipe, invocations in batches.items()]
+            )
+        )
+
+    return asyncio.run(run_all())
+
+
+async def _execute_batch(
+    data: BootyData, recipe_name: str, invocations: Dict[str, Sequence[Sequence[str]]], method: BatchMethod, timeout: Optional[float]
+) -> BatchResult:
+    result = BatchResult(recipe_name, list(invocations.keys()), codes=None)
+    try:
+        async for out, err in execute_batch_async(data, recipe_name, invocations, method, timeout):
+            if out is not None and out.strip():
+                result.stdout.append(out.strip())
+            if err is not None and err.strip():
+                result.stderr.append(err.strip())
+    except ExecuteError as e:
+        result.code = e.code
+        return result
+    except ExecuteTimeout as e:
+        result.code = -1
+        result.stderr.append(f"Timed out after {e.timeout:g}s")
+        return result
+
+    if len(result.stdout) == len(invocations) and all(it.isdigit() for it in result.stdout):
+        result.codes = [int(it) for it in result.stdout]
+    return result
+
+
+async def execute_batch_async(
+    data: BootyData,
+    recipe_name: str,
+    invocations: Dict[str, Sequence[Sequence[str]]],
+    method: BatchMethod,
+    timeout: Optional[float] = None,
+) -> AsyncGenerator[Tuple[Optional[str], Optional[str]], None]:
+    """
+    Run a recipe's batch method for the invocations, yielding its output the same way that execute_async does.
+    """
+    bash = shutil.which("bash")
+    if bash is None:
+        raise RuntimeError("bash not found in PATH")
+
+    command = _get_batch_command(data, recipe_name, method)
+    gen = _execute_each(bash, [command], _get_batch_stdin(invocations), new_group=timeout is not None)
+    async for line in _with_timeout(gen, timeout):
+        yield line
+
+
+def _get_batch_command(data: BootyData, recipe_name: str, method: BatchMethod) -> str:
+    # Validation makes sure that batch methods are only shell commands.
+    return "\n".join(it.command for it in data.recipe_index[recipe_name].defs[method] if isinstance(it, ShellCommand))
+
+
+def _get_batch_stdin(invocations: Dict[str, Sequence[Sequence[str]]]) -> bytes:
+    return "".join("\t".join(" ".join(arg) for arg in args) + "\n" for args in invocations.values()).encode()
 
 
 @dataclass
@@ -115,38 +452,154 @@ class CommandExecutor:
     data: BootyData
     target: str
     method: Literal["setup", "is_setup"]
+    single_shell: bool = False
+    timeout: Optional[float] = None
+    logger: Optional[TargetLogger] = None  # Gets the output as it's produced
 
-    stdout: List[str] = field(default_factory=list)
-    stderr: List[str] = field(default_factory=list)
+    stdout: OutputBuffer = field(default_factory=OutputBuffer)
+    stderr: OutputBuffer = field(default_factory=OutputBuffer)
     code: int = -1
+    timed_out: bool = False
+    duration: float = 0.0  # How long it took to run, in seconds
 
-    def execute(self) -> Generator[Tuple[Optional[str], Optional[str]], None, None]:
+    def _lines(self) -> AsyncGenerator[Tuple[Optional[str], Optional[str]], None]:
+        return execute_async(self.data, self.target, self.method, self.single_shell, self.timeout)
+
+    async def execute_async(self) -> AsyncGenerator[Tuple[Optional[str], Optional[str]], None]:
+        start = time.perf_counter()
         try:
-            for out, err in execute(self.data, self.target, self.method):
+            async for out, err in self._lines():
                 if out:
                     self.stdout.append(out)
                 if err:
                     self.stderr.append(err)
+                if self.logger is not None:
+                    self.logger.write(self.target, self.method, out, err)
                 yield (out, err)
 
             self.code = 0
         except ExecuteError as e:
             self.code = e.code
+        except ExecuteTimeout as e:
+            self.code = TIMEOUT_CODE
+            self.timed_out = True
+            self.stderr.append(f"Timed out after {e.timeout:g}s")
+            if self.logger is not None:
+                self.logger.write(self.target, self.method, None, f"Timed out after {e.timeout:g}s")
+        finally:
+            self.duration = time.perf_counter() - start
+            if self.logger is not None:
+                self.logger.finish(self.target, self.method, self.code)
+
+    def execute(self) -> Generator[Tuple[Optional[str], Optional[str]], None, None]:
+        return _iterate_sync(self.execute_async())
 
     def stdout_summary(self) -> str:
-        return "\n".join(self.stdout)
+        return self.stdout.text()
 
     def stderr_summary(self) -> str:
-        return "\n".join(self.stderr)
+        return self.stderr.text()
 
     def all_stdout(self) -> str:
-        return "\n".join(self.stdout)
+        return self.stdout.text()
 
     def all_stderr(self) -> str:
-        return "\n".join(self.stderr)
+        return self.stderr.text()
 
     def latest_stdout(self, tail_n: int = 5) -> List[str]:
-        return self.stdout[-tail_n:]
+        return self.stdout.latest(tail_n)
 
     def latest_stderr(self, tail_n: int = 5) -> List[str]:
-        return self.stderr[-tail_n:]
+        return self.stderr.latest(tail_n)
+
+
+@dataclass
+class BatchCommandExecutor(CommandExecutor):
+    """
+    Sets up several targets that invoke the same recipe with a single run of the recipe's setup_batch method. The
+    target is just a name for the batch, the targets that it sets up are the keys of invocations.
+    """
+
+    recipe: str = ""
+    invocations: Dict[str, Sequence[Sequence[str]]] = field(default_factory=dict)
+
+    def _lines(self) -> AsyncGenerator[Tuple[Optional[str], Optional[str]], None]:
+        return execute_batch_async(self.data, self.recipe, self.invocations, "setup_batch", self.timeout)
+
+
+@dataclass
+class CommandEvent:
+    cmd: CommandExecutor
+    done: bool  # False while the command is still running and reporting output
+
+
+class CommandPool:
+    """
+    Runs CommandExecutors concurrently, up to max_workers at a time, all on a single event loop in a background
+    thread. The commands don't touch the UI, they report back through a queue of CommandEvents so that everything
+    else can stay on the calling thread.
+    """
+
+    def __init__(self, max_workers: int, tracer: Optional[Tracer] = None) -> None:
+        self.max_workers = max_workers
+        self.tracer = tracer or Tracer(enabled=False)
+        self.running = 0
+        self._free_slots = list(range(max_workers))  # Each command is traced on the track of the slot that it runs in
+        self._events: "Queue[CommandEvent]" = Queue()
+        self._slots: Optional[asyncio.Semaphore] = None  # Created on the loop's thread, the first time it's needed
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="booty-commands", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "CommandPool":
+        return self
+
+    def __exit__(self, *_args: object) -> None:
+        # Normally everything is done by now. If not, like after a KeyboardInterrupt, cancelling kills the commands.
+        asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _cancel_all(self) -> None:
+        tasks = [it for it in asyncio.all_tasks() if it is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, cmd: CommandExecutor) -> None:
+        self.running += 1
+        asyncio.run_coroutine_threadsafe(self._run(cmd), self._loop)
+
+    async def _run(self, cmd: CommandExecutor) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        try:
+            async with self._slots:
+                slot = self._free_slots.pop(0)
+                try:
+                    with self.tracer.span(cmd.target, cmd.method, track=f"slot {slot + 1}") as args:
+                        try:
+                            async for _ in cmd.execute_async():
+                                self._events.put(CommandEvent(cmd, done=False))
+                        finally:
+                            args["code"] = cmd.code
+                finally:
+                    bisect.insort(self._free_slots, slot)
+        finally:
+            # Anything other than an ExecuteError leaves cmd.code at -1, which still counts as a failure.
+            self._events.put(CommandEvent(cmd, done=True))
+
+    def next_event(self, timeout: Optional[float] = None) -> Optional[CommandEvent]:
+        """
+        Wait up to timeout seconds, or forever if it's None, for the next event from one of the running commands.
+        """
+        try:
+            event = self._events.get(timeout=timeout)
+        except Empty:
+            return None
+
+        if event.done:
+            self.running -= 1
+        return event
@@ -1,7 +1,10 @@
+import heapq
+from collections import deque
 from dataclasses import dataclass
-from typing import Dict, Generator, Iterator, List, Sequence, Set, TypeVar
+from functools import cached_property
+from typing import Collection, Deque, Dict, Generator, Iterator, List, Mapping, Optional, Sequence, Set, Tuple, TypeVar
 
-from booty.ast_util import DependencyIndex
+from booty.types import DependencyIndex
 
 T = TypeVar("T")
 
@@ -54,35 +57,64 @@ class DependencyGraph:
         return builder.build()
 
     def bfs(self) -> Generator[str, bool, Sequence[str]]:
-        to_visit: List[Dependency] = [self.start]
+        """
+        Walk the graph in dependency order, one target at a time, starting with the start node. The caller sends back
+        whether each target succeeded. A target is only yielded after all of its dependencies succeeded, and
+        everything downstream of a failure is skipped.
+
+        Returns the sorted targets that were never yielded.
+        """
+        scheduler = TargetScheduler(self, include_start=True)
         visited: Set[str] = set()
-        to_skip: Set[str] = set()
-        skipped_nodes: Set[str] = set()
 
-        while to_visit:
-            current = to_visit.pop(0)
+        target = scheduler.next_ready()
+        while target is not None:
+            success = yield target  # Signaled from the generator caller
+            visited.add(target)
+            scheduler.complete(target, success)
+            target = scheduler.next_ready()
 
-            # If current has any failed parents then skip it
-            if current.value in to_skip:
-                skipped_nodes.add(current.value)
-                to_skip.update(current.children)
-                continue
+        # Anything that was never released was either downstream of a failure or part of a cycle.
+        return sorted(set(self.dependencies.keys()).difference(visited))
 
-            if current.value in visited:
-                continue
-            else:
-                success = yield current.value  # Signaled from the generator caller
-                visited.add(current.value)
+    def scheduler(self, durations: Optional[Mapping[str, float]] = None) -> "TargetScheduler":
+        """
+        Get a scheduler for running the targets concurrently. If the expected durations of the targets are known then
+        the ready targets on the critical path are handed out first.
+        """
+        if durations is None:
+            return TargetScheduler(self)
+        return CriticalPathScheduler(self, self.remaining_path_lengths(durations))
 
-            if not success:
-                to_skip.update(current.children)
-            else:
-                to_visit.extend([self.dependencies[child] for child in current.children if child not in visited])
+    def remaining_path_lengths(self, durations: Mapping[str, float]) -> Dict[str, float]:
+        """
+        The longest path, by duration, from the start of each target to the end of everything that depends on it. This
+        is the least amount of time that it takes to finish the rest of the graph once the target starts, no matter
+        how many targets run at once. Targets without a known duration count as the average of the known ones.
+        """
+        known = list(durations.values())
+        default = sum(known) / len(known) if known else 1.0
+
+        lengths: Dict[str, float] = {}
+        for value in reversed(list(self.iterator())):
+            children = self.dependencies[value].children
+            lengths[value] = durations.get(value, default) + max([lengths[child] for child in children], default=0.0)
+        return lengths
 
-        all_nodes = set(self.dependencies.keys())
-        all_skipped = list(skipped_nodes.union(all_nodes.difference(visited)))
-        all_skipped.sort()
-        return all_skipped
+    def levels(self) -> List[List[str]]:
+        """
+        Split the targets into levels where each target is one level after the deepest of its dependencies. Targets
+        in the same level don't depend on each other, so each level can run all at once after the one before it.
+        """
+        depths: Dict[str, int] = {}
+        levels: List[List[str]] = []
+        for value in self.iterator():
+            depth = max([depths[parent] + 1 for parent in self.parents[value]], default=0)
+            depths[value] = depth
+            if depth == len(levels):
+                levels.append([])
+            levels[depth].append(value)
+        return levels
 
     def iterator(self, skip_first: bool = True) -> Iterator[str]:
         """
@@ -102,32 +134,237 @@ class DependencyGraph:
         except StopIteration:
             pass
 
-    def find_first_cycle(self) -> List[str]:
-        def _dfs(node: Dependency, visited: Set[str], stack: Dict[str, None]) -> List[str]:
-            visited.add(node.value)
-            stack[node.value] = None
+    @cached_property
+    def parents(self) -> Dict[str, List[str]]:
+        """
+        The reverse of children, the targets that each target directly depends on. The start node isn't included.
+        """
+        parents: Dict[str, List[str]] = {value: [] for value in self.dependencies.keys()}
+        for value, dependency in self.dependencies.items():
+            if value == self.start.value:
+                continue
+            for child in dict.fromkeys(dependency.children):
+                parents[child].append(value)
+        return parents
 
-            for child in node.children:
-                if child not in visited:
-                    cycle = _dfs(self.dependencies[child], visited, stack)
-                    if cycle:
-                        return cycle
-                elif child in stack:
-                    return [*stack.keys(), child]
+    def ancestors(self, targets: Collection[str]) -> Set[str]:
+        """
+        Everything that the targets depend on, directly or indirectly.
+        """
+        return self._reachable(targets, self.parents)
 
-            del stack[node.value]
-            return []
+    def descendants(self, targets: Collection[str]) -> Set[str]:
+        """
+        Everything that depends on the targets, directly or indirectly.
+        """
+        return self._reachable(targets, {value: dependency.children for value, dependency in self.dependencies.items()})
 
-        visited: Set[str] = set()
-        stack: Dict[str, None] = {}  # Apparently dicts preserve key ordering so this is a hacky list with fast lookup
+    @staticmethod
+    def _reachable(targets: Collection[str], edges: Mapping[str, Sequence[str]]) -> Set[str]:
+        """
+        Everything reachable from the targets by following edges, not counting the targets themselves unless they can
+        be reached from one of the others. This is a breadth first search, so it's linear in the size of the graph.
+        """
+        reachable: Set[str] = set()
+        to_visit: Deque[str] = deque(targets)
+        while to_visit:
+            for other in edges[to_visit.popleft()]:
+                if other not in reachable:
+                    reachable.add(other)
+                    to_visit.append(other)
+        return reachable
 
-        for node in self.dependencies.values():
-            if node.value not in visited:
-                cycle = _dfs(node, visited, stack)
-                if cycle:
+    def select(self, targets: Collection[str], with_deps: bool = False, downstream: bool = False) -> Set[str]:
+        """
+        Expand the targets with everything that they depend on and/or everything that depends on them.
+        """
+        for target in targets:
+            if target not in self.dependencies or target == self.start.value:
+                raise ValueError(f"Unknown target '{target}'.")
+
+        selected = set(targets)
+        if with_deps:
+            selected.update(self.ancestors(targets))
+        if downstream:
+            selected.update(self.descendants(targets))
+        return selected
+
+    def subgraph(self, targets: Collection[str]) -> "DependencyGraph":
+        """
+        The graph of just the given targets. Dependencies on targets that aren't part of it are dropped, those are
+        assumed to already be set up.
+        """
+        index: DependencyIndex = {
+            value: [parent for parent in self.parents[value] if parent in targets] for value in self.dependencies.keys() if value in targets
+        }
+        return DependencyGraph.from_index(index)
+
+    def find_first_cycle(self) -> List[str]:
+        """
+        The first of the cycles from find_cycles, or an empty list if there are no cycles.
+        """
+        return (self.find_cycles() or [[]])[0]
+
+    def find_cycles(self) -> List[List[str]]:
+        """
+        Find every cycle in the graph, one for each group of targets that depend on each other. Each cycle starts and
+        ends with the same target and follows the graph from dependencies to the targets that depend on them.
+
+        This is an iterative version of Tarjan's strongly connected components algorithm, so it's linear in the size
+        of the graph and doesn't care how deep the graph is.
+        """
+        index: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack: Set[str] = set()
+        components: List[List[str]] = []
+
+        def visit(value: str) -> None:
+            index[value] = lowlink[value] = len(index)
+            stack.append(value)
+            on_stack.add(value)
+
+        for root in self.dependencies.keys():
+            if root in index:
+                continue
+
+            visit(root)
+            work: List[Tuple[str, Iterator[str]]] = [(root, iter(self.dependencies[root].children))]
+            while work:
+                value, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        visit(child)
+                        work.append((child, iter(self.dependencies[child].children)))
+                        break
+                    elif child in on_stack:
+                        lowlink[value] = min(lowlink[value], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[value])
+
+                    if lowlink[value] == index[value]:
+                        component: List[str] = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.remove(member)
+                            component.append(member)
+                            if member == value:
+                                break
+
+                        if len(component) > 1 or value in self.dependencies[value].children:
+                            components.append(component)
+
+        order = {value: i for i, value in enumerate(self.dependencies.keys())}
+        cycles = [self._cycle_in(min(component, key=order.__getitem__), set(component)) for component in components]
+        cycles.sort(key=lambda cycle: order[cycle[0]])
+        return cycles
+
+    def _cycle_in(self, start: str, component: Set[str]) -> List[str]:
+        """
+        The shortest cycle through start, staying inside of its strongly connected component.
+        """
+        previous: Dict[str, str] = {}
+        to_visit: Deque[str] = deque([start])
+        while to_visit:
+            value = to_visit.popleft()
+            for child in self.dependencies[value].children:
+                if child == start:
+                    cycle = [start, value]
+                    while cycle[-1] != start:
+                        cycle.append(previous[cycle[-1]])
+                    cycle.reverse()
                     return cycle
+                if child in component and child not in previous:
+                    previous[child] = value
+                    to_visit.append(child)
+
+        raise RuntimeError(f"No cycle through '{start}'")  # Not possible for a strongly connected component
+
+
+class TargetScheduler:
+    """
+    Hands out the targets of a DependencyGraph as they become ready to run, for running more than one at a time.
+
+    A target is ready once every one of its dependencies completed successfully. If a target fails then everything
+    that depends on it, directly or indirectly, is skipped. This is Kahn's algorithm, so handing out every target is
+    O(V+E). The start node is considered complete from the beginning unless include_start is set, in which case it's
+    the first target handed out.
+    """
+
+    def __init__(self, graph: DependencyGraph, include_start: bool = False) -> None:
+        # Duplicate edges are allowed in the graph, but they shouldn't count as more than one dependency.
+        self._children: Dict[str, List[str]] = {value: list(dict.fromkeys(it.children)) for value, it in graph.dependencies.items()}
+        self._remaining_dependencies: Dict[str, int] = {value: 0 for value in graph.dependencies.keys()}
+        for children in self._children.values():
+            for child in children:
+                self._remaining_dependencies[child] += 1
+
+        self._ready: Deque[str] = deque()
+        self._skipped: Set[str] = set()
+        if include_start:
+            self._push(graph.start.value)
+        else:
+            self.complete(graph.start.value, True)
+
+    def next_ready(self) -> Optional[str]:
+        """
+        Get the next target that is ready to run, or None if nothing is ready until something else completes.
+        """
+        return self._ready.popleft() if self._ready else None
+
+    def complete(self, target: str, success: bool) -> None:
+        """
+        Report that a target finished running, which may make the targets that depend on it ready.
+        """
+        if not success:
+            self._skip(self._children[target])
+            return
+
+        for child in self._children[target]:
+            self._remaining_dependencies[child] -= 1
+            if self._remaining_dependencies[child] == 0 and child not in self._skipped:
+                self._push(child)
+
+    def _push(self, target: str) -> None:
+        self._ready.append(target)
+
+    def _skip(self, targets: List[str]) -> None:
+        to_skip = list(targets)
+        while to_skip:
+            target = to_skip.pop()
+            if target not in self._skipped:
+                self._skipped.add(target)
+                to_skip.extend(self._children[target])
+
+    def skipped(self) -> List[str]:
+        """
+        The targets that were skipped because one of their dependencies failed, sorted.
+        """
+        return sorted(self._skipped)
+
+
+class CriticalPathScheduler(TargetScheduler):
+    """
+    A TargetScheduler that hands out the ready target with the longest remaining path first. When more targets are
+    ready than can run at once, starting the ones that everything else is waiting on keeps the total time down.
+    Ties are handed out in the order that they became ready.
+    """
+
+    def __init__(self, graph: DependencyGraph, priorities: Mapping[str, float], include_start: bool = False) -> None:
+        self._priorities = priorities
+        self._heap: List[Tuple[float, int, str]] = []
+        self._pushed = 0
+        super().__init__(graph, include_start=include_start)
+
+    def _push(self, target: str) -> None:
+        heapq.heappush(self._heap, (-self._priorities.get(target, 0.0), self._pushed, target))
+        self._pushed += 1
 
-        return []
+    def next_ready(self) -> Optional[str]:
+        return heapq.heappop(self._heap)[2] if self._heap else None
 
 
 class DependencyGraphBuilder:
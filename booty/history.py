@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Any, Collection, Dict, List, Literal, Mapping, Optional, Sequence, Tuple
+
+from booty.cache import get_cache_dir
+
+Method = Literal["setup", "is_setup"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    target TEXT NOT NULL,
+    method TEXT NOT NULL,
+    duration REAL NOT NULL,
+    code INTEGER NOT NULL,
+    stdout_size INTEGER NOT NULL,
+    stderr_size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_by_target ON results (method, target, id);
+"""
+
+# The successful results of each target, newest first, numbered from 1.
+_RECENT = """
+SELECT target, duration, ROW_NUMBER() OVER (PARTITION BY target ORDER BY id DESC) AS n
+FROM results
+WHERE method = ? AND code = 0
+"""
+
+_PRUNE_RESULTS = """
+DELETE FROM results WHERE id IN (
+    SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY target, method ORDER BY id DESC) AS n FROM results) WHERE n > ?
+)
+"""
+
+
+@dataclass
+class TargetHistory:
+    target: str
+    latest: float  # How long the latest successful run took
+    median: Optional[float]  # The median of the successful runs before it, within the window
+    runs: int  # How many runs the median is over
+
+    @property
+    def ratio(self) -> Optional[float]:
+        return self.latest / self.median if self.median else None
+
+
+class RunHistory:
+    """
+    Keeps how long each status check and setup took in every run, along with its exit code and how much output it
+    had, in a SQLite database next to the other caches. That's used to estimate how long targets will take and to
+    notice when one of them got a lot slower than it usually is, like when a mirror is having a bad day.
+
+    Only the last `keep` results of each target's status check and setup are kept. That's per target instead of per
+    run so that a status check from cron every few minutes doesn't push out the setups, which happen a lot less often.
+
+    Nothing here is needed for booty to work, so a database that can't be opened or written to just means that
+    nothing is recorded.
+    """
+
+    def __init__(self, path: Optional[str] = None, keep: int = 50) -> None:
+        self.path = path or os.path.join(get_cache_dir(), "history.sqlite3")
+        self.keep = keep
+        self.run_id: Optional[int] = None
+        self._db: Optional[sqlite3.Connection] = None
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path)
+            self._db.executescript(_SCHEMA)
+        except (OSError, sqlite3.Error):
+            self._db = None
+
+    def record(self, target: str, method: Method, duration: float, code: int, stdout_size: int = 0, stderr_size: int = 0) -> None:
+        if self._db is None:
+            return
+
+        try:
+            with self._db:
+                if self.run_id is None:
+                    # The run only shows up once something actually ran in it.
+                    self.run_id = self._db.execute("INSERT INTO runs (started_at) VALUES (?)", (time.time(),)).lastrowid
+                self._db.execute(
+                    "INSERT INTO results (run_id, target, method, duration, code, stdout_size, stderr_size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.run_id, target, method, duration, code, stdout_size, stderr_size),
+                )
+        except sqlite3.Error:
+            pass
+
+    def medians(self, method: Method, window: int = 10) -> Dict[str, float]:
+        """
+        The median duration of each target's last `window` successful runs.
+        """
+        durations: Dict[str, List[float]] = {}
+        for target, duration in self._query(f"SELECT target, duration FROM ({_RECENT}) WHERE n <= ?", (method, window)):
+            durations.setdefault(target, []).append(duration)
+        return {target: statistics.median(it) for target, it in durations.items()}
+
+    def targets(self, method: Method = "setup", window: int = 10) -> List[TargetHistory]:
+        """
+        The latest successful run of each target compared with the median of the `window` successful runs before it.
+        """
+        recent: Dict[str, List[float]] = {}
+        query = f"SELECT target, duration FROM ({_RECENT}) WHERE n <= ? ORDER BY target, n"
+        for target, duration in self._query(query, (method, window + 1)):
+            recent.setdefault(target, []).append(duration)
+
+        return [
+            TargetHistory(
+                target,
+                latest=durations[0],
+                median=statistics.median(durations[1:]) if len(durations) > 1 else None,
+                runs=len(durations) - 1,
+            )
+            for target, durations in recent.items()
+        ]
+
+    def regressions(self, threshold: float = 1.5, window: int = 10, min_runs: int = 3, min_increase: float = 1.0) -> List[TargetHistory]:
+        """
+        The targets whose latest setup took more than `threshold` times their median, as long as there are at least
+        `min_runs` runs to take the median of. Targets also have to be at least `min_increase` seconds slower, since
+        a target that takes a fraction of a second can easily take twice as long by chance.
+        """
+        return [
+            it
+            for it in self.targets("setup", window)
+            if it.median is not None and it.runs >= min_runs and it.latest > it.median * threshold and it.latest - it.median >= min_increase
+        ]
+
+    def _query(self, query: str, params: Sequence[object]) -> List[Tuple[Any, ...]]:
+        if self._db is None:
+            return []
+        try:
+            return self._db.execute(query, params).fetchall()
+        except sqlite3.Error:
+            return []
+
+    def close(self) -> None:
+        if self._db is None:
+            return
+
+        try:
+            if self.run_id is not None:
+                with self._db:
+                    self._db.execute("UPDATE runs SET finished_at = ? WHERE id = ?", (time.time(), self.run_id))
+                    self._db.execute(_PRUNE_RESULTS, (self.keep,))
+                    self._db.execute("DELETE FROM runs WHERE id NOT IN (SELECT DISTINCT run_id FROM results)")
+            self._db.close()
+        except sqlite3.Error:
+            pass
+        self._db = None
+
+
+def estimate_remaining(expected: Mapping[str, float], running: Mapping[str, float], waiting: Collection[str], jobs: int) -> Optional[float]:
+    """
+    Roughly how long the rest of a run will take, given how long each target is expected to take, how long the
+    running targets have been running for, and the targets that haven't started yet. The work that's left is spread
+    over the jobs, but it's never less than what the slowest running target has left. Targets without a history count
+    as the median of the ones with one. None if nothing has a history.
+    """
+    if not expected:
+        return None
+
+    default = statistics.median(expected.values())
+    running_left = [max(expected.get(target, default) - elapsed, 0.0) for target, elapsed in running.items()]
+    work = sum(running_left) + sum(expected.get(target, default) for target in waiting)
+    return max(work / max(jobs, 1), max(running_left, default=0.0))
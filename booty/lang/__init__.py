@@ -3,10 +3,18 @@ import os
 from typing import cast
 
 
-def __get_file_content(file_name: str) -> str:
+def get_lang_file_path(file_name: str) -> str:
+    """
+    Get the path to a file in the lang directory. This has to account for running from the pyinstaller binary, where
+    the lang directory is extracted into sys._MEIPASS instead of living next to this file.
+    """
     is_binary = getattr(sys, "_MEIPASS", None)
     here: str = cast(str, os.path.join(sys._MEIPASS, "booty", "lang") if is_binary else os.path.dirname(__file__))  # type: ignore
-    with open(os.path.join(here, file_name), "r") as f:
+    return os.path.join(here, file_name)
+
+
+def __get_file_content(file_name: str) -> str:
+    with open(get_lang_file_path(file_name), "r") as f:
         return f.read()
 
 
@@ -16,3 +24,12 @@ def get_stdlib() -> str:
 
 def get_grammar() -> str:
     return __get_file_content("grammar.lark")
+
+
+def get_grammar_cache_path() -> str:
+    """
+    The serialized LALR parser that gets generated by `python -m booty.parser` during the build and shipped in the lang
+    directory. It starts with a hash of the grammar, lark version, and python version, and it's only loaded if none of
+    them changed.
+    """
+    return get_lang_file_path("grammar.lark.cache")
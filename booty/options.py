@@ -0,0 +1,91 @@
+import re
+from typing import List, Literal, Optional, Set
+
+from booty.types import BootyData, Executable, RecipeInvocation, ShellCommand
+
+# Settings that targets and recipes define the same way as methods, like `status_ttl: 1d`. Their value is the text
+# after the colon instead of commands to run.
+TargetOption = Literal["status_ttl", "timeout", "setup_timeout", "is_setup_timeout", "resources"]
+DURATION_OPTIONS: List[TargetOption] = ["status_ttl", "timeout", "setup_timeout", "is_setup_timeout"]
+TARGET_OPTIONS: List[TargetOption] = [*DURATION_OPTIONS, "resources"]
+
+# Status checks are read only, so they can run more widely in parallel than installs by default.
+DEFAULT_STATUS_JOBS = 8
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$")
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse a duration like 30s, 15m, 2h, or 1d into seconds. Plain numbers are seconds.
+    """
+    match = _DURATION.match(value.strip())
+    if match is None:
+        raise ValueError(f"Invalid duration '{value}', expected a number followed by s, m, h, or d.")
+
+    amount, unit = match.groups()
+    return float(amount) * _DURATION_UNITS[unit or "s"]
+
+
+def get_option_value(executables: List[Executable]) -> str:
+    # Validation makes sure that options are only shell commands.
+    return " ".join(it.command for it in executables if isinstance(it, ShellCommand)).strip()
+
+
+def get_target_option(data: BootyData, target: str, option: TargetOption) -> Optional[str]:
+    """
+    The value of an option for a target. An option that the target defines itself wins, otherwise it comes from the
+    first recipe that the target invokes that defines it.
+    """
+    definitions = data.execution_index[target]
+    if option in definitions:
+        return get_option_value(definitions[option])
+
+    for executable in definitions.get("recipe", []):
+        if isinstance(executable, RecipeInvocation):
+            recipe = data.recipe_index.get(executable.name)
+            if recipe is not None and option in recipe.defs:
+                return get_option_value(recipe.defs[option])
+
+    return None
+
+
+def get_duration_option(data: BootyData, target: str, option: TargetOption) -> Optional[float]:
+    value = get_target_option(data, target, option)
+    return parse_duration(value) if value is not None else None
+
+
+def get_timeout(data: BootyData, target: str, method: Literal["setup", "is_setup"]) -> Optional[float]:
+    """
+    How long a target's method can run for. The timeout for the specific method wins over the general timeout.
+    """
+    timeout = get_duration_option(data, target, "setup_timeout" if method == "setup" else "is_setup_timeout")
+    return timeout if timeout is not None else get_duration_option(data, target, "timeout")
+
+
+def get_resources(data: BootyData, target: str) -> List[str]:
+    """
+    The resources that a target holds while it's set up. That's the ones it lists itself along with the ones listed by
+    every recipe that its setup invokes, directly or through other recipes.
+    """
+    definitions = data.execution_index[target]
+    resources = get_option_value(definitions["resources"]).split() if "resources" in definitions else []
+
+    invocations = list(definitions["setup"] if "setup" in definitions else definitions.get("recipe", []))
+    visited: Set[str] = set()
+    while invocations:
+        executable = invocations.pop()
+        if not isinstance(executable, RecipeInvocation) or executable.name in visited:
+            continue
+
+        visited.add(executable.name)
+        recipe = data.recipe_index.get(executable.name)
+        if recipe is None:
+            continue
+
+        if "resources" in recipe.defs:
+            resources.extend(get_option_value(recipe.defs["resources"]).split())
+        invocations.extend(recipe.defs.get("setup", []))
+
+    return sorted(set(resources))
@@ -0,0 +1,76 @@
+import tempfile
+from collections import deque
+from typing import IO, Deque, Iterator, List, Optional
+
+# How much output is kept in memory before it's moved to a file.
+SPILL_SIZE = 2**20
+
+
+class OutputBuffer:
+    """
+    The output of a command, one line at a time. Small outputs are just kept in memory. Once the output gets bigger
+    than `spill_size` it's written to an anonymous temporary file as it arrives instead, and only the last `tail` lines
+    stay in memory for displaying progress. That keeps memory flat no matter how much a command prints.
+    """
+
+    def __init__(self, tail: int = 20, spill_size: int = SPILL_SIZE) -> None:
+        self.spill_size = spill_size
+        self._tail: Deque[str] = deque(maxlen=tail)
+        self._lines: List[str] = []  # Everything, until it's spilled
+        self._size = 0
+        self._file: Optional[IO[str]] = None
+        self._count = 0
+
+    def append(self, line: str) -> None:
+        self._tail.append(line)
+        self._count += 1
+        self._size += len(line) + 1
+        if self._file is not None:
+            self._file.write(line + "\n")
+            return
+
+        self._lines.append(line)
+        if self._size > self.spill_size:
+            # Only \n separates lines, so that lines with a \r in them come back out the same way.
+            self._file = tempfile.TemporaryFile("w+", encoding="utf-8", errors="replace", newline="\n")
+            self._file.writelines(it + "\n" for it in self._lines)
+            self._lines = []
+
+    @property
+    def size(self) -> int:
+        """
+        How much output there was in characters, counting the newline at the end of each line.
+        """
+        return self._size
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def latest(self, n: int = 5) -> List[str]:
+        """
+        The last n lines, up to the number of lines that are kept in memory.
+        """
+        return list(self._tail)[-n:] if n > 0 else []
+
+    def lines(self) -> List[str]:
+        return list(self)
+
+    def text(self) -> str:
+        return "\n".join(self)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._file is None:
+            yield from list(self._lines)
+            return
+
+        self._file.flush()
+        self._file.seek(0)
+        try:
+            for line in self._file:
+                yield line[:-1]
+        finally:
+            self._file.seek(0, 2)  # Back to the end so that appending still works
+
+    def __len__(self) -> int:
+        return self._count
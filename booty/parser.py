@@ -1,21 +1,71 @@
-from typing import Optional
+import hashlib
+import sys
+from typing import Optional, Union
 from lark import Lark, ParseTree
-from pathlib import Path
 
-from booty.lang import get_grammar
+from booty.lang import get_grammar, get_grammar_cache_path
 
 __parser: Optional[Lark] = None
 
 
-def get_lang_path(file: str) -> Path:
-    current_file_path = Path(__file__).resolve()
-    current_dir_path = current_file_path.parent
-    return current_dir_path / "lang" / file
+def create_parser(cache: Union[bool, str]) -> Lark:
+    """
+    Create the LALR parser for the booty grammar. The contextual lexer is what lets the grammar use terminals that
+    overlap with each other (like SHELL_LINE and NAME), since it only considers the terminals that are valid in the
+    current parser state.
 
+    Args:
+        cache: Where to store the serialized parser. True stores it in the temp dir under a name that includes the hash
+        of the grammar, a path stores it at that path, and False disables caching.
+    """
+    return Lark(get_grammar(), parser="lalr", lexer="contextual", cache=cache)
 
-def parse(text: str) -> ParseTree:
+
+def get_parser_key() -> bytes:
+    """
+    The key that the bundled parser is stored with. A parser serialized for a different grammar, lark version, or
+    python version can't be loaded.
+    """
+    import lark
+
+    return hashlib.sha256(f"{lark.__version__}\n{sys.version_info[:2]}\n{get_grammar()}".encode()).hexdigest().encode()
+
+
+def save_parser(path: str) -> None:
+    with open(path, "wb") as f:
+        f.write(get_parser_key() + b"\n")
+        create_parser(cache=False).save(f)
+
+
+def load_parser(path: str) -> Optional[Lark]:
+    """
+    Load the parser that was serialized at build time, or None if it's missing or stale. This only ever reads the file,
+    so it works from a read only site-packages too.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.readline().rstrip(b"\n") != get_parser_key():
+                return None
+            return Lark.load(f)
+    except Exception:
+        return None
+
+
+def get_parser() -> Lark:
     global __parser
     if __parser is None:
-        __parser = Lark(get_grammar(), debug=True)
+        # Prefer the parser that was serialized at build time. If it doesn't exist or it's stale, then lark builds it
+        # and caches it in the temp dir, keyed by the hash of the grammar.
+        __parser = load_parser(get_grammar_cache_path()) or create_parser(cache=True)
+
+    return __parser
+
+
+def parse(text: str) -> ParseTree:
+    return get_parser().parse(text)
+
 
-    return __parser.parse(text)
+if __name__ == "__main__":
+    # Build time step that serializes the parser into the lang directory so that it ships with the wheel and binary.
+    save_parser(get_grammar_cache_path())
+    print(f"Wrote parser cache to {get_grammar_cache_path()}")
@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+from typing import Dict, List, Literal, Tuple, Union
+
+from booty.types import BootyData, CommandTemplate, Executable, ExecutableIndex, RecipeDefinitionIndex, RecipeInvocation, ShellCommand
+
+Method = Literal["setup", "is_setup"]
+
+
+@dataclass
+class TargetPlan:
+    """
+    The final commands that a target runs for each of its methods, with every recipe expanded and every argument
+    filled in.
+    """
+
+    setup: List[str]
+    is_setup: List[str]
+
+    def commands(self, method: Method) -> List[str]:
+        return self.setup if method == "setup" else self.is_setup
+
+
+CommandPlan = Dict[str, TargetPlan]
+
+_Step = Union[CommandTemplate, RecipeInvocation]
+
+
+class Planner:
+    """
+    Expands the commands of targets. Each recipe method is only turned into templates once, however many targets
+    invoke it.
+    """
+
+    def __init__(self, recipes: RecipeDefinitionIndex) -> None:
+        self.recipes = recipes
+        self._steps: Dict[Tuple[str, Method], List[_Step]] = {}
+
+    def plan(self, executables: ExecutableIndex) -> CommandPlan:
+        return {target: self.plan_target(definitions) for target, definitions in executables.items()}
+
+    def plan_target(self, definitions: Dict[str, List[Executable]]) -> TargetPlan:
+        return TargetPlan(
+            setup=self._expand(definitions["setup"] if "setup" in definitions else definitions["recipe"], "setup"),
+            is_setup=self._expand(definitions["is_setup"] if "is_setup" in definitions else definitions["recipe"], "is_setup"),
+        )
+
+    def _expand(self, executables: List[Executable], method: Method) -> List[str]:
+        commands: List[str] = []
+        for executable in executables:
+            if isinstance(executable, ShellCommand):
+                commands.append(executable.command)
+            else:
+                self._expand_invocation(executable, method, commands)
+        return commands
+
+    def _expand_invocation(self, invocation: RecipeInvocation, method: Method, commands: List[str]) -> None:
+        arg_values = [" ".join(it) for it in invocation.args]
+        for step in self._recipe_steps(invocation.name, method):
+            if isinstance(step, CommandTemplate):
+                commands.append(step.render(arg_values))
+            else:
+                # A recipe that calls another recipe. Its arguments are passed as they were written.
+                self._expand_invocation(step, method, commands)
+
+    def _recipe_steps(self, name: str, method: Method) -> List[_Step]:
+        key = (name, method)
+        if key not in self._steps:
+            recipe = self.recipes[name]
+            self._steps[key] = [
+                CommandTemplate.compile(it.command, recipe.parameters) if isinstance(it, ShellCommand) else it for it in recipe.defs[method]
+            ]
+        return self._steps[key]
+
+
+def make_plan(executables: ExecutableIndex, recipes: RecipeDefinitionIndex) -> CommandPlan:
+    return Planner(recipes).plan(executables)
+
+
+def get_target_commands(data: BootyData, target: str, method: Method) -> List[str]:
+    if target not in data.plan:
+        data.plan[target] = Planner(data.recipe_index).plan_target(data.execution_index[target])
+    return data.plan[target].commands(method)
@@ -0,0 +1,37 @@
+from typing import Collection, Dict, Mapping, Optional
+
+# How many targets can hold each resource at the same time, unless it's overridden with --resource. Resources that
+# aren't listed here can only be held by one target at a time.
+DEFAULT_CAPACITIES: Dict[str, int] = {
+    "dpkg": 1,  # apt and dpkg take an exclusive lock on the package database
+    "network": 4,
+}
+
+
+class ResourcePool:
+    """
+    Keeps track of the named resources that running targets hold, like the dpkg lock or a share of the network. A
+    target can only start once it can hold every resource that it needs.
+    """
+
+    def __init__(self, capacities: Optional[Mapping[str, int]] = None) -> None:
+        self.capacities = {**DEFAULT_CAPACITIES, **(capacities or {})}
+        self.held: Dict[str, int] = {}
+
+    def capacity(self, resource: str) -> int:
+        return self.capacities.get(resource, 1)
+
+    def acquire(self, resources: Collection[str]) -> bool:
+        """
+        Hold all of the resources, or none of them if any of them are at capacity. Returns whether they're held.
+        """
+        if any(self.held.get(it, 0) >= self.capacity(it) for it in resources):
+            return False
+
+        for it in resources:
+            self.held[it] = self.held.get(it, 0) + 1
+        return True
+
+    def release(self, resources: Collection[str]) -> None:
+        for it in resources:
+            self.held[it] -= 1
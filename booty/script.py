@@ -0,0 +1,122 @@
+import shlex
+from typing import Dict, List, Literal, Optional
+
+from booty.options import get_resources, get_timeout
+from booty.plan import get_target_commands
+from booty.resources import ResourcePool
+from booty.types import BootyData
+
+# Shared by every target in the script. Each target's status ends up in a file named after it so that the targets
+# after it can check whether their dependencies succeeded, even though each one runs in a background job.
+_PRELUDE = """\
+#!/usr/bin/env bash
+# Generated by `booty compile` from {source}. It runs the same targets in the same order as booty without needing booty
+# (or python) to be installed. Output goes to $BOOTY_LOG_DIR, ./logs by default.
+set -u
+
+__booty_state=$(mktemp -d)
+trap 'rm -rf "$__booty_state"' EXIT
+__booty_logs="${{BOOTY_LOG_DIR:-./logs}}/$(date +%s)"
+mkdir -p "$__booty_logs"
+
+__booty_target() {{
+    local name=$1 is_setup=$2 setup=$3
+    shift 3
+
+    local dep
+    for dep in "$@"; do
+        if [[ "$(cat "$__booty_state/$dep")" != ok ]]; then
+            echo "🟡 $name skipped because $dep failed"
+            echo skipped > "$__booty_state/$name"
+            return
+        fi
+    done
+
+    if "$is_setup" > "$__booty_logs/$name.is_setup.log" 2>&1; then
+        echo "🟢 $name is installed"
+        echo ok > "$__booty_state/$name"
+    elif "$setup" > "$__booty_logs/$name.setup.log" 2>&1; then
+        echo "🟢 $name installed"
+        echo ok > "$__booty_state/$name"
+    else
+        echo "🔴 $name failed, see $__booty_logs/$name.setup.log"
+        echo failed > "$__booty_state/$name"
+    fi
+}}
+"""
+
+_EPILOGUE = """\
+if grep -q -v -x ok "$__booty_state"/* 2> /dev/null; then
+    exit 1
+fi
+"""
+
+
+def _function_body(data: BootyData, target: str, method: Literal["setup", "is_setup"]) -> str:
+    # Each command gets a bash of its own, same as when booty runs it, and the first one that fails stops the rest.
+    commands = [f"bash -c {shlex.quote(command)}" for command in get_target_commands(data, target, method)]
+    body = " &&\n    ".join(commands) if commands else "true"
+
+    # Like in booty, the timeout is for the whole method rather than each of its commands.
+    timeout = get_timeout(data, target, method)
+    return f"timeout {timeout:g} bash -c {shlex.quote(body)}" if timeout is not None else body
+
+
+def _lanes(data: BootyData, level: List[str], resources: ResourcePool) -> List[List[str]]:
+    """
+    Split the targets of a level into lanes that run at the same time. Targets that need the same resource, when
+    only one target can hold it at a time, share a lane so that they run one after another.
+    """
+    lanes: List[List[str]] = []
+    lane_of: Dict[str, int] = {}  # The lane that holds each exclusive resource
+    for target in level:
+        exclusive = [it for it in get_resources(data, target) if resources.capacity(it) == 1]
+        lane: Optional[int] = next((lane_of[it] for it in exclusive if it in lane_of), None)
+        if lane is None:
+            lane = len(lanes)
+            lanes.append([])
+
+        # Resources can join lanes together, e.g. a target that needs both dpkg and a lock that another lane has.
+        for it in exclusive:
+            other = lane_of.get(it)
+            if other is not None and other != lane:
+                lanes[lane].extend(lanes[other])
+                lanes[other] = []
+                lane_of = {key: lane if value == other else value for key, value in lane_of.items()}
+            lane_of[it] = lane
+
+        lanes[lane].append(target)
+
+    return [it for it in lanes if it]
+
+
+def compile_script(data: BootyData, source: str = "install.booty") -> str:
+    """
+    Turn the config into a standalone bash script. The targets are grouped into levels by dependency depth, every
+    target in a level runs as a background job, and `wait` between the levels makes sure that each target starts after
+    all of its dependencies are done. Each target checks its is_setup first and targets whose dependencies failed are
+    skipped, just like booty does.
+    """
+    resources = ResourcePool()
+    parents = data.G.parents
+    lines = [_PRELUDE.format(source=source)]
+
+    names: Dict[str, str] = {}
+    for index, target in enumerate(data.G.iterator()):
+        names[target] = f"__booty_{index}"
+        lines.append(f"# {target}")
+        lines.append(f"{names[target]}_is_setup() {{\n    {_function_body(data, target, 'is_setup')}\n}}")
+        lines.append(f"{names[target]}_setup() {{\n    {_function_body(data, target, 'setup')}\n}}\n")
+
+    for depth, level in enumerate(data.G.levels()):
+        lines.append(f"# Level {depth}")
+        for lane in _lanes(data, level, resources):
+            calls = [
+                " ".join(["__booty_target", target, f"{names[target]}_is_setup", f"{names[target]}_setup", *parents[target]])
+                for target in lane
+            ]
+            lines.append(f"{{ {'; '.join(calls)}; }} &")
+        lines.append("wait\n")
+
+    lines.append(_EPILOGUE)
+    return "\n".join(lines)
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import time
+from typing import Collection, Dict, Optional, Sequence
+
+from booty.cache import get_cache_dir, load_cached, save_atomically
+
+
+def get_status_key(commands: Sequence[str]) -> str:
+    """
+    The key that a status result is stored under. It's the fully expanded is_setup commands, so changing the target,
+    the recipe it invokes, or the arguments it passes is enough to invalidate the result.
+    """
+    digest = hashlib.sha256()
+    for command in commands:
+        digest.update(command.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class StatusCache:
+    """
+    Remembers when each target's is_setup last passed, so that targets with a status_ttl don't have to be checked
+    again until the ttl runs out. Only passing checks are stored. Targets that are missing or failed are always checked
+    again since they're usually about to be installed.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or os.path.join(get_cache_dir(), "status.json")
+        self.checked: Dict[str, float] = self._load()
+        self.changed = False
+
+    def _load(self) -> Dict[str, float]:
+        checked = load_cached(self.path, json.load)
+        if not isinstance(checked, dict):
+            return {}
+        return {str(k): float(v) for k, v in checked.items() if isinstance(v, (int, float))}  # type: ignore
+
+    def is_fresh(self, key: str, ttl: float, now: Optional[float] = None) -> bool:
+        checked = self.checked.get(key)
+        if checked is None:
+            return False
+        return (now if now is not None else time.time()) - checked < ttl
+
+    def record(self, key: str, now: Optional[float] = None) -> None:
+        self.checked[key] = now if now is not None else time.time()
+        self.changed = True
+
+    def retain(self, keys: Collection[str]) -> None:
+        """
+        Forget everything but the given keys, like the results of targets that were removed from the config or whose
+        is_setup changed since.
+        """
+        stale = [it for it in self.checked if it not in keys]
+        for key in stale:
+            del self.checked[key]
+        self.changed = self.changed or bool(stale)
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        # Without the cache the targets are just checked again next time.
+        save_atomically(self.path, json.dumps(self.checked, indent=2, sort_keys=True).encode())
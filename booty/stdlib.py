@@ -0,0 +1,65 @@
+import hashlib
+import os
+import pickle
+from typing import Any, Dict
+
+from booty import __version__
+from booty.lang import get_lang_file_path, get_stdlib
+from booty.types import RecipeDefinitionIndex
+
+
+def get_stdlib_index_path() -> str:
+    return get_lang_file_path("stdlib.index")
+
+
+def get_stdlib_key(stdlib: str) -> str:
+    """
+    The key that the compiled stdlib index is stored under. The index depends on both the stdlib source and the code
+    that builds the index, so a new booty version invalidates it as well.
+    """
+    return hashlib.sha256(f"{__version__}\n{stdlib}".encode()).hexdigest()
+
+
+def parse_stdlib_recipe_index(stdlib: str) -> RecipeDefinitionIndex:
+    # Only needed when the compiled index is stale, so lark isn't imported on the fast path.
+    from booty.ast_util import get_recipe_definition_index
+    from booty.parser import parse
+
+    return get_recipe_definition_index(parse(stdlib))
+
+
+def compile_stdlib(path: str) -> None:
+    """
+    Parse the stdlib and write its recipe index to path. This runs at build time so that booty doesn't have to parse
+    the stdlib every time it starts.
+    """
+    stdlib = get_stdlib()
+    artifact: Dict[str, Any] = {"key": get_stdlib_key(stdlib), "recipes": parse_stdlib_recipe_index(stdlib)}
+    with open(path, "wb") as f:
+        pickle.dump(artifact, f)
+
+
+def get_stdlib_recipe_index() -> RecipeDefinitionIndex:
+    """
+    Get the recipes defined in the stdlib. This loads the index that was compiled at build time, falling back to
+    parsing the stdlib if the index doesn't exist or was compiled from a different stdlib/booty version.
+    """
+    stdlib = get_stdlib()
+    path = get_stdlib_index_path()
+
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                artifact: Dict[str, Any] = pickle.load(f)
+            if artifact.get("key") == get_stdlib_key(stdlib):
+                return artifact["recipes"]
+        except Exception:
+            # A corrupt or incompatible index is the same as a stale one, it just means we have to parse.
+            pass
+
+    return parse_stdlib_recipe_index(stdlib)
+
+
+if __name__ == "__main__":
+    compile_stdlib(get_stdlib_index_path())
+    print(f"Wrote stdlib index to {get_stdlib_index_path()}")
@@ -1,28 +1,262 @@
-from dataclasses import dataclass
-import pathlib
+import atexit
+import json
+import os
+import sys
+import threading
 import time
-from typing import Literal
+from dataclasses import dataclass
+from queue import Empty, Queue
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional, Tuple
+
+Method = Literal["setup", "is_setup"]
+Stream = Literal["stdout", "stderr"]
+
+# A target's output is written once this much of it is buffered, when the target finishes, or when nothing has been
+# written for a little while, whichever comes first. The last one bounds how much output a crash can lose.
+CHUNK_SIZE = 2**16
+FLUSH_INTERVAL = 1.0
+
+INDEX_NAME = "index.jsonl"
+
+
+def get_archive_name(compress: bool) -> str:
+    return "output.log.gz" if compress else "output.log"
+
+
+@dataclass
+class _Message:
+    kind: Literal["line", "finish", "flush", "close"]
+    target: str = ""
+    method: Method = "setup"
+    stream: Stream = "stdout"
+    text: str = ""
+    code: int = 0
+    done: Optional[threading.Event] = None  # Set once a flush or close is done
 
 
-@dataclass(frozen=True)
 class TargetLogger:
-    log_dir: str
-    current_ms_time: int = int(time.time() * 1000)
+    """
+    Keeps the output of every target in a run, successful or not, in a single append only archive at
+    {log_dir}/{run}/output.log.gz. Output is handed off as it's produced and a background thread writes it, so
+    logging never blocks the commands.
+
+    Each chunk of a target's stdout or stderr is its own gzip member, so the archive as a whole is still a valid gzip
+    file that zcat can print, and index.jsonl next to it records the offset of every chunk and the exit code of every
+    target. read_log uses the index to read one target's output without scanning the rest of the archive.
+    """
+
+    def __init__(self, log_dir: str, compress: bool = True, current_ms_time: Optional[int] = None) -> None:
+        self.log_dir = log_dir
+        self.compress = compress
+        self.current_ms_time = current_ms_time if current_ms_time is not None else int(time.time() * 1000)
+        self._queue: "Queue[_Message]" = Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.error: Optional[Exception] = None  # Why the writer stopped, like a log dir that can't be written to
+
+    @property
+    def run_dir(self) -> str:
+        return os.path.join(self.log_dir, str(self.current_ms_time))
+
+    def _put(self, message: _Message) -> None:
+        with self._lock:
+            if self.error is not None:
+                # Logging is best effort. Once the writer failed, everything else is dropped instead of waited on.
+                if message.done is not None:
+                    message.done.set()
+                return
+
+            if self._thread is None or not self._thread.is_alive():
+                # Started the first time that there's something to log so that runs with nothing to log don't create
+                # a log dir at all, and again if something is logged after closing.
+                if self._thread is None:
+                    atexit.register(self.close)
+                self._thread = threading.Thread(target=self._write_loop, name="booty-logger", daemon=True)
+                self._thread.start()
+            self._queue.put(message)
+
+    def write(self, target: str, method: Method, stdout: Optional[str], stderr: Optional[str]) -> None:
+        """
+        Log a line of a target's output. This can be called from any thread.
+        """
+        if stdout is not None:
+            self._put(_Message("line", target, method, "stdout", stdout))
+        if stderr is not None:
+            self._put(_Message("line", target, method, "stderr", stderr))
+
+    def finish(self, target: str, method: Method, code: int) -> None:
+        """
+        Record that a target's method finished, which also writes any of its output that's still buffered.
+        """
+        self._put(_Message("finish", target, method, code=code))
+
+    def log(self, target: str, method: Method, stdout: Iterable[str], stderr: Iterable[str], code: int = -1) -> None:
+        """
+        Log all of the output of a target's method at once, for output that wasn't streamed as it was produced.
+        """
+        for line in stdout:
+            self.write(target, method, line, None)
+        for line in stderr:
+            self.write(target, method, None, line)
+        self.finish(target, method, code)
+
+    def log_setup(self, target: str, stdout: Iterable[str], stderr: Iterable[str], code: int = -1) -> None:
+        self.log(target, "setup", stdout, stderr, code)
+
+    def log_is_setup(self, target: str, stdout: Iterable[str], stderr: Iterable[str], code: int = -1) -> None:
+        self.log(target, "is_setup", stdout, stderr, code)
+
+    def flush(self) -> None:
+        """
+        Wait for everything that was logged so far to be written.
+        """
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._put(_Message("flush", done=done))
+        done.wait()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self.error is not None:
+                return
+            done = threading.Event()
+            self._queue.put(_Message("close", done=done))
+        done.wait()
+
+    def _write_loop(self) -> None:
+        try:
+            self._write()
+        except Exception as e:
+            with self._lock:
+                self.error = e
+                # Nothing is going to write what's left, so whoever is waiting on it can stop.
+                while not self._queue.empty():
+                    message = self._queue.get_nowait()
+                    if message.done is not None:
+                        message.done.set()
+            print(f"booty: Stopped logging to {self.run_dir}: {e}", file=sys.stderr)
+
+    def _write(self) -> None:
+        os.makedirs(self.run_dir, exist_ok=True)
+        writer = _ArchiveWriter(self.run_dir, self.compress)
+        last_flush = time.monotonic()
+        try:
+            while True:
+                if time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                    # Even while some target keeps printing, everyone else's output still gets written regularly.
+                    writer.flush_all()
+                    last_flush = time.monotonic()
+
+                try:
+                    message = self._queue.get(timeout=FLUSH_INTERVAL)
+                except Empty:
+                    continue
+
+                if message.kind == "line":
+                    writer.add(message.target, message.method, message.stream, message.text)
+                elif message.kind == "finish":
+                    writer.finish(message.target, message.method, message.code)
+                else:
+                    writer.flush_all()
+                    if message.done is not None:
+                        message.done.set()
+                    if message.kind == "close":
+                        return
+        finally:
+            writer.close()
+
+
+_Key = Tuple[str, Method, Stream]
+
+
+class _ArchiveWriter:
+    def __init__(self, run_dir: str, compress: bool) -> None:
+        self.compress = compress
+        path = os.path.join(run_dir, get_archive_name(compress))
+        self.archive = open(path, "ab")
+        self.offset = os.path.getsize(path)
+        self.index = open(os.path.join(run_dir, INDEX_NAME), "a")
+        self.buffers: Dict[_Key, List[str]] = {}
+        self.sizes: Dict[_Key, int] = {}
+
+    def add(self, target: str, method: Method, stream: Stream, line: str) -> None:
+        key = (target, method, stream)
+        self.buffers.setdefault(key, []).append(line)
+        self.sizes[key] = self.sizes.get(key, 0) + len(line) + 1
+        if self.sizes[key] >= CHUNK_SIZE:
+            self.flush(key)
+
+    def finish(self, target: str, method: Method, code: int) -> None:
+        for stream in ["stdout", "stderr"]:
+            key: _Key = (target, method, stream)  # type: ignore
+            if key in self.buffers:
+                self.flush(key)
+        self._index({"target": target, "method": method, "code": code})
+
+    def flush(self, key: _Key) -> None:
+        target, method, stream = key
+        lines = self.buffers.pop(key)
+        del self.sizes[key]
+
+        # The header makes the whole archive readable on its own, read_log skips it.
+        data = "".join([f"=== {target} {method} {stream} ===\n", *[f"{line}\n" for line in lines]]).encode(errors="replace")
+        if self.compress:
+            import gzip
+
+            data = gzip.compress(data, compresslevel=6)
+
+        self.archive.write(data)
+        self.archive.flush()
+        self._index({"target": target, "method": method, "stream": stream, "offset": self.offset, "length": len(data)})
+        self.offset += len(data)
+
+    def flush_all(self) -> None:
+        for key in list(self.buffers.keys()):
+            self.flush(key)
+
+    def _index(self, entry: Dict[str, Any]) -> None:
+        self.index.write(json.dumps(entry) + "\n")
+        self.index.flush()
+
+    def close(self) -> None:
+        self.archive.close()
+        self.index.close()
+
+
+def read_index(run_dir: str) -> List[Dict[str, Any]]:
+    entries: List[Dict[str, Any]] = []
+    with open(os.path.join(run_dir, INDEX_NAME)) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break  # The last line can be partially written if booty crashed
+    return entries
+
+
+def read_log(run_dir: str, target: str, method: Method = "setup", stream: Stream = "stdout") -> Iterator[str]:
+    """
+    The lines of one target's output from a run's archive, read chunk by chunk using the index.
+    """
+    compress = os.path.exists(os.path.join(run_dir, get_archive_name(True)))
+    chunks = [it for it in read_index(run_dir) if it.get("target") == target and it.get("method") == method and it.get("stream") == stream]
+
+    with open(os.path.join(run_dir, get_archive_name(compress)), "rb") as f:
+        for chunk in chunks:
+            f.seek(chunk["offset"])
+            data = f.read(chunk["length"])
+            if compress:
+                import gzip
 
-    def log(self, target: str, setup_type: Literal["setup", "is_setup"], stdout: str, stderr: str):
-        dir = f"{self.log_dir}/{self.current_ms_time}/{setup_type}"
-        pathlib.Path(dir).mkdir(parents=True, exist_ok=True)
+                data = gzip.decompress(data)
 
-        with open(f"{dir}/{target}_stdout.log", "w") as f:
-            f.write("=== stdout: ===\n")
-            f.write(stdout)
+            yield from data.decode(errors="replace").split("\n")[1:-1]
 
-        with open(f"{dir}/{target}_stderr.log", "w") as f:
-            f.write("=== stderr: ===\n")
-            f.write(stderr)
 
-    def log_setup(self, target: str, stdout: str, stderr: str):
-        self.log(target, "setup", stdout, stderr)
+if __name__ == "__main__":
+    import sys
 
-    def log_is_setup(self, target: str, stdout: str, stderr: str):
-        self.log(target, "is_setup", stdout, stderr)
+    # python -m booty.target_logger RUN_DIR TARGET [setup|is_setup] [stdout|stderr]
+    for line in read_log(*sys.argv[1:5]):  # type: ignore
+        print(line)
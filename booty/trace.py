@@ -0,0 +1,88 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class Tracer:
+    """
+    Records what booty spends its time on as a timeline in the Trace Event Format, which chrome://tracing and Perfetto
+    can open directly. Every span is drawn on a track. By default that's the track of the thread that recorded it, but
+    spans can go on named tracks too, like the slots that commands run in, so that whatever runs at the same time is
+    easy to see side by side along with the gaps in between.
+
+    A disabled tracer records nothing, so code can trace unconditionally.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self._events: List[Dict[str, Any]] = []
+        self._tracks: Dict[str, int] = {"main": 0}
+        self._lock = threading.Lock()
+
+    def _track_id(self, track: Optional[str]) -> int:
+        if track is None:
+            thread = threading.current_thread()
+            track = "main" if thread is threading.main_thread() else thread.name
+
+        with self._lock:
+            if track not in self._tracks:
+                self._tracks[track] = len(self._tracks)
+            return self._tracks[track]
+
+    def _timestamp(self, perf_counter: float) -> float:
+        return (perf_counter - self.start) * 1_000_000  # Microseconds
+
+    @contextmanager
+    def span(self, name: str, category: str = "booty", track: Optional[str] = None, **args: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Record the time spent in the block. The args show up when the span is selected, and the block can add to them
+        as it goes, like an exit code that's only known at the end.
+        """
+        if not self.enabled:
+            yield args
+            return
+
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add(name, category, start, time.perf_counter(), track, args)
+
+    def add(
+        self, name: str, category: str, start: float, end: float, track: Optional[str] = None, args: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Record a span that was already timed, with start and end from time.perf_counter().
+        """
+        if not self.enabled:
+            return
+
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": self._timestamp(start),
+            "dur": (end - start) * 1_000_000,
+            "pid": 1,
+            "tid": self._track_id(track),
+            "args": args or {},
+        }
+        with self._lock:
+            self._events.append(event)
+
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            metadata: List[Dict[str, Any]] = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": "booty"}}]
+            for track, track_id in self._tracks.items():
+                metadata.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": track_id, "args": {"name": track}})
+                # Tracks are listed in the order that they were first used instead of by name.
+                metadata.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": track_id, "args": {"sort_index": track_id}})
+            return [*metadata, *self._events]
+
+    def save(self, path: str) -> None:
+        import json
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f, default=str)
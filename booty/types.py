@@ -1,7 +1,12 @@
-from collections.abc import Generator
 from dataclasses import dataclass, field
 import re
-from typing import Dict, List, Literal, Sequence, Union
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Union
+
+if TYPE_CHECKING:
+    from lark import ParseTree
+
+    from booty.graph import DependencyGraph
+    from booty.plan import CommandPlan
 
 
 @dataclass
@@ -28,6 +33,10 @@ class TargetDefinition:
 
 TargetNames = str
 
+DependencyIndex = Dict[TargetNames, List[TargetNames]]
+
+ExecutableIndex = Dict[TargetNames, Dict[str, List[Executable]]]
+
 
 def compact_shell_executables(executables: List[Executable]) -> List[Executable]:
     """
@@ -52,50 +61,93 @@ def compact_shell_executables(executables: List[Executable]) -> List[Executable]
     return compacted_executables
 
 
+# A $(( name )) reference to a recipe parameter. Parentheses can't be part of the name, which leaves the shell's own
+# arithmetic like $(( $((count)) + 1 )) alone apart from the reference inside of it.
+_REFERENCE = re.compile(r"\$\(\(\s*([^()]*?)\s*\)\)")
+
+
+@dataclass
+class CommandTemplate:
+    """
+    A shell command from a recipe, split up ahead of time around the references to the recipe's parameters so that
+    filling in the arguments of an invocation is just a join.
+    """
+
+    parts: List[str]  # The text around the references, always one more than there are references
+    references: List[int]  # The index of the parameter that each reference is for
+
+    @staticmethod
+    def compile(command: str, parameters: Sequence[str]) -> "CommandTemplate":
+        parts: List[str] = []
+        references: List[int] = []
+        start = 0
+        for match in _REFERENCE.finditer(command):
+            name = match.group(1)
+            if name not in parameters:
+                continue  # Not one of ours, it's left for the shell
+
+            parts.append(command[start : match.start()])
+            references.append(list(parameters).index(name))
+            start = match.end()
+
+        parts.append(command[start:])
+        return CommandTemplate(parts, references)
+
+    def render(self, arg_values: Sequence[str]) -> str:
+        rendered = [self.parts[0]]
+        for reference, part in zip(self.references, self.parts[1:]):
+            rendered.append(arg_values[reference])
+            rendered.append(part)
+        return "".join(rendered)
+
+
 @dataclass
 class RecipeDefinition:
     name: str
     defs: Dict[str, List[Executable]] = field(default_factory=dict)
     parameters: Sequence[str] = field(default_factory=list)
 
-    def get_setup_commands(self, args: Sequence[Sequence[str]], recipes: Dict[str, "RecipeDefinition"]) -> List[str]:
-        return list(self.iter_commands(args, self.defs["setup"], recipes, method="setup"))
-
-    def get_is_setup_commands(self, args: Sequence[Sequence[str]], recipes: Dict[str, "RecipeDefinition"]) -> List[str]:
-        return list(self.iter_commands(args, self.defs["is_setup"], recipes, method="is_setup"))
-
-    def iter_commands(
-        self,
-        args: Sequence[Sequence[str]],
-        executables: List[Executable],
-        recipes: Dict[str, "RecipeDefinition"],
-        method: Literal["setup", "is_setup"],
-    ) -> Generator[str, None, None]:
-        for executable in executables:
-            if isinstance(executable, ShellCommand):
-                # Substitute the arguments into the shell command by replacing $(( ... )) with the argument.
-                command = executable.command
-                final_command = self._substitute_arg_values(command, self.parameters, args)
-                yield final_command
-            else:
-                # this path ends up happening when executing a recipe that calls another recipe.
-                recipe = recipes[executable.name]
-                yield from recipe.iter_commands(executable.args, recipe.defs[method], recipes, method=method)
 
-    def _substitute_arg_values(self, command: str, arg_names: Sequence[str], args: Sequence[Sequence[str]]) -> str:
-        """
-        Commands can reference variables by using $(( ... )) syntax. If a command has $(( arg1 )) then
-        and arg1 is the first argument in args_names, then the first value in args will be substituted
-        into the command.
-        """
+RecipeDefinitionIndex = Dict[str, RecipeDefinition]
 
-        arg_values = [" ".join(it) for it in args]
 
-        for i, arg_name in enumerate(arg_names):
-            # Create a regex pattern that allows for optional whitespace
-            pattern = r"\$\(\(\s*" + re.escape(arg_name) + r"\s*\)\)"
+@dataclass
+class ConfigIndex:
+    """
+    Everything that booty needs out of a parsed config file.
+
+    executables is a dictionary of target names to a dictionary of recipe methods to executables.
+    For example:
 
-            # Use re.sub() for replacement
-            command = re.sub(pattern, arg_values[i], command)
+    {
+        "pyenv": {
+            "setup": [ShellCommand("apt install ..."), RecipeInvocation("curl", ["https://pyenv.run", "|", "bash"])],
+            "is_setup": [ShellCommand("which pyenv")]
+        },
+        "pipx": {
+            "recipe": [RecipeInvocation("apt", ["install", "pipx"])]
+        }
+    }
 
-        return command
+    The pipx target is just a recipe invocation. The parser enforces that it will only have a single RecipeInvocation in that case.
+
+    dependencies maps each target to the targets that it depends on, recipes maps recipe names to their definitions, and
+    includes has the paths of other config files that this one includes, exactly as they were written.
+    """
+
+    executables: ExecutableIndex
+    dependencies: DependencyIndex
+    recipes: RecipeDefinitionIndex
+    includes: List[str] = field(default_factory=list)
+
+
+@dataclass
+class BootyData:
+    execution_index: ExecutableIndex
+    dependency_index: DependencyIndex
+    recipe_index: RecipeDefinitionIndex
+    G: "DependencyGraph"
+    ast: Optional["ParseTree"] = None  # Not available when the data was loaded from the ConfigCache
+    # The final commands of each target, see make_plan. Targets that aren't in it yet are planned the first time that
+    # their commands are needed.
+    plan: "CommandPlan" = field(default_factory=dict)
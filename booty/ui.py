@@ -1,5 +1,6 @@
 from typing import Any, Callable, List, Optional, Union
 from datetime import datetime
+import time
 from rich.text import Text
 from rich.tree import Tree
 
@@ -68,12 +69,38 @@ class StdTree:
         return cmd_height + stdout_height + stderr_height
 
 
+class TargetRow:
+    """
+    The cells of a table row for a target that's running, so they can be updated while other targets run too.
+    """
+
+    def __init__(self, target: str, status: str, cmd: str, expected: Optional[float] = None) -> None:
+        self.target_text = Text(target)
+        self.status_text = Text(status)
+        self.tree = StdTree(cmd)
+        self.time_text = Text("")  # Make update in real time
+        self.start_time = time.perf_counter()
+        self.expected = expected  # How long the target usually takes, if it has a history
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def update_time(self) -> None:
+        elapsed = self.elapsed()
+        if self.expected is None:
+            self.time_text.plain = f"{elapsed:.2f}s"
+        elif elapsed <= self.expected:
+            self.time_text.plain = f"{elapsed:.1f}s ~{self.expected - elapsed:.0f}s left"
+        else:
+            self.time_text.plain = f"{elapsed:.1f}s +{elapsed - self.expected:.0f}s over"
+
+
 class Padder:
     def __init__(self) -> None:
         self._max_padding = 0
 
-    def get_padding(self, tree: StdTree) -> int:
-        height = tree.height()
+    def get_padding(self, *trees: StdTree) -> int:
+        height = sum(tree.height() for tree in trees)
         self._max_padding = max(self._max_padding, height)
         return self._max_padding - height
 
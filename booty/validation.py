@@ -1,8 +1,13 @@
-from booty.execute import BootyData
-from booty.types import RecipeInvocation
+from typing import List
+
+from booty.options import DURATION_OPTIONS, TARGET_OPTIONS, get_option_value, parse_duration
+from booty.types import BootyData, Executable, RecipeInvocation, ShellCommand
 
 
 def validate(data: BootyData) -> None:
+    if "include" in data.execution_index:
+        raise Exception("'include' is reserved for including other config files, it can't be the name of a target.")
+
     for target in data.G.iterator():
         exec = data.execution_index.get(target)
         if exec is None:
@@ -26,16 +31,36 @@ def validate(data: BootyData) -> None:
             if len(exec["is_setup"]) == 0:
                 raise Exception(f"Executable '{target}' has empty is_setup, don't know how to test for install status.")
 
-    cycle = data.G.find_first_cycle()
-    if cycle:
-        raise Exception(f"Cycles detected in dependency graph, cannot continue. {cycle}")
+    cycles = data.G.find_cycles()
+    if cycles:
+        # Written the same way as dependencies in the config, `a -> b` means that a depends on b.
+        cycle_strings = "\n".join(f"  {' -> '.join(reversed(cycle))}" for cycle in cycles)
+        raise Exception(f"Cycles detected in dependency graph, cannot continue.\n{cycle_strings}")
 
-    # validate that all recipe invocations ivoke recipe that exist
+    # validate that all recipe invocations ivoke recipe that exist, including the ones inside of recipes, and that the
+    # recipes define the method that they're invoked for
     for target, exec in data.execution_index.items():
-        if "recipe" in exec:
-            for executable in exec["recipe"]:
-                if isinstance(executable, RecipeInvocation) and executable.name not in data.recipe_index:
-                    raise Exception(f"Recipe '{executable.name}' invoked by target '{target}' does not exist.")
+        for method in ["setup", "is_setup"]:
+            for executable in exec[method] if method in exec else exec.get("recipe", []):
+                if isinstance(executable, RecipeInvocation):
+                    _validate_invocation(data, f"target '{target}'", executable, method, [])
+
+    # validate that batch methods are plain shell, they're run once for many invocations so there are no args to pass on
+    for recipe in data.recipe_index.values():
+        for method, executables in recipe.defs.items():
+            if method.endswith("_batch") and not all(isinstance(it, ShellCommand) for it in executables):
+                raise Exception(f"Recipe '{recipe.name}' can only use shell commands in {method}, not recipe invocations.")
+
+    # validate that options are plain values
+    for target, exec in data.execution_index.items():
+        for option in TARGET_OPTIONS:
+            if option in exec:
+                _validate_option(f"Target '{target}'", option, exec[option])
+
+    for recipe in data.recipe_index.values():
+        for option in TARGET_OPTIONS:
+            if option in recipe.defs:
+                _validate_option(f"Recipe '{recipe.name}'", option, recipe.defs[option])
 
     # validate that the number of args passed into each recipe invocation matches the number of args in the recipe
     for target, exec in data.execution_index.items():
@@ -47,3 +72,30 @@ def validate(data: BootyData) -> None:
                         raise Exception(
                             f"Recipe '{executable.name}' invoked by target '{target}' has {len(recipe.parameters)} args but was invoked with {len(executable.args)} args."
                         )
+
+
+def _validate_invocation(data: BootyData, invoker: str, invocation: RecipeInvocation, method: str, stack: List[str]) -> None:
+    recipe = data.recipe_index.get(invocation.name)
+    if recipe is None:
+        raise Exception(f"Recipe '{invocation.name}' invoked by {invoker} does not exist.")
+    if invocation.name in stack:
+        raise Exception(f"Recipe '{invocation.name}' invokes itself: {' -> '.join([*stack, invocation.name])}.")
+    if method not in recipe.defs:
+        raise Exception(f"Recipe '{invocation.name}' invoked by {invoker} has no {method} method.")
+
+    for executable in recipe.defs[method]:
+        if isinstance(executable, RecipeInvocation):
+            _validate_invocation(data, f"recipe '{invocation.name}'", executable, method, [*stack, invocation.name])
+
+
+def _validate_option(owner: str, option: str, executables: List[Executable]) -> None:
+    if not all(isinstance(it, ShellCommand) for it in executables):
+        raise Exception(f"{owner} can only use a value for {option}, not recipe invocations.")
+
+    if option not in DURATION_OPTIONS:
+        return
+
+    try:
+        parse_duration(get_option_value(executables))
+    except ValueError as e:
+        raise Exception(f"{owner} has an invalid {option}. {e}")
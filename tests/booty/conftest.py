@@ -0,0 +1,29 @@
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+
+from booty.app import App
+from booty.target_logger import TargetLogger
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """
+    Keep the status cache, the run history, and everything else that goes in the cache dir out of the real one.
+    """
+    path = tmp_path / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(path))
+    return path
+
+
+@pytest.fixture
+def make_app(tmp_path: Path) -> Callable[..., App]:
+    """
+    Make an App for the install.booty in tmp_path, logging to tmp_path/logs and without the config cache.
+    """
+
+    def make(**kwargs: Any) -> App:
+        return App(str(tmp_path / "install.booty"), TargetLogger(str(tmp_path / "logs")), use_cache=False, **kwargs)
+
+    return make
@@ -1,6 +1,17 @@
-from typing import Set
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Set
+
+import pytest
+
 from booty.app import App
-from booty.target_logger import TargetLogger
+from booty.history import RunHistory
+from booty.options import get_resources
+from booty.target_logger import TargetLogger, read_log
+from booty.trace import Tracer
 
 
 def test_sample_bfs_iterator():
@@ -31,3 +42,314 @@ def test_sample_bfs_walk():
         skipped = e.value
 
     assert skipped == []
+
+
+def test_status_checks_run_concurrently(tmp_path: Path, make_app: Callable[..., App], capsys: pytest.CaptureFixture[str]):
+    config = tmp_path / "install.booty"
+    config.write_text(
+        "".join(f"t{i}:\n    setup: true\n    is_setup: sleep 0.5 && exit {i % 3}\n\n" for i in range(6)),
+    )
+    app = make_app()
+
+    start = time.perf_counter()
+    result = app.status(jobs=6)
+
+    assert time.perf_counter() - start < 1.5
+    assert sorted(result.installed) == ["t0", "t3"]
+    assert sorted(result.missing) == ["t1", "t4"]
+    assert sorted(result.errors) == ["t2", "t5"]
+    assert len(capsys.readouterr().out.splitlines()) == 6
+
+
+def test_select_restricts_status(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(
+        "".join(f"{name}:\n    setup: true\n    is_setup: true\n\n" for name in ["a", "b", "c", "d"]) + "a -> b\nb -> c\n",
+    )
+    app = make_app()
+    app.select(["b"], with_deps=True)
+
+    assert sorted(app.status().installed) == ["b", "c"]
+
+
+batch_config = """
+recipe marker(name):
+    setup: touch {dir}/$((name))
+    is_setup: exit 3
+    is_setup_batch:
+        echo batch >> {dir}/batches
+        while IFS= read -r name; do
+            if test -e {dir}/$name; then echo 0; else echo 1; fi
+        done
+
+a: marker(a)
+b: marker(b)
+c:
+    setup: true
+    is_setup: true
+"""
+
+
+def test_status_batches_recipe_invocations(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(batch_config.format(dir=tmp_path))
+    (tmp_path / "a").touch()
+    app = make_app()
+
+    result = app.status()
+
+    # The is_setup for each target would have been an error, so these came from one batch.
+    assert sorted(result.installed) == ["a", "c"]
+    assert result.missing == ["b"]
+    assert (tmp_path / "batches").read_text() == "batch\n"
+
+    app.logger.flush()
+    assert list(read_log(app.logger.run_dir, "marker_batch", "is_setup")) == ["0", "1"]
+
+
+def test_status_falls_back_when_the_batch_fails(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(batch_config.format(dir=tmp_path).replace("echo batch >>", "exit 5; echo batch >>"))
+    app = make_app()
+
+    result = app.status()
+
+    assert sorted(result.errors) == ["a", "b"]
+    assert result.installed == ["c"]
+
+
+def test_status_falls_back_when_the_batch_times_out(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(
+        batch_config.format(dir=tmp_path)
+        .replace("echo batch >>", "sleep 60; echo batch >>")
+        .replace("is_setup: exit 3", f"is_setup: test -e {tmp_path}/$((name))\n    is_setup_timeout: 0.5")
+    )
+    app = make_app()
+
+    start = time.monotonic()
+    result = app.status()
+
+    assert time.monotonic() - start < 10
+    assert sorted(result.installed) == ["c"]
+    assert sorted(result.missing) == ["a", "b"]
+    assert result.timeouts == []
+
+
+coalesce_config = """
+recipe marker(name):
+    setup: touch {dir}/$((name))
+    is_setup: test -e {dir}/$((name))
+    setup_batch:
+        echo batch >> {dir}/batches
+        while IFS= read -r name; do
+            touch {dir}/$name
+        done
+
+a: marker(a)
+b: marker(b)
+c: marker(c)
+c -> a
+"""
+
+
+def test_install_coalesces_ready_targets(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(coalesce_config.format(dir=tmp_path))
+    app = make_app()
+
+    result = app.install_missing(app.status(), coalesce=True)
+
+    # a and b are ready together, c has to wait for a so it's set up on its own.
+    assert sorted(result.installed) == ["a", "b", "c"]
+    assert result.errors == []
+    assert (tmp_path / "batches").read_text() == "batch\n"
+
+
+def test_install_sets_up_separately_when_the_batch_fails(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(coalesce_config.format(dir=tmp_path).replace("echo batch >>", "exit 1; echo batch >>").replace("c -> a\n", ""))
+    app = make_app()
+
+    result = app.install_missing(app.status(), coalesce=True)
+
+    assert sorted(result.installed) == ["a", "b", "c"]
+    assert result.errors == []
+    assert not (tmp_path / "batches").exists()
+
+
+ttl_config = """
+counted:
+    setup: true
+    is_setup: echo check >> {dir}/checks
+    status_ttl: {ttl}
+
+uncached:
+    setup: true
+    is_setup: true
+"""
+
+
+def count_checks(tmp_path: Path) -> int:
+    return len((tmp_path / "checks").read_text().splitlines())
+
+
+def test_status_reuses_cached_results(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(ttl_config.format(dir=tmp_path, ttl="1h"))
+    app = make_app()
+
+    assert app.status().cached == []
+    result = app.status()
+    assert sorted(result.installed) == ["counted", "uncached"]
+    assert result.cached == ["counted"]
+    assert count_checks(tmp_path) == 1
+
+    assert app.status(refresh=True).cached == []
+    assert count_checks(tmp_path) == 2
+
+    # Changing the is_setup invalidates the cached result.
+    config.write_text(ttl_config.format(dir=tmp_path, ttl="1h").replace("echo check", "echo check  "))
+    app = make_app()
+    assert app.status().cached == []
+    assert count_checks(tmp_path) == 3
+
+
+def test_status_cache_expires(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(ttl_config.format(dir=tmp_path, ttl="0s"))
+    app = make_app()
+
+    app.status()
+    assert app.status().cached == []
+    assert count_checks(tmp_path) == 2
+
+
+def test_status_cache_is_only_written_when_it_changes(tmp_path: Path, cache_dir: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(ttl_config.format(dir=tmp_path, ttl="1h"))
+    app = make_app()
+    app.status()
+    status_file = cache_dir / "booty" / "status.json"
+    os.utime(status_file, (0, 0))
+
+    assert app.status().cached == ["counted"]
+    assert status_file.stat().st_mtime == 0
+
+    # The result for the old is_setup is forgotten once it changes.
+    config.write_text(ttl_config.format(dir=tmp_path, ttl="1h").replace("echo check", "echo check  "))
+    app = make_app()
+    app.status()
+    assert list(json.loads(status_file.read_text())) == [app._status_key("counted")]
+
+
+def test_install_times_out_targets(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text("""
+hangs:
+    setup: sleep 60
+    is_setup: exit 1
+    setup_timeout: 0.2
+
+after:
+    setup: true
+    is_setup: exit 1
+
+after -> hangs
+""")
+    app = make_app()
+
+    result = app.install_missing(app.status())
+
+    assert result.timeouts == ["hangs"]
+    assert result.installed == []
+    assert result.errors == []
+
+
+def test_status_stops_at_the_deadline(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text("slow:\n    setup: true\n    is_setup: sleep 60\n\nfast:\n    setup: true\n    is_setup: true\n")
+    app = make_app(deadline=0.5)
+
+    result = app.status()
+
+    assert result.timeouts == ["slow"]
+    assert result.installed == ["fast"]
+
+
+def test_install_waits_for_resources(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text(
+        "".join(
+            f"{name}:\n    setup: echo start >> {tmp_path}/{name}; sleep 0.3; echo end >> {tmp_path}/{name}\n    is_setup: exit 1\n"
+            f"    resources: {resources}\n\n"
+            for name, resources in [("a", "lock"), ("b", "lock"), ("c", "other")]
+        )
+    )
+    app = make_app()
+
+    start = time.perf_counter()
+    result = app.install_missing(app.status(), jobs=3)
+
+    assert sorted(result.installed) == ["a", "b", "c"]
+    # a and b take turns with the lock, c can run next to either of them.
+    assert time.perf_counter() - start >= 0.6
+    ends = sorted((tmp_path / name).stat().st_mtime for name in ["a", "b"])
+    assert ends[1] - ends[0] >= 0.25
+
+
+def test_targets_hold_the_resources_of_their_recipes(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text("""
+packages: apt(git)
+
+custom:
+    setup:
+        apt(git)
+        echo done
+    is_setup: true
+    resources: other
+""")
+    app = make_app()
+
+    assert get_resources(app.data, "packages") == ["dpkg", "network"]
+    assert get_resources(app.data, "custom") == ["dpkg", "network", "other"]
+
+
+def test_trace_puts_concurrent_commands_on_separate_tracks(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text("".join(f"t{i}:\n    setup: true\n    is_setup: sleep 0.2 && exit {i % 2}\n\n" for i in range(3)))
+    tracer = Tracer()
+    app = make_app(tracer=tracer)
+
+    app.status(jobs=2)
+    tracer.save(str(tmp_path / "trace.json"))
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    tracks = {it["tid"]: it["args"]["name"] for it in events if it["name"] == "thread_name"}
+    spans = [it for it in events if it["ph"] == "X"]
+    assert {"load config files", "validate", "plan", "status"} <= {it["name"] for it in spans if tracks[it["tid"]] == "main"}
+
+    commands = sorted([it for it in spans if it["cat"] == "is_setup"], key=lambda it: it["ts"])
+    assert [it["name"] for it in commands] == ["t0", "t1", "t2"]
+    assert [it["args"]["code"] for it in commands] == [0, 1, 0]
+    assert {tracks[it["tid"]] for it in commands} == {"slot 1", "slot 2"}
+    # t2 only starts once a slot is free, on the track of the command that it replaced.
+    assert commands[0]["tid"] != commands[1]["tid"]
+    previous = next(it for it in commands[:2] if it["tid"] == commands[2]["tid"])
+    assert commands[2]["ts"] >= previous["ts"] + previous["dur"]
+
+
+def test_install_records_history(tmp_path: Path, make_app: Callable[..., App]):
+    config = tmp_path / "install.booty"
+    config.write_text("ok:\n    setup: echo hello\n    is_setup: exit 1\n\nbad:\n    setup: exit 2\n    is_setup: exit 1\n")
+    history = RunHistory(str(tmp_path / "history.sqlite3"))
+    app = make_app(history=history)
+
+    app.install_missing(app.status())
+
+    assert history.medians("is_setup") == {}  # Neither of them was installed
+    assert set(history.medians("setup")) == {"ok"}
+    with sqlite3.connect(history.path) as db:
+        rows = db.execute("SELECT target, code, stdout_size FROM results WHERE method = 'setup' ORDER BY target").fetchall()
+    assert rows == [("bad", 2, 0), ("ok", 0, len("hello\n"))]
@@ -0,0 +1,99 @@
+import gc
+import time
+from typing import Dict, List, Tuple
+
+from lark import Token, Tree
+
+from booty.ast_util import ConfigIndex, index_config
+from booty.parser import parse
+from booty.types import RecipeInvocation, ShellCommand
+
+
+def test_index_config():
+    config = """
+recipe foo(a b):
+    setup:
+        echo $((a))
+        bar(x, y z)
+    is_setup: bar(1, 2)
+
+a: foo(x y, z)
+b:
+    setup: foo(1, 2)
+    is_setup:
+        test -f 1
+        test -f 2
+a -> b
+b <- c
+"""
+    index = index_config(parse(config))
+
+    assert index.executables == {
+        "a": {"recipe": [RecipeInvocation("foo", [["x", "y"], ["z"]])]},
+        "b": {"setup": [RecipeInvocation("foo", [["1"], ["2"]])], "is_setup": [ShellCommand("test -f 1\ntest -f 2")]},
+    }
+    assert index.dependencies == {"a": ["b"], "b": [], "c": ["b"]}
+    assert index.recipes["foo"].parameters == ["a", "b"]
+    assert index.recipes["foo"].defs == {
+        "setup": [ShellCommand("echo $((a))"), RecipeInvocation("bar", [["x"], ["y", "z"]])],
+        "is_setup": [RecipeInvocation("bar", [["1"], ["2"]])],
+    }
+
+
+def _shell_def(implements: str, command: str) -> Tree[Token]:
+    return Tree(
+        "single_line_def",
+        [Tree("implements", [Token("IMPLEMENTS_NAME", f"    {implements}")]), Tree("shell_line", [Token("SHELL_LINE", f" {command}")])],
+    )
+
+
+def _config_tree(n_targets: int) -> Tree[Token]:
+    """
+    Build the tree that parsing a config with n_targets would produce. Parsing 50k targets takes a lot longer than
+    indexing them so this keeps the test fast.
+    """
+    statements: List[Tree[Token]] = []
+    for i in range(n_targets):
+        name = Tree("target_name", [Token("NAME", f"target_{i}")])
+        if i % 2 == 0:
+            params = [
+                Tree("recipe_parameter", [Token("INVOCATION_ARGS", f"~/files/{i}")]),
+                Tree("recipe_parameter", [Token("INVOCATION_ARGS", f"~/{i}")]),
+            ]
+            invocation = Tree("recipe_invocation", [Token("INVOCATION_NAME", "ln"), Tree("recipe_parameter_list", params)])
+            statements.append(Tree("target", [name, invocation]))
+        else:
+            defs = Tree("defs", [_shell_def("setup", f"touch /tmp/{i}"), _shell_def("is_setup", f"test -f /tmp/{i}")])
+            statements.append(Tree("target", [name, defs]))
+            statements.append(Tree("dependency", [Tree("depends_on", [Token("NAME", f"target_{i}"), Token("NAME", f"target_{i - 1}")])]))
+
+    return Tree("start", statements)
+
+
+def _index_time(tree: Tree[Token], repeat: int) -> Tuple[float, ConfigIndex]:
+    times: List[float] = []
+    index = ConfigIndex({}, {}, {})
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()  # Collections triggered by the allocations would show up as noise that scales with the tree size
+        try:
+            start = time.perf_counter()
+            index = index_config(tree)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    return min(times), index
+
+
+def test_index_scales_linearly():
+    sizes = [100, 1_000, 10_000, 50_000]
+    per_target: Dict[int, float] = {}
+    for size in sizes:
+        index_time, index = _index_time(_config_tree(size), repeat=5 if size <= 1_000 else 1)
+        per_target[size] = index_time / size
+        assert len(index.executables) == size
+
+    # Quadratic behavior would make the per target cost grow 500x between 100 and 50k targets. Allow for a lot of noise.
+    assert per_target[50_000] < 4 * per_target[100], per_target
+    assert per_target[50_000] < 4 * per_target[1_000], per_target
@@ -0,0 +1,70 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from booty import parser
+from booty.app import App
+from booty.cache import ConfigCache, get_config_key, load_cached, save_atomically
+from booty.target_logger import TargetLogger
+from booty.types import ConfigIndex
+
+
+def test_roundtrip_drops_ast(tmp_path: Path):
+    app = App("examples/install.booty", TargetLogger("./logs"), use_cache=False)
+    cache = ConfigCache(str(tmp_path))
+
+    assert cache.load("key") is None
+    cache.save("key", app.data)
+    loaded = cache.load("key")
+
+    assert loaded is not None
+    assert loaded.ast is None
+    assert loaded.execution_index == app.data.execution_index
+    assert loaded.dependency_index == app.data.dependency_index
+    assert loaded.recipe_index == app.data.recipe_index
+    assert loaded.G == app.data.G
+
+
+def test_app_uses_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    first = App("examples/install.booty", TargetLogger("./logs"))
+
+    monkeypatch.setattr(parser, "parse", lambda _: pytest.fail("Shouldn't parse an unchanged config"))
+    second = App("examples/install.booty", TargetLogger("./logs"))
+
+    assert second.data.ast is None
+    assert second.data.execution_index == first.data.execution_index
+
+
+def test_key_changes_with_config():
+    assert get_config_key("a: apt(a)\n") == get_config_key("a: apt(a)\n")
+    assert get_config_key("a: apt(a)\n") != get_config_key("a: apt(b)\n")
+
+
+def test_cache_files_are_replaced_whole(tmp_path: Path):
+    path = str(tmp_path / "nested" / "status.json")
+    assert load_cached(path, json.load) is None
+
+    save_atomically(path, b'{"a": 1}')
+    assert load_cached(path, json.load) == {"a": 1}
+    assert [it.name for it in (tmp_path / "nested").iterdir()] == ["status.json"]
+
+    (tmp_path / "nested" / "status.json").write_text("{")
+    assert load_cached(path, json.load) is None
+
+
+def test_only_the_most_recently_used_entries_are_kept(tmp_path: Path):
+    cache = ConfigCache(str(tmp_path), keep=2)
+    index = ConfigIndex({}, {}, {})
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.save_file_index(key, index)
+        os.utime(tmp_path / "files" / f"{key}.pickle", (i, i))
+    assert cache.load_file_index("a") is None
+
+    # Using an entry keeps it around.
+    assert cache.load_file_index("b") is not None
+    cache.save_file_index("d", index)
+
+    assert sorted(os.listdir(tmp_path / "files")) == ["b.pickle", "d.pickle"]
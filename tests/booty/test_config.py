@@ -0,0 +1,88 @@
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from booty import parser
+from booty.cache import ConfigCache
+from booty.config import load_config_files, merge_config_indexes
+from booty.types import RecipeInvocation, ShellCommand
+
+
+def _write(path: Path, content: str) -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return str(path)
+
+
+def test_includes_are_merged_before_the_including_file(tmp_path: Path):
+    root = _write(
+        tmp_path / "install.booty",
+        """include teams/terminal.booty
+include teams/shared.booty # also included by terminal.booty
+
+nvim -> essentials
+nvim: apt(neovim)
+""",
+    )
+    _write(tmp_path / "teams" / "terminal.booty", "include shared.booty\nterminal -> essentials\nterminal: apt(kitty)\n")
+    _write(
+        tmp_path / "teams" / "shared.booty",
+        """essentials:
+    setup: apt(git)
+    is_setup: which git
+recipe apt(packages):
+    setup: echo $((packages))
+    is_setup: true
+""",
+    )
+
+    files = load_config_files(root)
+    index = merge_config_indexes([it.index for it in files])
+
+    assert [Path(it.path).name for it in files] == ["shared.booty", "terminal.booty", "install.booty"]
+    assert index.executables == {
+        "essentials": {"setup": [RecipeInvocation("apt", [["git"]])], "is_setup": [ShellCommand("which git")]},
+        "terminal": {"recipe": [RecipeInvocation("apt", [["kitty"]])]},
+        "nvim": {"recipe": [RecipeInvocation("apt", [["neovim"]])]},
+    }
+    assert index.dependencies == {"essentials": [], "terminal": ["essentials"], "nvim": ["essentials"]}
+    assert list(index.recipes.keys()) == ["apt"]
+
+
+def test_include_cycles(tmp_path: Path):
+    root = _write(tmp_path / "a.booty", "include b.booty\na: apt(a)\n")
+    _write(tmp_path / "b.booty", "include a.booty\nb: apt(b)\n")
+
+    files = load_config_files(root)
+
+    assert [Path(it.path).name for it in files] == ["b.booty", "a.booty"]
+
+
+def test_missing_include(tmp_path: Path):
+    root = _write(tmp_path / "a.booty", "include nope.booty\n")
+
+    with pytest.raises(Exception, match="nope.booty"):
+        load_config_files(root)
+
+
+def test_only_changed_files_are_parsed(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    root = _write(tmp_path / "install.booty", "include a.booty\ninclude b.booty\nc: apt(c)\n")
+    _write(tmp_path / "a.booty", "a: apt(a)\n")
+    b = _write(tmp_path / "b.booty", "b: apt(b)\n")
+    cache = ConfigCache(str(tmp_path / "cache"))
+    load_config_files(root, cache)
+
+    parsed: List[str] = []
+    parse = parser.parse
+
+    def tracking_parse(text: str):
+        parsed.append(text)
+        return parse(text)
+
+    monkeypatch.setattr(parser, "parse", tracking_parse)
+    _write(Path(b), "b: apt(bb)\n")
+    files = load_config_files(root, cache)
+
+    assert parsed == ["b: apt(bb)\n"]
+    assert files[1].index.executables == {"b": {"recipe": [RecipeInvocation("apt", [["bb"]])]}}
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pytest
+
+from booty.ast_util import index_config
+from booty.execute import TIMEOUT_CODE, CommandExecutor, execute
+from booty.graph import DependencyGraph
+from booty.parser import parse
+from booty.types import BootyData
+
+
+def create_data(config: str) -> BootyData:
+    index = index_config(parse(config))
+    G = DependencyGraph.from_index(index.dependencies)
+    return BootyData(execution_index=index.executables, dependency_index=index.dependencies, recipe_index=index.recipes, G=G)
+
+
+data = create_data("""
+chatty:
+    setup: echo one; echo two >&2; sleep 0.3; echo three
+    is_setup: exit 1
+
+slow:
+    setup: sleep 0.5 && echo slept
+    is_setup: true
+
+long_line:
+    setup: head -c 3000000 /dev/zero | tr '\\0' x; echo; echo after
+    is_setup: true
+""")
+
+
+def test_sync_execute_streams_lines():
+    start = time.perf_counter()
+    lines: List[Tuple[float, Tuple[Optional[str], Optional[str]]]] = []
+    for line in execute(data, "chatty", "setup"):
+        lines.append((time.perf_counter() - start, line))
+
+    assert [it for _, it in lines] == [("one", None), (None, "two"), ("three", None)]
+    # Lines arrive as they're written instead of when the command exits.
+    assert lines[0][0] < 0.25
+    assert lines[2][0] >= 0.25
+
+
+def test_command_executor_codes():
+    cmd = CommandExecutor(data, "chatty", "is_setup")
+    list(cmd.execute())
+    assert cmd.code == 1
+
+    cmd = CommandExecutor(data, "chatty", "setup")
+    list(cmd.execute())
+    assert cmd.code == 0
+    assert cmd.stdout.lines() == ["one", "three"]
+    assert cmd.stderr.lines() == ["two"]
+
+
+def test_long_lines_are_split():
+    cmd = CommandExecutor(data, "long_line", "setup")
+    list(cmd.execute())
+
+    assert cmd.code == 0
+    assert cmd.stdout.spilled
+    assert sum(len(it) for it in cmd.stdout.lines()[:-1]) == 3_000_000
+    assert cmd.stdout.latest(1) == ["after"]
+
+
+def test_async_commands_share_one_loop():
+    async def run(cmd: CommandExecutor) -> None:
+        async for _ in cmd.execute_async():
+            pass
+
+    async def run_all() -> List[CommandExecutor]:
+        cmds = [CommandExecutor(data, "slow", "setup") for _ in range(5)]
+        await asyncio.gather(*[run(it) for it in cmds])
+        return cmds
+
+    start = time.perf_counter()
+    cmds = asyncio.run(run_all())
+
+    assert time.perf_counter() - start < 1.5
+    assert [it.code for it in cmds] == [0] * 5
+    assert [it.stdout.lines() for it in cmds] == [["slept"]] * 5
+
+
+mixed = create_data("""
+recipe say(word):
+    setup: echo $((word))
+    is_setup: true
+
+mixed:
+    setup:
+        echo one
+        cd / && pwd
+        say(hi)
+        pwd
+        echo two >&2
+        exit 7
+        echo unreachable
+    is_setup:
+        if then fi
+""")
+
+
+@pytest.mark.parametrize("single_shell", [False, True])
+def test_single_shell_matches_bash_per_command(single_shell: bool):
+    cmd = CommandExecutor(mixed, "mixed", "setup", single_shell=single_shell)
+    list(cmd.execute())
+
+    # Each command still starts in the original directory and the first failure stops the target.
+    assert cmd.code == 7
+    assert cmd.stdout.lines() == ["one", "/", "hi", os.getcwd()]
+    assert cmd.stderr.lines() == ["two"]
+
+    cmd = CommandExecutor(mixed, "mixed", "is_setup", single_shell=single_shell)
+    list(cmd.execute())
+    assert cmd.code == 2
+
+
+def test_single_shell_keeps_stdin():
+    data = create_data("""
+reader:
+    setup: read line && echo "got $line"
+    is_setup: true
+""")
+
+    # Commands are passed to the shell on their own fd, so whatever booty's stdin is still goes to the commands.
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"hello\n")
+    os.close(write_fd)
+    stdin = os.dup(0)
+    os.dup2(read_fd, 0)
+    try:
+        cmd = CommandExecutor(data, "reader", "setup", single_shell=True)
+        list(cmd.execute())
+    finally:
+        os.dup2(stdin, 0)
+        os.close(stdin)
+        os.close(read_fd)
+
+    assert cmd.stdout.lines() == ["got hello"]
+
+
+@pytest.mark.parametrize("single_shell", [False, True])
+def test_timeout_kills_the_process_group(tmp_path: Path, single_shell: bool):
+    data = create_data(f"""
+hangs:
+    setup: echo started; sleep 60 & echo $! > {tmp_path}/pid; wait
+    is_setup: true
+""")
+
+    start = time.perf_counter()
+    cmd = CommandExecutor(data, "hangs", "setup", single_shell=single_shell, timeout=0.5)
+    list(cmd.execute())
+
+    assert time.perf_counter() - start < 5
+    assert cmd.timed_out
+    assert cmd.code == TIMEOUT_CODE
+    assert cmd.stdout.lines() == ["started"]
+
+    # The background sleep was in the same process group, so it's gone too. It can linger as a zombie until whatever
+    # adopted it reaps it.
+    pid = int((tmp_path / "pid").read_text())
+    assert not is_running(pid)
+
+
+def is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
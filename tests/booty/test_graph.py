@@ -1,5 +1,11 @@
-from typing import List
-from booty.graph import DependencyGraphBuilder
+import random
+import time
+from typing import List, Sequence, Set, Tuple
+
+import pytest
+
+from booty.graph import DependencyGraph, DependencyGraphBuilder, StartNode
+from booty.types import DependencyIndex
 
 
 def test_all_success():
@@ -269,3 +275,163 @@ def test_no_skip():
     )
 
     assert list(graph.iterator(skip_first=False)) == ["a", "b", "c", "d", "f", "e"]
+
+
+def walk(graph: DependencyGraph, failures: Set[str]) -> Tuple[List[str], Sequence[str]]:
+    gen = graph.bfs()
+    targets: List[str] = []
+    try:
+        target = next(gen)
+        while True:
+            targets.append(target)
+            target = gen.send(target not in failures)
+    except StopIteration as e:
+        skipped = e.value
+
+    return targets, skipped
+
+
+def test_diamond_waits_for_both_parents():
+    index: DependencyIndex = {"a": [], "b": ["a"], "slow": ["a"], "slower": ["slow"], "d": ["b", "slower"]}
+    targets, skipped = walk(DependencyGraph.from_index(index), failures=set())
+
+    assert targets == [StartNode, "a", "b", "slow", "slower", "d"]
+    assert skipped == []
+
+
+def random_dag(n: int, seed: int) -> DependencyIndex:
+    rng = random.Random(seed)
+    index: DependencyIndex = {}
+    for i in range(n):
+        deps = rng.sample(range(i), min(i, rng.randint(0, 4)))
+        index[f"t{i}"] = [f"t{it}" for it in deps]
+    return index
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_random_dag(seed: int):
+    index = random_dag(2000, seed)
+    rng = random.Random(seed)
+    failures = set(rng.sample(sorted(index.keys()), 20))
+    targets, skipped = walk(DependencyGraph.from_index(index), failures)
+
+    # Every target runs at most once, and only after all of its dependencies succeeded.
+    assert len(targets) == len(set(targets))
+    position = {target: i for i, target in enumerate(targets)}
+    for target in targets[1:]:
+        for dep in index[target]:
+            assert dep in position and position[dep] < position[target]
+            assert dep not in failures
+
+    # A target is skipped exactly when one of its ancestors failed. The index is already in dependency order.
+    failed_ancestor: Set[str] = set()
+    for target, deps in index.items():
+        if any(dep in failures or dep in failed_ancestor for dep in deps):
+            failed_ancestor.add(target)
+
+    expected_skipped = sorted(failed_ancestor)
+    assert list(skipped) == expected_skipped
+    assert len(targets) - 1 + len(skipped) == len(index)
+
+
+def test_large_graph_is_linear():
+    index: DependencyIndex = {f"t{i}": [f"t{i - 1}"] if i > 0 else [] for i in range(200_000)}
+    graph = DependencyGraph.from_index(index)
+
+    start = time.perf_counter()
+    assert len(list(graph.iterator())) == len(index)
+    # list.pop(0) on a wide graph or a rescan per target would take minutes at this size.
+    assert time.perf_counter() - start < 5
+
+
+def selection_graph() -> DependencyGraph:
+    index: DependencyIndex = {
+        "essentials": [],
+        "git": ["essentials"],
+        "nvim": ["essentials"],
+        "packer": ["nvim", "git"],
+        "plugins": ["packer"],
+        "fonts": [],
+    }
+    return DependencyGraph.from_index(index)
+
+
+def test_ancestors_and_descendants():
+    graph = selection_graph()
+
+    assert graph.parents["packer"] == ["git", "nvim"]
+    assert graph.ancestors(["plugins"]) == {"packer", "nvim", "git", "essentials"}
+    assert graph.ancestors(["essentials"]) == set()
+    assert graph.ancestors(["git", "fonts"]) == {"essentials"}
+    assert graph.descendants(["essentials"]) == {"git", "nvim", "packer", "plugins"}
+    assert graph.descendants(["fonts"]) == set()
+
+
+def test_select():
+    graph = selection_graph()
+
+    assert graph.select(["packer"]) == {"packer"}
+    assert graph.select(["packer"], with_deps=True) == {"packer", "nvim", "git", "essentials"}
+    assert graph.select(["nvim"], downstream=True) == {"nvim", "packer", "plugins"}
+    assert graph.select(["nvim", "fonts"], with_deps=True, downstream=True) == {"essentials", "nvim", "packer", "plugins", "fonts"}
+
+    with pytest.raises(Exception, match="Unknown target 'vim'"):
+        graph.select(["vim"])
+
+
+def test_subgraph():
+    graph = selection_graph()
+    subgraph = graph.subgraph(graph.select(["nvim"], downstream=True))
+
+    # Dependencies outside of the selection are assumed to be set up already.
+    assert list(subgraph.iterator()) == ["nvim", "packer", "plugins"]
+    assert subgraph.parents["packer"] == ["nvim"]
+
+
+def test_levels():
+    graph = selection_graph()
+
+    levels = [sorted(it) for it in graph.levels()]
+    assert levels == [["essentials", "fonts"], ["git", "nvim"], ["packer"], ["plugins"]]
+
+
+def test_find_cycles_reports_every_cycle():
+    index: DependencyIndex = {
+        "a": ["c"],
+        "b": ["a"],
+        "c": ["b"],
+        "d": [],
+        "e": ["d", "f"],
+        "f": ["e"],
+        "g": ["g"],
+        "h": ["a"],
+    }
+    graph = DependencyGraph.from_index(index)
+
+    # Each cycle follows the graph from a dependency to what depends on it.
+    assert graph.find_cycles() == [["c", "a", "b", "c"], ["e", "f", "e"], ["g", "g"]]
+    assert graph.find_first_cycle() != []
+
+
+def test_find_cycles_without_cycles():
+    graph = DependencyGraph.from_index(random_dag(2000, seed=0))
+
+    assert graph.find_cycles() == []
+    assert graph.find_first_cycle() == []
+
+
+def test_cycle_detection_on_deep_graphs():
+    n = 100_000
+    index: DependencyIndex = {f"t{i}": [f"t{i - 1}"] if i > 0 else [] for i in range(n)}
+    graph = DependencyGraph.from_index(index)
+
+    # Far deeper than the recursion limit.
+    start = time.perf_counter()
+    assert graph.find_cycles() == []
+    assert graph.find_first_cycle() == []
+    assert time.perf_counter() - start < 5
+
+    index["t0"] = [f"t{n - 1}"]
+    cycles = DependencyGraph.from_index(index).find_cycles()
+    assert len(cycles) == 1
+    assert len(cycles[0]) == n + 1
@@ -0,0 +1,69 @@
+import sqlite3
+from pathlib import Path
+
+from booty.history import RunHistory, estimate_remaining
+
+
+def test_medians_only_count_recent_successful_runs(tmp_path: Path):
+    history = RunHistory(str(tmp_path / "history.sqlite3"))
+    for duration in [100.0, 1.0, 2.0, 3.0]:
+        history.record("a", "setup", duration, 0)
+    history.record("a", "setup", 50.0, 1)
+    history.record("a", "is_setup", 0.5, 0)
+    history.close()
+
+    history = RunHistory(str(tmp_path / "history.sqlite3"))
+    assert history.medians("setup", window=3) == {"a": 2.0}
+    assert history.medians("is_setup") == {"a": 0.5}
+
+
+def test_regressions_compare_the_latest_run_with_the_ones_before(tmp_path: Path):
+    history = RunHistory(str(tmp_path / "history.sqlite3"))
+    for durations in [[10.0, 1.0], [11.0, 1.0], [9.0, 1.0], [30.0, 1.2]]:
+        history.record("slower", "setup", durations[0], 0)
+        history.record("same", "setup", durations[1], 0)
+    history.record("new", "setup", 100.0, 0)
+
+    targets = {it.target: it for it in history.targets()}
+    assert targets["slower"].latest == 30.0
+    assert targets["slower"].median == 10.0
+    assert targets["new"].median is None
+
+    assert [it.target for it in history.regressions(threshold=1.5)] == ["slower"]
+    assert history.regressions(threshold=1.5, min_runs=4) == []
+
+
+def test_unwritable_history_records_nothing(tmp_path: Path):
+    (tmp_path / "file").write_text("")
+    history = RunHistory(str(tmp_path / "file" / "history.sqlite3"))
+
+    history.record("a", "setup", 1.0, 0)
+    assert history.medians("setup") == {}
+
+
+def test_estimate_remaining():
+    expected = {"a": 10.0, "b": 4.0, "c": 2.0}
+
+    assert estimate_remaining({}, {"a": 1.0}, ["b"], jobs=2) is None
+    # Everything left spread over the jobs.
+    assert estimate_remaining(expected, {"a": 6.0}, ["b", "c"], jobs=2) == 5.0
+    # But never less than the longest running target has left, and d counts as the median.
+    assert estimate_remaining(expected, {"a": 0.0, "d": 1.0}, [], jobs=4) == 10.0
+
+
+def test_only_the_latest_results_of_each_target_are_kept(tmp_path: Path):
+    path = str(tmp_path / "history.sqlite3")
+    history = RunHistory(path, keep=3)
+    history.record("setup_once", "setup", 60.0, 0)
+    history.close()
+
+    for duration in range(5):
+        history = RunHistory(path, keep=3)
+        history.record("cron", "is_setup", float(duration), 0)
+        history.close()
+
+    history = RunHistory(path, keep=3)
+    assert history.medians("setup") == {"setup_once": 60.0}
+    assert history.medians("is_setup") == {"cron": 3.0}
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM runs").fetchone() == (4,)
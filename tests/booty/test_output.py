@@ -0,0 +1,31 @@
+from booty.output import OutputBuffer
+
+
+def test_small_output_stays_in_memory():
+    output = OutputBuffer()
+    for line in ["one", "two", "three"]:
+        output.append(line)
+
+    assert not output.spilled
+    assert output.lines() == ["one", "two", "three"]
+    assert output.text() == "one\ntwo\nthree"
+    assert output.latest(2) == ["two", "three"]
+    assert len(output) == 3
+
+
+def test_large_output_spills_to_a_file():
+    output = OutputBuffer(tail=3, spill_size=100)
+    lines = [f"line {i}" for i in range(1000)] + ["progress\r50%\r100%", ""]
+    for line in lines[:500]:
+        output.append(line)
+
+    assert output.spilled
+    assert output.lines() == lines[:500]
+
+    # Reading it back doesn't get in the way of appending more.
+    for line in lines[500:]:
+        output.append(line)
+
+    assert output.lines() == lines
+    assert output.latest(10) == lines[-3:]
+    assert len(output) == len(lines)
@@ -0,0 +1,88 @@
+from pathlib import Path
+
+from booty.ast_util import get_executable_index, get_recipe_definition_index
+from booty.parser import load_parser, parse, save_parser
+from booty.types import RecipeInvocation, ShellCommand
+
+
+def test_shell_line_that_looks_like_invocation():
+    config = """
+a:
+    setup:
+        echo a
+        foo(bar) && baz
+    is_setup: test -f ~/a:b
+"""
+    executables = get_executable_index(parse(config))
+
+    assert executables == {
+        "a": {
+            "setup": [ShellCommand("echo a\nfoo(bar) && baz")],
+            "is_setup": [ShellCommand("test -f ~/a:b")],
+        }
+    }
+
+
+def test_invocations_in_defs():
+    config = """
+recipe foo(a b):
+    setup:
+        echo $((a))
+        bar(x y)
+    is_setup:bar(1 2)
+
+a: foo(x y, z)
+b:
+    setup: foo(1 2)
+    is_setup: false
+"""
+    ast = parse(config)
+    executables = get_executable_index(ast)
+    recipes = get_recipe_definition_index(ast)
+
+    assert executables == {
+        "a": {"recipe": [RecipeInvocation("foo", [["x", "y"], ["z"]])]},
+        "b": {"setup": [RecipeInvocation("foo", [["1", "2"]])], "is_setup": [ShellCommand("false")]},
+    }
+    assert recipes["foo"].parameters == ["a", "b"]
+    assert recipes["foo"].defs == {
+        "setup": [ShellCommand("echo $((a))"), RecipeInvocation("bar", [["x", "y"]])],
+        "is_setup": [RecipeInvocation("bar", [["1", "2"]])],
+    }
+
+
+def test_unindented_lines_in_def_bodies():
+    config = """
+a:
+    setup:
+        cat > ~/a <<EOF
+key: value
+EOF
+        echo done
+    is_setup: test -f ~/a
+b: apt(git)
+b -> a
+"""
+    executables = get_executable_index(parse(config))
+
+    assert executables == {
+        "a": {
+            "setup": [ShellCommand("cat > ~/a <<EOF\nkey: value\nEOF\necho done")],
+            "is_setup": [ShellCommand("test -f ~/a")],
+        },
+        "b": {"recipe": [RecipeInvocation("apt", [["git"]])]},
+    }
+
+
+def test_bundled_parser_is_only_loaded_when_current(tmp_path: Path):
+    path = str(tmp_path / "grammar.lark.cache")
+    assert load_parser(path) is None
+
+    save_parser(path)
+    parser = load_parser(path)
+    assert parser is not None
+    assert parser.parse("a: apt(git)\n") == parse("a: apt(git)\n")
+
+    data = (tmp_path / "grammar.lark.cache").read_bytes()
+    (tmp_path / "grammar.lark.cache").write_bytes(b"stale" + data)
+    assert load_parser(path) is None
@@ -0,0 +1,41 @@
+from booty.ast_util import index_config
+from booty.parser import parse
+from booty.plan import make_plan
+from booty.types import CommandTemplate
+
+config = """
+recipe greet(name greeting):
+    setup: echo $(( greeting )), $((name)) && echo $(( $((name)) ))
+    is_setup: test -f ~/$((name)) || echo $(( 1 + 2 ))
+
+recipe greet_twice(name):
+    setup:
+        greet(twice, hi)
+        echo again $((name))
+    is_setup: greet(twice, hi)
+
+a: greet(alice, hello there)
+
+b:
+    setup:
+        echo first
+        greet_twice(bob)
+    is_setup: greet_twice(bob)
+"""
+
+
+def test_plan_expands_recipes():
+    index = index_config(parse(config))
+    plan = make_plan(index.executables, index.recipes)
+
+    assert plan["a"].setup == ["echo hello there, alice && echo $(( alice ))"]
+    assert plan["a"].is_setup == ["test -f ~/alice || echo $(( 1 + 2 ))"]
+    assert plan["b"].setup == ["echo first", "echo hi, twice && echo $(( twice ))", "echo again bob"]
+    assert plan["b"].commands("is_setup") == ["test -f ~/twice || echo $(( 1 + 2 ))"]
+
+
+def test_template_fills_in_values_literally():
+    template = CommandTemplate.compile("sed 's/$((a))/$(( b ))/' $((c))", ["a", "b"])
+
+    assert template.references == [0, 1]
+    assert template.render(["\\1", "x"]) == "sed 's/\\1/x/' $((c))"
@@ -0,0 +1,139 @@
+import time
+from typing import List, Optional
+
+from booty.ast_util import index_config
+from booty.execute import CommandExecutor, CommandPool
+from booty.graph import DependencyGraph, TargetScheduler
+from booty.parser import parse
+from booty.resources import ResourcePool
+from booty.types import BootyData, DependencyIndex
+
+
+def run_all(scheduler: TargetScheduler, failures: Optional[List[str]] = None) -> List[List[str]]:
+    """
+    Run the scheduler to completion, one wave of ready targets at a time.
+    """
+    waves: List[List[str]] = []
+    while True:
+        wave: List[str] = []
+        target = scheduler.next_ready()
+        while target is not None:
+            wave.append(target)
+            target = scheduler.next_ready()
+
+        if not wave:
+            return waves
+
+        waves.append(sorted(wave))
+        for target in wave:
+            scheduler.complete(target, target not in (failures or []))
+
+
+def test_independent_targets_are_ready_together():
+    index: DependencyIndex = {"essentials": [], "nvim": ["essentials"], "packer": ["essentials"], "unit.nvim": ["essentials"]}
+    scheduler = DependencyGraph.from_index(index).scheduler()
+
+    assert run_all(scheduler) == [["essentials"], ["nvim", "packer", "unit.nvim"]]
+    assert scheduler.skipped() == []
+
+
+def test_target_waits_for_all_dependencies():
+    index: DependencyIndex = {"a": [], "b": [], "c": ["a"], "d": ["b", "c"]}
+    scheduler = DependencyGraph.from_index(index).scheduler()
+
+    assert run_all(scheduler) == [["a", "b"], ["c"], ["d"]]
+
+
+def test_failure_skips_everything_downstream():
+    index: DependencyIndex = {"a": [], "b": [], "c": ["a"], "d": ["b", "c"], "e": ["b"], "f": ["d"]}
+    scheduler = DependencyGraph.from_index(index).scheduler()
+
+    assert run_all(scheduler, failures=["a"]) == [["a", "b"], ["e"]]
+    assert scheduler.skipped() == ["c", "d", "f"]
+
+
+def test_duplicate_dependencies_count_once():
+    index: DependencyIndex = {"a": [], "b": ["a", "a"]}
+    scheduler = DependencyGraph.from_index(index).scheduler()
+
+    assert run_all(scheduler) == [["a"], ["b"]]
+
+
+def test_command_pool_runs_targets_concurrently():
+    config = """
+a:
+    setup: sleep 0.5
+    is_setup: true
+
+b:
+    setup: sleep 0.5
+    is_setup: true
+
+c:
+    setup: exit 3
+    is_setup: true
+"""
+    index = index_config(parse(config))
+    G = DependencyGraph.from_index(index.dependencies)
+    data = BootyData(execution_index=index.executables, dependency_index=index.dependencies, recipe_index=index.recipes, G=G)
+
+    start = time.perf_counter()
+    codes = {}
+    with CommandPool(max_workers=3) as pool:
+        for target in ["a", "b", "c"]:
+            pool.submit(CommandExecutor(data, target, "setup"))
+
+        while pool.running > 0:
+            event = pool.next_event(timeout=0.1)
+            if event is not None and event.done:
+                codes[event.cmd.target] = event.cmd.code
+
+    assert codes == {"a": 0, "b": 0, "c": 3}
+    assert time.perf_counter() - start < 0.9
+
+
+def test_critical_path_starts_first():
+    # "slow" is on the longest chain even though "fast" became ready first.
+    index: DependencyIndex = {"fast": [], "slow": [], "after_slow": ["slow"], "after_fast": ["fast"]}
+    graph = DependencyGraph.from_index(index)
+    durations = {"fast": 1.0, "slow": 5.0, "after_slow": 10.0, "after_fast": 1.0}
+
+    assert graph.remaining_path_lengths(durations) == {"fast": 2.0, "slow": 15.0, "after_slow": 10.0, "after_fast": 1.0}
+
+    scheduler = graph.scheduler(durations)
+    assert scheduler.next_ready() == "slow"
+    assert scheduler.next_ready() == "fast"
+    scheduler.complete("fast", True)
+    scheduler.complete("slow", True)
+    assert scheduler.next_ready() == "after_slow"
+    assert scheduler.next_ready() == "after_fast"
+
+
+def test_unknown_durations_use_the_average():
+    index: DependencyIndex = {"a": [], "b": ["a"], "c": []}
+    lengths = DependencyGraph.from_index(index).remaining_path_lengths({"c": 4.0})
+
+    assert lengths == {"a": 8.0, "b": 4.0, "c": 4.0}
+
+
+def test_critical_path_scheduler_keeps_skip_semantics():
+    index: DependencyIndex = {"a": [], "b": [], "c": ["a"], "d": ["b", "c"], "e": ["b"], "f": ["d"]}
+    scheduler = DependencyGraph.from_index(index).scheduler({"e": 100.0})
+
+    assert run_all(scheduler, failures=["a"]) == [["a", "b"], ["e"]]
+    assert scheduler.skipped() == ["c", "d", "f"]
+
+
+def test_resource_pool_holds_all_or_nothing():
+    resources = ResourcePool({"network": 2})
+
+    assert resources.acquire(["dpkg", "network"])
+    assert resources.acquire(["network"])
+    # network is full, so dpkg isn't taken either
+    assert not resources.acquire(["network", "other"])
+    assert resources.acquire(["other"])
+    assert not resources.acquire(["dpkg"])
+
+    resources.release(["dpkg", "network"])
+    assert resources.acquire(["dpkg"])
+    assert resources.acquire(["network"])
@@ -0,0 +1,109 @@
+import os
+import subprocess
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from booty.app import App
+from booty.cli import cli
+from booty.script import compile_script
+from booty.target_logger import TargetLogger
+
+config = """
+recipe marker(name):
+    setup: echo $((name)) >> {dir}/order
+    is_setup: test -e {dir}/$((name))
+    resources: lock
+
+first: marker(first)
+second: marker(second)
+
+installed:
+    setup: exit 1
+    is_setup: true
+
+bad:
+    setup: exit 3
+    is_setup: false
+
+after_bad:
+    setup: touch {dir}/after_bad
+    is_setup: false
+
+last:
+    setup:
+        cd /
+        echo "quoted 'last'" >> {dir}/order
+    is_setup: false
+
+last -> first second installed
+after_bad -> bad
+"""
+
+
+def test_compiled_script_runs_the_targets(tmp_path: Path):
+    path = tmp_path / "install.booty"
+    path.write_text(config.format(dir=tmp_path))
+    app = App(str(path), TargetLogger(str(tmp_path / "logs")), use_cache=False)
+
+    script = tmp_path / "install.sh"
+    script.write_text(compile_script(app.data))
+    result = subprocess.run(
+        ["bash", str(script)], capture_output=True, text=True, env={**os.environ, "BOOTY_LOG_DIR": str(tmp_path / "logs")}
+    )
+
+    assert result.returncode == 1
+    assert "🟢 installed is installed" in result.stdout
+    assert "🔴 bad failed" in result.stdout
+    assert "🟡 after_bad skipped because bad failed" in result.stdout
+    assert not (tmp_path / "after_bad").exists()
+    # first and second share a lock so they ran one after another, and last waited for both of them.
+    assert (tmp_path / "order").read_text() == "first\nsecond\nquoted 'last'\n"
+
+
+def test_targets_sharing_an_exclusive_resource_share_a_lane(tmp_path: Path):
+    path = tmp_path / "install.booty"
+    path.write_text(config.format(dir=tmp_path))
+    app = App(str(path), TargetLogger(str(tmp_path / "logs")), use_cache=False)
+
+    script = compile_script(app.data)
+
+    assert "{ __booty_target first __booty_0_is_setup __booty_0_setup; __booty_target second" in script
+
+
+def test_compile_command(tmp_path: Path):
+    path = tmp_path / "install.booty"
+    path.write_text(config.format(dir=tmp_path))
+
+    result = CliRunner().invoke(cli, ["-c", str(path), "compile", "-o", str(tmp_path / "install.sh"), "--no-cache"])
+
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "install.sh").read_text().startswith("#!/usr/bin/env bash")
+
+
+def test_timeouts_cover_the_whole_method(tmp_path: Path):
+    path = tmp_path / "install.booty"
+    # The invocation splits the setup into separate commands, each of which is done well within the timeout.
+    path.write_text(f"""
+recipe nap():
+    setup: sleep 0.6
+    is_setup: true
+
+slow:
+    setup:
+        sleep 0.6
+        nap()
+        touch {tmp_path}/done
+    is_setup: false
+    setup_timeout: 1
+""")
+    app = App(str(path), TargetLogger(str(tmp_path / "logs")), use_cache=False)
+
+    script = tmp_path / "install.sh"
+    script.write_text(compile_script(app.data))
+    result = subprocess.run(
+        ["bash", str(script)], capture_output=True, text=True, env={**os.environ, "BOOTY_LOG_DIR": str(tmp_path / "logs")}
+    )
+
+    assert "🔴 slow failed" in result.stdout
+    assert not (tmp_path / "done").exists()
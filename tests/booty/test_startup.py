@@ -0,0 +1,43 @@
+import subprocess
+import sys
+from typing import Dict
+
+# Cold import budget for everything that a cached `booty --status` run loads. This is a few times what it takes on a
+# laptop so that slow CI hosts don't flake, but pulling rich or lark back into the startup path blows well past it.
+STARTUP_BUDGET_MS = 150
+
+HEAVY_MODULES = ["rich", "lark", "pprint"]
+
+
+def _import_times(statement: str) -> Dict[str, int]:
+    """
+    Run the import statement in a fresh interpreter with -X importtime and return the cumulative import time in
+    microseconds of every module that it imported.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, check=True)
+
+    times: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, module = line[len("import time:") :].split("|")
+        times[module.strip()] = int(cumulative)
+
+    return times
+
+
+def test_startup_skips_heavy_modules():
+    times = _import_times("import booty.cli, booty.app")
+
+    assert "booty.cli" in times
+    for module in times:
+        assert module.split(".")[0] not in HEAVY_MODULES, f"{module} is imported on startup"
+
+
+def test_startup_budget():
+    # Top level imports are the only ones that aren't nested in another module's cumulative time
+    times = _import_times("import booty.cli, booty.app")
+    total_ms = (times["booty.cli"] + times["booty.app"]) / 1000
+
+    assert total_ms < STARTUP_BUDGET_MS, f"Importing booty took {total_ms:.1f}ms, budget is {STARTUP_BUDGET_MS}ms"
@@ -0,0 +1,29 @@
+import pickle
+from pathlib import Path
+
+import pytest
+
+from booty import stdlib
+from booty.lang import get_stdlib
+
+
+def test_compiled_index_matches_parsed(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    path = str(tmp_path / "stdlib.index")
+    monkeypatch.setattr(stdlib, "get_stdlib_index_path", lambda: path)
+    stdlib.compile_stdlib(path)
+
+    monkeypatch.setattr(stdlib, "parse_stdlib_recipe_index", lambda _: pytest.fail("Shouldn't parse with a fresh index"))
+    recipes = stdlib.get_stdlib_recipe_index()
+
+    assert "apt" in recipes
+    with open(path, "rb") as f:
+        assert recipes == pickle.load(f)["recipes"]
+
+
+def test_stale_index_falls_back_to_parsing(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    path = str(tmp_path / "stdlib.index")
+    monkeypatch.setattr(stdlib, "get_stdlib_index_path", lambda: path)
+    with open(path, "wb") as f:
+        pickle.dump({"key": "stale", "recipes": {}}, f)
+
+    assert stdlib.get_stdlib_recipe_index() == stdlib.parse_stdlib_recipe_index(get_stdlib())
@@ -0,0 +1,67 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from booty.app import App
+from booty.target_logger import TargetLogger, read_index, read_log
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_interleaved_output_is_read_back_per_target(tmp_path: Path, compress: bool, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr("booty.target_logger.CHUNK_SIZE", 64)
+    logger = TargetLogger(str(tmp_path), compress=compress, current_ms_time=1)
+    for i in range(50):
+        logger.write("a", "setup", f"a {i}", None)
+        logger.write("b", "setup", f"b {i}", f"b err {i}" if i % 10 == 0 else None)
+    logger.finish("a", "setup", 0)
+    logger.finish("b", "setup", 3)
+    logger.close()
+
+    run_dir = str(tmp_path / "1")
+    assert list(read_log(run_dir, "a")) == [f"a {i}" for i in range(50)]
+    assert list(read_log(run_dir, "b")) == [f"b {i}" for i in range(50)]
+    assert list(read_log(run_dir, "b", "setup", "stderr")) == ["b err 0", "b err 10", "b err 20", "b err 30", "b err 40"]
+    assert list(read_log(run_dir, "a", "is_setup")) == []
+
+    codes = {it["target"]: it["code"] for it in read_index(run_dir) if "code" in it}
+    assert codes == {"a": 0, "b": 3}
+
+    # The output was written in many chunks along the way, not all at the end.
+    assert len([it for it in read_index(run_dir) if it.get("target") == "a"]) > 2
+
+
+def test_archive_is_one_gzip_file(tmp_path: Path):
+    logger = TargetLogger(str(tmp_path), current_ms_time=1)
+    logger.log_setup("a", ["one", "two"], ["oops"], 1)
+    logger.close()
+
+    text = gzip.decompress((tmp_path / "1" / "output.log.gz").read_bytes()).decode()
+    assert text == "=== a setup stdout ===\none\ntwo\n=== a setup stderr ===\noops\n"
+
+
+def test_app_logs_every_target(tmp_path: Path):
+    config = tmp_path / "install.booty"
+    config.write_text("ok:\n    setup: true\n    is_setup: echo fine\n\nbad:\n    setup: true\n    is_setup: echo nope >&2; exit 2\n")
+    logger = TargetLogger(str(tmp_path / "logs"))
+    app = App(str(config), logger, use_cache=False)
+
+    app.status()
+    logger.flush()
+
+    assert list(read_log(logger.run_dir, "ok", "is_setup")) == ["fine"]
+    assert list(read_log(logger.run_dir, "bad", "is_setup", "stderr")) == ["nope"]
+
+
+def test_unwritable_log_dir_doesnt_block(tmp_path: Path, capsys: pytest.CaptureFixture[str]):
+    (tmp_path / "file").write_text("")
+    logger = TargetLogger(str(tmp_path / "file" / "logs"), current_ms_time=1)
+
+    logger.log_setup("a", ["one"], [], 0)
+    logger.flush()
+    logger.log_setup("b", ["two"], [], 0)
+    logger.flush()
+    logger.close()
+
+    assert isinstance(logger.error, OSError)
+    assert capsys.readouterr().err.count("Stopped logging") == 1
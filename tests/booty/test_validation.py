@@ -0,0 +1,76 @@
+from pathlib import Path
+
+import pytest
+
+from booty.app import App
+from booty.options import parse_duration
+from booty.target_logger import TargetLogger
+
+
+def test_validate_reports_every_cycle(tmp_path: Path):
+    config = tmp_path / "install.booty"
+    config.write_text(
+        "".join(f"{name}:\n    setup: true\n    is_setup: true\n\n" for name in ["a", "b", "c", "d", "e"])
+        + "a -> b\nb -> a\nc -> d\nd -> e\ne -> c\n",
+    )
+
+    with pytest.raises(Exception) as e:
+        App(str(config), TargetLogger(str(tmp_path / "logs")), use_cache=False)
+
+    assert str(e.value).splitlines() == [
+        "Cycles detected in dependency graph, cannot continue.",
+        "  b -> a -> b",
+        "  d -> e -> c -> d",
+    ]
+
+
+def test_validate_rejects_invalid_durations(tmp_path: Path):
+    config = tmp_path / "install.booty"
+    config.write_text("a:\n    setup: true\n    is_setup: true\n    status_ttl: soon\n")
+
+    with pytest.raises(Exception) as e:
+        App(str(config), TargetLogger(str(tmp_path / "logs")), use_cache=False)
+
+    assert str(e.value) == "Target 'a' has an invalid status_ttl. Invalid duration 'soon', expected a number followed by s, m, h, or d."
+
+
+@pytest.mark.parametrize("value,seconds", [("30", 30.0), ("30s", 30.0), ("1.5m", 90.0), ("2h", 7200.0), ("1d", 86400.0)])
+def test_parse_duration(value: str, seconds: float):
+    assert parse_duration(value) == seconds
+
+
+@pytest.mark.parametrize("config", ["include: apt(foo)\n", "include:\n    setup: true\n    is_setup: true\n"])
+def test_validate_rejects_targets_named_include(tmp_path: Path, config: str):
+    (tmp_path / "install.booty").write_text(config)
+
+    with pytest.raises(Exception) as e:
+        App(str(tmp_path / "install.booty"), TargetLogger(str(tmp_path / "logs")), use_cache=False)
+
+    assert str(e.value) == "'include' is reserved for including other config files, it can't be the name of a target."
+
+
+@pytest.mark.parametrize(
+    "config,error",
+    [
+        ("a:\n    setup: missing(x)\n    is_setup: true\n", "Recipe 'missing' invoked by target 'a' does not exist."),
+        (
+            "recipe outer(x):\n    setup: missing(x)\n    is_setup: true\n\na: outer(x)\n",
+            "Recipe 'missing' invoked by recipe 'outer' does not exist.",
+        ),
+        (
+            "recipe only_setup():\n    setup: true\n\na:\n    setup: true\n    is_setup: only_setup()\n",
+            "Recipe 'only_setup' invoked by target 'a' has no is_setup method.",
+        ),
+        (
+            "recipe loop(x):\n    setup: loop(x)\n    is_setup: true\n\na: loop(x)\n",
+            "Recipe 'loop' invokes itself: loop -> loop.",
+        ),
+    ],
+)
+def test_validate_rejects_bad_nested_invocations(tmp_path: Path, config: str, error: str):
+    (tmp_path / "install.booty").write_text(config)
+
+    with pytest.raises(Exception) as e:
+        App(str(tmp_path / "install.booty"), TargetLogger(str(tmp_path / "logs")), use_cache=False)
+
+    assert str(e.value) == error